@@ -0,0 +1,426 @@
+"""Measures how fast the input pipelines feed batches, without a model.
+
+The pipelines read synthetic TFRecords written to a temporary directory
+unless `--data-dir` points at existing ones. Every combination of
+`--num-readers`, `--prefetch` and `--bucket-by-shape` is timed end to end,
+and the pipeline is also cut after each of its stages, so that the time
+every stage adds to an example shows where the input time goes; small
+negative times are noise. The padded pixels are counted on the batches
+the samples would make with and without bucketing by shape.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from psenet import config
+
+STAGES = ["read", "parse", "preprocess", "filter", "batch"]
+
+
+def synthetic_sample(rng, side, texts_num):
+    """Draws a noisy image with `texts_num` random rectangular text boxes.
+
+    The box corners are normalized by the image sides, clockwise from the
+    top left, and roughly a tenth of the texts are ignored ones.
+    """
+    height = rng.randint(side // 2, side + 1)
+    width = rng.randint(side // 2, side + 1)
+    image = rng.randint(0, 64, [height, width, 3]).astype("uint8")
+    bboxes = []
+    texts = []
+    for _ in range(texts_num):
+        left, right = np.sort(rng.uniform(0, 1, 2))
+        top, bottom = np.sort(rng.uniform(0, 1, 2))
+        bottom = min(1.0, top + max(bottom - top, 0.02) / 4)
+        image[
+            int(top * height) : int(bottom * height),
+            int(left * width) : int(right * width),
+        ] |= 128
+        bboxes.append([left, top, right, top, right, bottom, left, bottom])
+        texts.append("###" if rng.uniform() < 0.1 else "text")
+    return image, texts, np.asarray(bboxes).reshape([-1, config.BBOX_SIZE])
+
+
+def write_synthetic_records(FLAGS, target_dir):
+    """Writes `FLAGS.records_num` examples of `FLAGS.dataset` in shards."""
+    import cv2
+    import tensorflow as tf
+
+    from psenet.utils import build_processed_data
+    from psenet.utils.build_raw_data import build_raw_example
+
+    rng = np.random.RandomState(FLAGS.seed)
+    writers = [
+        tf.io.TFRecordWriter(
+            os.path.join(
+                target_dir,
+                "shard-{:05}-of-{:05}.tfrecord".format(
+                    shard_id + 1, FLAGS.shards_num
+                ),
+            )
+        )
+        for shard_id in range(FLAGS.shards_num)
+    ]
+    for index in range(FLAGS.records_num):
+        image, texts, bboxes = synthetic_sample(
+            rng, FLAGS.side, FLAGS.texts_num
+        )
+        if FLAGS.dataset == config.RAW_DATA_LABEL:
+            example = build_raw_example(
+                cv2.imencode(".jpg", image)[1].tobytes(),
+                texts,
+                "synthetic-{:05}.jpg".format(index),
+                image.shape[0],
+                image.shape[1],
+                list(bboxes.flatten()),
+            )
+        elif FLAGS.dataset == config.PROCESSED_DATA_LABEL:
+            example = build_processed_data.build_v1_example(
+                *build_processed_data.build_processed_example(
+                    image,
+                    texts,
+                    bboxes,
+                    kernel_num=FLAGS.kernel_num,
+                    min_scale=FLAGS.min_scale,
+                    backbone_name=FLAGS.backbone_name,
+                    resize_length=FLAGS.resize_length,
+                )
+            )
+        else:
+            example = build_processed_data.encode_processed_example(
+                *build_processed_data.build_processed_arrays(
+                    image,
+                    texts,
+                    bboxes,
+                    kernel_num=FLAGS.kernel_num,
+                    min_scale=FLAGS.min_scale,
+                    resize_length=FLAGS.resize_length,
+                )
+            )
+        writers[index % FLAGS.shards_num].write(example.SerializeToString())
+    for writer in writers:
+        writer.close()
+
+
+def build_reader(FLAGS, num_readers, prefetch, bucket_by_shape=False):
+    """Configures the dataset of `FLAGS.dataset` like its `input_fn` does."""
+    from psenet.data.processed import ProcessedDataset
+    from psenet.data.raw import RawDataset
+
+    params = argparse.Namespace(**vars(FLAGS))
+    params.bucket_by_shape = bucket_by_shape
+    params.dataset_dir = FLAGS.data_dir
+    params.input_context = None
+    params.num_readers = num_readers
+    params.prefetch = prefetch
+    params.should_augment = FLAGS.augment
+    params.should_repeat = True
+    params.should_shuffle = True
+    if FLAGS.dataset == config.RAW_DATA_LABEL:
+        return RawDataset(params)
+    if FLAGS.dataset == config.PROCESSED_DATA_LABEL:
+        return ProcessedDataset(params, version=1)
+    return ProcessedDataset(params, version=2)
+
+
+def build_stages(reader, dataset_label):
+    """Returns `reader.build` cut after each of its stages, in order.
+
+    Every cut yields single examples except the last one, which is the full
+    pipeline and yields padded batches.
+    """
+    import tensorflow as tf
+
+    from psenet.data import preprocess
+
+    num_readers = reader.num_readers
+    records = (
+        reader._get_all_tfrecords()
+        .repeat(None)
+        .interleave(
+            tf.data.TFRecordDataset,
+            cycle_length=num_readers,
+            num_parallel_calls=num_readers,
+        )
+    )
+    parsed = (
+        records.batch(reader.batch_size)
+        .map(reader._parse_batch, num_parallel_calls=num_readers)
+        .flat_map(tf.data.Dataset.from_tensor_slices)
+    )
+    if dataset_label == config.RAW_DATA_LABEL:
+        parsed = parsed.map(
+            reader._decode_example, num_parallel_calls=num_readers
+        )
+        preprocessed = parsed.map(
+            reader._preprocess_example, num_parallel_calls=num_readers
+        )
+        filtered = preprocessed.filter(
+            lambda inputs, labels: preprocess.check_image_validity(inputs)
+        )
+    else:
+        if reader.version == 2:
+            decode_example = reader._decode_example_v2
+        else:
+            decode_example = reader._decode_example
+        preprocessed = parsed.map(
+            decode_example, num_parallel_calls=num_readers
+        )
+        filtered = preprocessed
+    return [records, parsed, preprocessed, filtered, reader.build()]
+
+
+def seconds_per_element(dataset, elements_num):
+    """Times `elements_num` elements after the first one warms up."""
+    iterator = iter(dataset)
+    next(iterator)
+    start = time.perf_counter()
+    for _ in range(elements_num):
+        next(iterator)
+    return (time.perf_counter() - start) / elements_num
+
+
+def padded_pixels(samples, batch_size, batches_num, bucket):
+    """Counts the pixels of `batches_num` batches and the padded ones."""
+    from psenet.data import batching
+
+    batches = batching.batch(
+        samples.map(batching.image_shape),
+        batch_size,
+        padded_shapes=[2],
+        get_shape=lambda shape: shape,
+        bucket=bucket,
+    )
+    pixels = 0
+    padded = 0
+    for shapes in batches.take(batches_num).as_numpy_iterator():
+        batch_pixels = len(shapes) * np.prod(np.max(shapes, axis=0))
+        pixels += int(batch_pixels)
+        padded += int(batch_pixels - np.sum(np.prod(shapes, axis=1)))
+    return pixels, padded
+
+
+def run(FLAGS):
+    import tensorflow as tf
+
+    shards = sorted(
+        tf.io.gfile.glob(os.path.join(FLAGS.data_dir, "*.tfrecord"))
+    )
+    # The size of a record is estimated on the first shard.
+    records_num = sum(1 for _ in tf.data.TFRecordDataset(shards[0]))
+    record_bytes = os.path.getsize(shards[0]) / max(records_num, 1)
+
+    results = []
+    for num_readers in FLAGS.num_readers:
+        cuts_seconds = None
+        for prefetch in FLAGS.prefetch:
+            for bucket_by_shape in FLAGS.bucket_by_shape:
+                reader = build_reader(
+                    FLAGS, num_readers, prefetch, bucket_by_shape
+                )
+                stages = build_stages(reader, FLAGS.dataset)
+                if cuts_seconds is None:
+                    # The cuts before batching do not depend on `prefetch`
+                    # or on the bucketing.
+                    cuts_seconds = [
+                        seconds_per_element(
+                            stage, FLAGS.batches * FLAGS.batch_size
+                        )
+                        for stage in stages[:-1]
+                    ]
+                batch_seconds = seconds_per_element(stages[-1], FLAGS.batches)
+                cumulative = cuts_seconds + [batch_seconds / FLAGS.batch_size]
+                stage_latencies = {
+                    name: (seconds - previous) * 1000
+                    for name, seconds, previous in zip(
+                        STAGES, cumulative, [0] + cumulative[:-1]
+                    )
+                }
+                pixels, padded = padded_pixels(
+                    stages[-2],
+                    FLAGS.batch_size,
+                    FLAGS.batches,
+                    bucket_by_shape,
+                )
+                examples_per_second = FLAGS.batch_size / batch_seconds
+                results.append(
+                    {
+                        "num_readers": num_readers,
+                        "prefetch": prefetch,
+                        "bucket_by_shape": bucket_by_shape,
+                        "examples_per_second": examples_per_second,
+                        "bytes_per_second": examples_per_second * record_bytes,
+                        "stage_latency_ms": stage_latencies,
+                        "batched_pixels": pixels,
+                        "padded_pixels": padded,
+                    }
+                )
+                print(
+                    "readers: {:2} prefetch: {:2} bucket: {:d}"
+                    " {:8.2f} examples/s {:8.2f} MB/s"
+                    " padding: {:5.1%} | {}".format(
+                        num_readers,
+                        prefetch,
+                        bucket_by_shape,
+                        examples_per_second,
+                        examples_per_second * record_bytes / 2**20,
+                        padded / max(pixels, 1),
+                        " ".join(
+                            "{}: {:.2f} ms".format(name, latency)
+                            for name, latency in stage_latencies.items()
+                        ),
+                    )
+                )
+
+    return {
+        "dataset": FLAGS.dataset,
+        "batch_size": FLAGS.batch_size,
+        "batches": FLAGS.batches,
+        "record_bytes": record_bytes,
+        "resize_length": FLAGS.resize_length,
+        "augment": FLAGS.augment,
+        "synthetic": FLAGS.synthetic,
+        "tensorflow": tf.__version__,
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--dataset",
+        help="The pipeline to measure",
+        default=config.PROCESSED_V2_DATA_LABEL,
+        choices=[
+            config.RAW_DATA_LABEL,
+            config.PROCESSED_DATA_LABEL,
+            config.PROCESSED_V2_DATA_LABEL,
+        ],
+        type=str,
+    )
+    PARSER.add_argument(
+        "--data-dir",
+        help="The directory with the TFRecords; synthetic ones if unset",
+        default=None,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--records-num",
+        help="The number of synthetic records",
+        default=64,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--shards-num",
+        help="The number of synthetic shards",
+        default=4,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--side",
+        help="The largest side of the synthetic images",
+        default=640,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--texts-num",
+        help="The number of text boxes per synthetic image",
+        default=16,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--seed", help="The seed of the synthetic data", default=0, type=int
+    )
+    PARSER.add_argument(
+        "--batch-size",
+        help="The number of examples per batch",
+        default=4,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--batches",
+        help="The number of timed batches per configuration",
+        default=20,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--num-readers",
+        help="The numbers of parallel readers to sweep",
+        default=[1, 2, 4],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--prefetch",
+        help="The numbers of prefetched batches to sweep",
+        default=[1, 2],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--bucket-by-shape",
+        help="Whether to batch only images of the same sides, to sweep",
+        default=[False, True],
+        nargs="+",
+        type=config.str2bool,
+    )
+    PARSER.add_argument(
+        "--backbone-name",
+        help="The name of the FPN backbone",
+        default=config.BACKBONE_NAME,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of output kernels from FPN",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-scale",
+        help="The minimum kernel scale",
+        default=config.MIN_SCALE,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--resize-length",
+        help="The maximum side of the images",
+        default=config.RESIZE_LENGTH,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--augment",
+        help="Whether to augment the raw data",
+        default=False,
+        type=config.str2bool,
+    )
+    PARSER.add_argument(
+        "--output",
+        help="The JSON file to write the results to",
+        default=None,
+        type=str,
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        FLAGS.synthetic = FLAGS.data_dir is None
+        if FLAGS.synthetic:
+            FLAGS.data_dir = synthetic_dir
+            write_synthetic_records(FLAGS, synthetic_dir)
+        report = run(FLAGS)
+
+    if FLAGS.output:
+        with open(FLAGS.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Sweeps the kernel expansion over image sizes and kernel densities.
+
+Every run is checked against and timed with the expansion of the original
+OpenCV adaptor, ported to Python as the baseline. The port runs the same
+steps as the C++ one, but slower, so its ratio overstates the speedup.
+"""
+
+import argparse
+import collections
+
+import numpy as np
+
+from psenet import config
+from psenet.bench.pse import measure
+from psenet.bench.pse import synthetic_kernels
+
+
+def baseline_pse(kernels, min_area):
+    """The expansion of the original OpenCV adaptor, step by step.
+
+    The seeds are the 4-connected components of the smallest, last kernel
+    with `cv2.connectedComponents`, and they grow breadth first into every
+    larger kernel in turn, the first to reach a pixel taking it. Returns the
+    `(H, W)` int32 labels.
+    """
+    import cv2
+
+    kernels = np.asarray(kernels, dtype="uint8")
+    label_num, components = cv2.connectedComponents(
+        kernels[-1], connectivity=4
+    )
+    areas = np.bincount(components.ravel(), minlength=label_num)
+    height, width = components.shape
+    labels = np.zeros([height, width], dtype="int32")
+    queue = collections.deque()
+    for x, y in zip(*np.nonzero(components)):
+        label = components[x, y]
+        if areas[label] < min_area:
+            continue
+        queue.append((x, y))
+        labels[x, y] = label
+
+    for kernel in kernels[-2::-1]:
+        next_queue = collections.deque()
+        while queue:
+            x, y = queue.popleft()
+            is_edge = True
+            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                next_x = x + dx
+                next_y = y + dy
+                if not (0 <= next_x < height and 0 <= next_y < width):
+                    continue
+                if kernel[next_x, next_y] == 0 or labels[next_x, next_y] > 0:
+                    continue
+                queue.append((next_x, next_y))
+                labels[next_x, next_y] = labels[x, y]
+                is_edge = False
+            if is_edge:
+                next_queue.append((x, y))
+        queue = next_queue
+    return labels
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--sides",
+        help="The sides of the synthetic maps",
+        default=[256, 512, 1024, 2048],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--texts-nums",
+        help="The numbers of synthetic text instances per map",
+        default=[4, 32, 256],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of kernels in the synthetic stacks",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-area",
+        help="The minimum area of the seed kernels",
+        default=10,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=10, type=int
+    )
+    PARSER.add_argument(
+        "--baseline-repeats",
+        help="The number of timed runs of the baseline",
+        default=1,
+        type=int,
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    from psenet.pse import pse_uint8
+
+    print(
+        "{:>6} {:>6} {:>8} {:>10} {:>10} {:>12} {:>8}".format(
+            "side", "texts", "density", "ms", "Mpx/s", "baseline ms", "x"
+        )
+    )
+    for side in FLAGS.sides:
+        out = np.empty([side, side], dtype="int32")
+        for texts_num in FLAGS.texts_nums:
+            kernels = synthetic_kernels(
+                FLAGS.kernel_num, side, side, texts_num
+            )
+            labels = pse_uint8(kernels, FLAGS.min_area, out=out)
+            assert np.array_equal(
+                labels, baseline_pse(kernels, FLAGS.min_area)
+            )
+            seconds = measure(
+                lambda: pse_uint8(kernels, FLAGS.min_area, out=out),
+                FLAGS.repeats,
+            )
+            baseline_seconds = measure(
+                lambda: baseline_pse(kernels, FLAGS.min_area),
+                FLAGS.baseline_repeats,
+            )
+            print(
+                "{:>6} {:>6} {:>7.1f}% {:>10.2f} {:>10.1f} {:>12.2f}"
+                " {:>8.1f}".format(
+                    side,
+                    texts_num,
+                    kernels[0].mean() * 100,
+                    seconds * 1000,
+                    side * side / seconds / 1e6,
+                    baseline_seconds * 1000,
+                    baseline_seconds / seconds,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
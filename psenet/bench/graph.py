@@ -0,0 +1,77 @@
+"""Compares the in-graph progressive scale expansion with the extension."""
+
+import argparse
+
+import numpy as np
+
+from psenet import config
+from psenet.bench.pse import measure
+from psenet.bench.pse import report
+from psenet.bench.pse import synthetic_kernels
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of kernels in the synthetic stack",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--side", help="The side of the synthetic map", default=640, type=int
+    )
+    PARSER.add_argument(
+        "--texts-num",
+        help="The number of synthetic text instances",
+        default=64,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-area",
+        help="The minimum area of the seed kernels",
+        default=config.MIN_KERNEL_AREA,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=5, type=int
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    import tensorflow as tf
+
+    from psenet.pse import graph
+    from psenet.pse import pse_uint8
+
+    kernels = synthetic_kernels(
+        FLAGS.kernel_num, FLAGS.side, FLAGS.side, FLAGS.texts_num
+    )
+    graph_kernels = tf.constant(kernels)
+    graph_pse = tf.function(graph.pse)
+
+    labels = pse_uint8(kernels, FLAGS.min_area)
+    graph_labels = graph_pse(graph_kernels, FLAGS.min_area).numpy()
+    print(
+        "kernels: {}x{}x{}, texts: {}, labels agreeing: {:.2f}%".format(
+            FLAGS.kernel_num,
+            FLAGS.side,
+            FLAGS.side,
+            FLAGS.texts_num,
+            np.mean(labels[labels > 0] == graph_labels[labels > 0]) * 100,
+        )
+    )
+
+    results = {
+        "pse_uint8": measure(
+            lambda: pse_uint8(kernels, FLAGS.min_area), FLAGS.repeats
+        ),
+        "graph/pse": measure(
+            lambda: graph_pse(graph_kernels, FLAGS.min_area).numpy(),
+            FLAGS.repeats,
+        ),
+    }
+    report(results, "pse_uint8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Compares drawing the raw labels in TensorFlow ops and in `py_function`.
+
+Both ways draw the same boxes in a `tf.data` map for every number of
+parallel calls, so that the scaling of each with the cores shows.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from psenet import config
+from psenet.bench.data import synthetic_sample
+from psenet.bench.pse import measure
+
+
+def draw_labels_numpy(bboxes, tags, height, width, kernel_num, min_scale):
+    """Draws the labels with OpenCV and pyclipper, under the GIL."""
+    import cv2
+
+    from psenet.data import preprocess
+
+    tags = tags.decode()
+    text = np.zeros([height, width], dtype="uint8")
+    mask = np.ones([height, width], dtype="uint8")
+    bboxes = np.reshape(bboxes * ([width, height] * 4), [-1, 4, 2])
+    bboxes = bboxes.astype("int32")
+    for bbox, tag in zip(bboxes, tags):
+        cv2.drawContours(text, [bbox], -1, 1, -1)
+        if tag == "0":
+            cv2.drawContours(mask, [bbox], -1, 0, -1)
+    kernels = np.zeros([kernel_num - 1, height, width], dtype="uint8")
+    rates = [
+        1.0 - (1.0 - min_scale) / (kernel_num - 1) * i
+        for i in range(1, kernel_num)
+    ]
+    for kernel, kernel_bboxes in zip(
+        kernels, preprocess.shrink_scales(bboxes, rates)
+    ):
+        for kernel_bbox in kernel_bboxes:
+            cv2.drawContours(kernel, [kernel_bbox.astype("int32")], -1, 1, -1)
+    return kernels, text, mask
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--side",
+        help="The largest side of the synthetic images",
+        default=640,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--texts-num",
+        help="The number of text boxes per synthetic image",
+        default=32,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--samples-num",
+        help="The number of samples per timed run",
+        default=64,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--num-parallel-calls",
+        help="The numbers of parallel calls to sweep",
+        default=[1, 2, 4, 8],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of kernels",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-scale",
+        help="The minimum kernel scale",
+        default=config.MIN_SCALE,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=3, type=int
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    import tensorflow as tf
+
+    from psenet.data.rasterize import draw_labels
+
+    rng = np.random.RandomState(0)
+    samples = [
+        synthetic_sample(rng, FLAGS.side, FLAGS.texts_num)
+        for _ in range(FLAGS.samples_num)
+    ]
+    # Every sample carries its own sides, like after the random scaling.
+    dataset = tf.data.Dataset.from_generator(
+        lambda: (
+            (bboxes, "".join("0" if text == "###" else "1" for text in texts))
+            + image.shape[:2]
+            for image, texts, bboxes in samples
+        ),
+        output_signature=(
+            tf.TensorSpec([None, config.BBOX_SIZE], tf.float64),
+            tf.TensorSpec([], tf.string),
+            tf.TensorSpec([], tf.int32),
+            tf.TensorSpec([], tf.int32),
+        ),
+    ).cache()
+
+    def in_graph(bboxes, tags, height, width):
+        return draw_labels(
+            bboxes, tags, height, width, FLAGS.kernel_num, FLAGS.min_scale
+        )
+
+    def in_python(bboxes, tags, height, width):
+        return tf.py_function(
+            lambda *inputs: draw_labels_numpy(
+                *[tensor.numpy() for tensor in inputs],
+                FLAGS.kernel_num,
+                FLAGS.min_scale,
+            ),
+            [bboxes, tags, height, width],
+            [tf.uint8, tf.uint8, tf.uint8],
+        )
+
+    print("cores: {}".format(os.cpu_count()))
+    for name, draw in [("graph", in_graph), ("py_function", in_python)]:
+        baseline = None
+        for num_parallel_calls in FLAGS.num_parallel_calls:
+            labels = dataset.map(draw, num_parallel_calls=num_parallel_calls)
+            seconds = measure(lambda: [None for _ in labels], FLAGS.repeats)
+            baseline = baseline or seconds
+            print(
+                "{:>12} x{:<2}: {:8.2f} samples/s  x{:.2f}".format(
+                    name,
+                    num_parallel_calls,
+                    FLAGS.samples_num / seconds,
+                    baseline / seconds,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmarks the locality-aware NMS on synthetic quadrangles."""
+
+import argparse
+
+import numpy as np
+
+from psenet import config
+from psenet.bench.pse import measure
+
+
+def synthetic_quads(objects_num, duplicates_num, side=1280, seed=0):
+    """Mimics tiled inference: every object is detected `duplicates_num`
+    times with jittered corners, and detections come sorted row by row.
+    """
+    rng = np.random.RandomState(seed)
+    sizes = rng.uniform([32, 8], [256, 64], size=[objects_num, 2])
+    origins = rng.uniform(0, side - sizes)
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype="float32")
+    quads = origins[:, None, :] + corners[None, :, :] * sizes[:, None, :]
+    quads = np.repeat(quads, duplicates_num, axis=0)
+    quads += rng.normal(scale=2.0, size=quads.shape)
+    scores = rng.uniform(0.5, 1.0, size=[len(quads), 1])
+    quads = np.concatenate([quads.reshape(-1, 8), scores], axis=1)
+    order = np.lexsort((quads[:, 0], np.round(quads[:, 1] / 4)))
+    return np.ascontiguousarray(quads[order], dtype=np.float32)
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--objects-num",
+        help="The numbers of distinct objects to sweep over",
+        default=[100, 1000, 5000],
+        nargs="+",
+        type=int,
+    )
+    PARSER.add_argument(
+        "--duplicates-num",
+        help="The number of overlapping detections per object",
+        default=4,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--iou-threshold",
+        help="The IoU above which quadrangles are merged",
+        default=config.NMS_IOU_THRESHOLD,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=10, type=int
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    from psenet.pse.nms import merge_quadrangle_n9
+
+    for objects_num in FLAGS.objects_num:
+        quads = synthetic_quads(objects_num, FLAGS.duplicates_num)
+        merged = merge_quadrangle_n9(quads, FLAGS.iou_threshold)
+        seconds = measure(
+            lambda: merge_quadrangle_n9(quads, FLAGS.iou_threshold),
+            FLAGS.repeats,
+        )
+        print(
+            "{:>7} quads -> {:>6} merged: {:9.2f} ms  {:12.0f} quads/s".format(
+                len(quads), len(merged), seconds * 1000, len(quads) / seconds
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compares the batched OHEM with the one mapped over the samples.
+
+Both select the pixels of the text loss of synthetic `(B, H, W)` batches,
+alone and in a step that also computes the dice loss and its gradient.
+"""
+
+import argparse
+
+import numpy as np
+
+from psenet.bench.pse import measure
+from psenet.bench.pse import report
+
+
+def ohem_map_fn(labels, predictions, masks):
+    """The OHEM of every sample in turn, with a sort per sample."""
+    import tensorflow as tf
+
+    from psenet.losses import ohem_single
+
+    return tf.map_fn(
+        lambda inputs: ohem_single(*inputs),
+        (labels, predictions, masks),
+        fn_output_signature=tf.float32,
+    )
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--batch-size", help="The samples per batch", default=8, type=int
+    )
+    PARSER.add_argument(
+        "--side", help="The side of the synthetic maps", default=640, type=int
+    )
+    PARSER.add_argument(
+        "--text-ratio",
+        help="The ratio of the text pixels",
+        default=0.05,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=5, type=int
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    import tensorflow as tf
+
+    from psenet.losses import dice_loss
+    from psenet.losses import ohem_batch
+
+    shape = [FLAGS.batch_size, FLAGS.side, FLAGS.side]
+    rng = np.random.RandomState(0)
+    labels = tf.constant(
+        rng.uniform(size=shape) < FLAGS.text_ratio, tf.float32
+    )
+    masks = tf.constant(rng.uniform(size=shape) < 0.99, tf.float32)
+    predictions = tf.Variable(rng.normal(size=shape).astype("float32"))
+
+    results = {}
+    for name, ohem in [("map_fn", ohem_map_fn), ("batched", ohem_batch)]:
+        select = tf.function(ohem)
+
+        @tf.function
+        def step():
+            with tf.GradientTape() as tape:
+                selected_masks = ohem(labels, predictions, masks)
+                loss = dice_loss(labels, predictions, selected_masks)
+            return tape.gradient(loss, predictions)
+
+        results["ohem " + name] = measure(
+            lambda: select(labels, predictions, masks).numpy(), FLAGS.repeats
+        )
+        results["step " + name] = measure(
+            lambda: step().numpy(), FLAGS.repeats
+        )
+    report({name: results[name] for name in sorted(results)}, "ohem map_fn")
+
+
+if __name__ == "__main__":
+    main()
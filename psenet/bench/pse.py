@@ -0,0 +1,214 @@
+"""Benchmarks the progressive scale expansion post-processing."""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from psenet import config
+
+
+def synthetic_kernels(
+    kernel_num=config.KERNEL_NUM,
+    height=1280,
+    width=1280,
+    texts_num=64,
+    min_scale=config.MIN_SCALE,
+    seed=0,
+):
+    """Draws `texts_num` random text rectangles and their shrunk kernels.
+
+    Returns a C-contiguous `(kernel_num, height, width)` uint8 stack with the
+    full text map first and the smallest kernel last, like the FPN output.
+    """
+    rng = np.random.RandomState(seed)
+    kernels = np.zeros([kernel_num, height, width], dtype="uint8")
+    for _ in range(texts_num):
+        text_height = rng.randint(8, max(9, height // 8))
+        text_width = rng.randint(16, max(17, width // 3))
+        top = rng.randint(0, max(1, height - text_height))
+        left = rng.randint(0, max(1, width - text_width))
+        for i in range(kernel_num):
+            rate = 1.0 - (1.0 - min_scale) / max(kernel_num - 1, 1) * i
+            dy = int(text_height * (1.0 - rate) / 2)
+            dx = int(text_width * (1.0 - rate) / 2)
+            kernels[
+                i,
+                top + dy : top + text_height - dy,
+                left + dx : left + text_width - dx,
+            ] = 1
+    return kernels
+
+
+def measure(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def report(results, baseline_name):
+    baseline = results[baseline_name]
+    for name, seconds in results.items():
+        print(
+            "{:>16}: {:8.2f} ms  x{:.2f}".format(
+                name, seconds * 1000, baseline / seconds
+            )
+        )
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of kernels in the synthetic stack",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--side", help="The side of the synthetic map", default=1280, type=int
+    )
+    PARSER.add_argument(
+        "--texts-num",
+        help="The number of synthetic text instances",
+        default=64,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-area",
+        help="The minimum area of the seed kernels",
+        default=10,
+        type=float,
+    )
+    PARSER.add_argument(
+        "--batch-size",
+        help="The number of images for the batched comparison",
+        default=8,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--num-threads",
+        help="The number of threads for pse_batch, all cores if 0",
+        default=0,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--repeats", help="The number of timed runs", default=20, type=int
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    from psenet.pse import extract_instances, pse, pse_batch, pse_uint8
+
+    kernels = synthetic_kernels(
+        FLAGS.kernel_num, FLAGS.side, FLAGS.side, FLAGS.texts_num
+    )
+    assert np.array_equal(
+        pse(kernels, FLAGS.min_area), pse_uint8(kernels, FLAGS.min_area)
+    )
+
+    out = np.empty(kernels.shape[1:], dtype="int32")
+    results = {
+        "pse": measure(lambda: pse(kernels, FLAGS.min_area), FLAGS.repeats),
+        "pse_uint8": measure(
+            lambda: pse_uint8(kernels, FLAGS.min_area), FLAGS.repeats
+        ),
+        "pse_uint8/out": measure(
+            lambda: pse_uint8(kernels, FLAGS.min_area, out=out),
+            FLAGS.repeats,
+        ),
+    }
+    print(
+        "kernels: {}x{}x{}, texts: {}".format(
+            FLAGS.kernel_num, FLAGS.side, FLAGS.side, FLAGS.texts_num
+        )
+    )
+    report(results, "pse")
+
+    # A single kernel stack only labels the seeds, which is the part that
+    # used to go through OpenCV.
+    seeds = np.ascontiguousarray(kernels[-1:])
+    results = {
+        "pse_uint8/seeds": measure(
+            lambda: pse_uint8(seeds, 0, out=out), FLAGS.repeats
+        )
+    }
+    try:
+        import cv2
+    except ImportError:
+        pass
+    else:
+        results["cv2/components"] = measure(
+            lambda: cv2.connectedComponents(seeds[0], connectivity=4),
+            FLAGS.repeats,
+        )
+    report(results, "pse_uint8/seeds")
+
+    batch = np.stack(
+        [
+            synthetic_kernels(
+                FLAGS.kernel_num,
+                FLAGS.side,
+                FLAGS.side,
+                FLAGS.texts_num,
+                seed=seed,
+            )
+            for seed in range(FLAGS.batch_size)
+        ]
+    )
+    assert np.array_equal(
+        pse_batch(batch, FLAGS.min_area, FLAGS.num_threads),
+        np.stack([pse_uint8(kernels, FLAGS.min_area) for kernels in batch]),
+    )
+
+    results = {
+        "pse_uint8/loop": measure(
+            lambda: [pse_uint8(kernels, FLAGS.min_area) for kernels in batch],
+            FLAGS.repeats,
+        ),
+        "pse_batch": measure(
+            lambda: pse_batch(batch, FLAGS.min_area, FLAGS.num_threads),
+            FLAGS.repeats,
+        ),
+    }
+    print(
+        "batch: {}, threads: {}".format(
+            FLAGS.batch_size, FLAGS.num_threads or "all"
+        )
+    )
+    report(results, "pse_uint8/loop")
+
+    labels = pse_uint8(kernels, FLAGS.min_area)
+    scores = kernels[0].astype("float32")
+
+    def extract_with_numpy():
+        instances = []
+        for label in range(1, labels.max() + 1):
+            ys, xs = np.where(labels == label)
+            if len(xs) == 0:
+                continue
+            instances.append(
+                (len(xs), scores[ys, xs].mean(), xs.min(), ys.min())
+            )
+        return instances
+
+    results = {
+        "np.where/loop": measure(extract_with_numpy, FLAGS.repeats),
+        "extract/rect": measure(
+            lambda: extract_instances(labels, scores, 0, 0, "rect"),
+            FLAGS.repeats,
+        ),
+        "extract/contour": measure(
+            lambda: extract_instances(labels, scores, 0, 0, "contour"),
+            FLAGS.repeats,
+        ),
+    }
+    print("instances: {}".format(labels.max()))
+    report(results, "np.where/loop")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Compares the size and read throughput of the processed TFRecord formats."""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from psenet import config
+from psenet.bench.pse import measure
+from psenet.bench.pse import synthetic_kernels
+
+
+def synthetic_arrays(kernel_num, side, texts_num, seed=0):
+    rng = np.random.RandomState(seed)
+    image = rng.randint(0, 256, [side, side, 3]).astype("uint8")
+    mask = np.ones([side, side], dtype="uint8")
+    label = synthetic_kernels(kernel_num, side, side, texts_num, seed=seed)
+    return image, mask, np.ascontiguousarray(label.transpose([1, 2, 0]))
+
+
+def write_shard(filename, example, records_num):
+    import tensorflow as tf
+
+    serialized = example.SerializeToString()
+    with tf.io.TFRecordWriter(filename) as tfrecord_writer:
+        for _ in range(records_num):
+            tfrecord_writer.write(serialized)
+    return os.path.getsize(filename)
+
+
+def parse_single_example(example_proto, version):
+    """Parses one record like the readers did before batching."""
+    import tensorflow as tf
+
+    if version == 2:
+        dense_feature = tf.io.FixedLenFeature((), tf.string)
+    else:
+        dense_feature = tf.io.VarLenFeature(tf.float32)
+    parsed_features = tf.io.parse_single_example(
+        example_proto,
+        {
+            "height": tf.io.FixedLenFeature((), tf.int64, default_value=0),
+            "width": tf.io.FixedLenFeature((), tf.int64, default_value=0),
+            "features/image": dense_feature,
+            "features/mask": dense_feature,
+            "labels": dense_feature,
+        },
+    )
+    return {
+        name: (
+            tf.sparse.to_dense(feature)
+            if isinstance(feature, tf.SparseTensor)
+            else feature
+        )
+        for name, feature in parsed_features.items()
+    }
+
+
+def records_per_second(dataset, records_num):
+    def read():
+        for _ in dataset:
+            pass
+
+    return records_num / measure(read, repeats=1)
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of label channels",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--side",
+        help="The side of the synthetic images",
+        default=640,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--texts-num",
+        help="The number of synthetic text instances",
+        default=64,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--records-num",
+        help="The number of records per shard",
+        default=32,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--batch-size",
+        help="The number of records parsed at once",
+        default=config.BATCH_SIZE,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--backbone-name",
+        help="The name of the FPN backbone",
+        default=config.BACKBONE_NAME,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--num-readers",
+        help="The number of parallel readers",
+        default=config.NUM_READERS,
+        type=int,
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    import tensorflow as tf
+
+    from psenet.backbones.factory import Backbones
+    from psenet.data.processed import ProcessedDataset
+    from psenet.utils import build_processed_data
+
+    image, mask, label = synthetic_arrays(
+        FLAGS.kernel_num, FLAGS.side, FLAGS.texts_num
+    )
+    preprocessed = Backbones.get_preprocessing(FLAGS.backbone_name)(
+        image.astype("float32")
+    )
+    examples = {
+        "v1": (
+            1,
+            build_processed_data.build_v1_example(
+                FLAGS.side,
+                FLAGS.side,
+                np.asarray(preprocessed).flatten(),
+                mask.astype("float32").flatten(),
+                label.astype("float32").flatten(),
+            ),
+        ),
+        "v2/raw": (
+            2,
+            build_processed_data.encode_processed_example(image, mask, label),
+        ),
+        "v2/png": (
+            2,
+            build_processed_data.encode_processed_example(
+                image, mask, label, image_format="png"
+            ),
+        ),
+    }
+
+    with tempfile.TemporaryDirectory() as root:
+        for name, (version, example) in examples.items():
+            dataset_dir = os.path.join(root, name.replace("/", "-"))
+            os.makedirs(dataset_dir)
+            size = write_shard(
+                os.path.join(dataset_dir, "shard.tfrecord"),
+                example,
+                FLAGS.records_num,
+            )
+            params = argparse.Namespace(
+                backbone_name=FLAGS.backbone_name,
+                batch_size=FLAGS.batch_size,
+                dataset_dir=dataset_dir,
+                input_context=None,
+                kernel_num=FLAGS.kernel_num,
+                num_readers=FLAGS.num_readers,
+                prefetch=1,
+                resize_length=FLAGS.side,
+                should_repeat=False,
+                should_shuffle=False,
+            )
+            reader = ProcessedDataset(params, version)
+            records = tf.data.TFRecordDataset(reader._get_all_tfrecords())
+            single = records.map(
+                lambda example_proto: parse_single_example(
+                    example_proto, version
+                ),
+                num_parallel_calls=FLAGS.num_readers,
+            )
+            batched = records.batch(FLAGS.batch_size).map(
+                reader._parse_batch, num_parallel_calls=FLAGS.num_readers
+            )
+            print(
+                "{:>8}: {:8.2f} MB/record  parsed {:8.2f} records/s single,"
+                " {:8.2f} batched, read {:8.2f}".format(
+                    name,
+                    size / FLAGS.records_num / 2**20,
+                    records_per_second(single, FLAGS.records_num),
+                    records_per_second(batched, FLAGS.records_num),
+                    records_per_second(reader.build(), FLAGS.records_num),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
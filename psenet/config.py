@@ -14,6 +14,7 @@ GPU_PER_WORKER = 0
 GRADIENT_CLIPPING_NORM = 9.0
 HEIGHT = "height"
 IMAGE = "image"
+IMAGE_ID = "image_id"
 IMAGE_NAME = "image_name"
 IMAGES_DIR = "images"
 KEEP_CHECKPOINT_EVERY_N_HOURS = 0.5
@@ -22,14 +23,19 @@ KERNEL_NUM = 7
 KERNELS = "kernels"
 KERNELS_LOSS_WEIGHT = 0.3
 LABEL = "label"
+LABEL_CACHE_SIZE = 1024
+LABELS = "labels"
 LABELS_DIR = "labels"
 LEARNING_RATE = 1e-3
 LEARNING_RATE_DECAY_FACTOR = 0.1
 LEARNING_RATE_DECAY_STEPS = 400
 MASK = "mask"
 MAX_ROTATION_ANGLE = 10
+MIN_KERNEL_AREA = 10
 MIN_SCALE = 0.4
 MIN_SIDE = 32
+MIN_TEXT_AREA = 800
+MIN_TEXT_SCORE = 0.93
 MIRRORED_STRATEGY = "mirrored"
 MODEL_DIR = "./dist/psenet"
 MOMENTUM = 0.99
@@ -37,11 +43,13 @@ MULTIWORKER_MIRRORED_STRATEGY = "multi-worker-mirrored"
 N_EPOCHS = 600
 N_SAMPLES = 1
 N_EVAL_STEPS = 5
+NMS_IOU_THRESHOLD = 0.3
 NUM_BATCHES_TO_SHUFFLE = 4
 NUM_READERS = 1
 NUMBER_OF_BBOXES = "number_of_bboxes"
 PREFETCH = 1
 PROCESSED_DATA_LABEL = "preprocessed"
+PROCESSED_V2_DATA_LABEL = "preprocessed-v2"
 RAW_EVAL_DATA_DIR = "./dist/mlt/eval"
 RAW_TRAINING_DATA_DIR = "./dist/mlt/train"
 RAW_DATA_LABEL = "raw"
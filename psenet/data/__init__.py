@@ -1,11 +1,13 @@
 from psenet import config
 
 from .processed import build as build_processed_dataset
+from .processed import build_v2 as build_processed_v2_dataset
 from .raw import build as build_raw_dataset
 
 DATASETS = {
     config.RAW_DATA_LABEL: build_raw_dataset,
     config.PROCESSED_DATA_LABEL: build_processed_dataset,
+    config.PROCESSED_V2_DATA_LABEL: build_processed_v2_dataset,
 }
 
 
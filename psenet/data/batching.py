@@ -0,0 +1,59 @@
+"""Batches samples of different sides, with or without bucketing them."""
+
+import tensorflow as tf
+
+from psenet import config
+
+
+def shape_key(height, width, min_side=config.MIN_SIDE):
+    """Numbers the buckets of `min_side` by `min_side` pixels of sides.
+
+    The scaled sides are multiples of `min_side`, so every bucket holds one
+    shape and the number of buckets is bounded by the resize length.
+    """
+    height = tf.cast(height, tf.int64) // min_side
+    width = tf.cast(width, tf.int64) // min_side
+    return height * 2**32 + width
+
+
+def batch(
+    dataset,
+    batch_size,
+    padded_shapes,
+    get_shape,
+    bucket=False,
+    drop_remainder=False,
+):
+    """Batches `dataset`, padding every sample to the largest of its batch.
+
+    With `bucket`, samples are first grouped by their `(height, width)`, as
+    returned by `get_shape` from a sample, and every batch takes samples of
+    one bucket only, so that none of its pixels is padding. The batches of
+    a bucket are emitted as soon as it fills up, and the partial ones when
+    the dataset ends, unless `drop_remainder`.
+    """
+    if not bucket:
+        return dataset.padded_batch(
+            batch_size,
+            padded_shapes=padded_shapes,
+            drop_remainder=drop_remainder,
+        )
+
+    def key_func(*sample):
+        shape = get_shape(*sample)
+        return shape_key(shape[0], shape[1])
+
+    return dataset.group_by_window(
+        key_func,
+        lambda key, window: window.padded_batch(
+            batch_size,
+            padded_shapes=padded_shapes,
+            drop_remainder=drop_remainder,
+        ),
+        window_size=batch_size,
+    )
+
+
+def image_shape(inputs, labels):
+    """The sides of the image of a `(inputs, labels)` sample."""
+    return tf.shape(inputs[config.IMAGE])[:2]
@@ -0,0 +1,102 @@
+"""An on-disk cache of drawn label maps, for the raw dataset."""
+
+import os
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from psenet.data.processed import unpack_bits
+
+_SUFFIX = ".bits"
+_WEIGHTS = tf.constant([128, 64, 32, 16, 8, 4, 2, 1], dtype=tf.int32)
+
+
+def pack_bits(maps):
+    """Packs binary `maps` into uint8 bytes, as `np.packbits` would."""
+    bits = tf.cast(tf.reshape(maps, [-1]) > 0, tf.int32)
+    bits = tf.pad(bits, [[0, -tf.size(bits) % 8]])
+    packed = tf.reduce_sum(tf.reshape(bits, [-1, 8]) * _WEIGHTS, axis=1)
+    return tf.cast(packed, tf.uint8)
+
+
+class LabelCache:
+    """Keeps bit-packed uint8 maps in `cache_dir`, within `max_bytes`.
+
+    Every entry is a file named after its key. The entries are read with
+    TensorFlow ops, so that hits run in the input pipeline without Python,
+    and written once, on a miss. Once the cache is full, it stores no new
+    entries rather than evicting: every sample comes back once an epoch,
+    so the stored ones hit as often as any others would. Opening a cache
+    past `max_bytes` removes its least recently written entries.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        entries = sorted(
+            (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+            for entry in os.scandir(cache_dir)
+            if entry.name.endswith(_SUFFIX)
+        )
+        self._entries = {}
+        self._bytes = 0
+        for _, name, size in reversed(entries):
+            if self._bytes + size > max_bytes:
+                os.remove(os.path.join(cache_dir, name))
+                continue
+            self._entries[name] = size
+            self._bytes += size
+
+    def filename(self, key):
+        """The file of the string `key`, a tensor or not."""
+        return tf.strings.join([self.cache_dir, os.sep, key, _SUFFIX])
+
+    def load(self, key, shape):
+        """Returns the maps of `key` with `shape` and whether they were
+        cached, or zeros in their place."""
+        filename = self.filename(key)
+        data = tf.cond(
+            tf.size(tf.io.matching_files(filename)) > 0,
+            lambda: tf.io.read_file(filename),
+            lambda: tf.constant(""),
+        )
+        size = tf.math.reduce_prod(shape)
+        # A missing or partly written entry has the wrong length.
+        is_cached = tf.equal(tf.strings.length(data), (size + 7) // 8)
+        maps = tf.cond(
+            is_cached,
+            lambda: unpack_bits(data, shape),
+            lambda: tf.zeros(shape, tf.uint8),
+        )
+        return maps, is_cached
+
+    def store(self, key, maps):
+        """Returns `maps` once they are stored under `key`, if there is room
+        for them."""
+        is_stored = tf.py_function(
+            self._write, [self.filename(key), pack_bits(maps)], tf.bool
+        )
+        with tf.control_dependencies([is_stored]):
+            return tf.identity(maps)
+
+    def _write(self, filename, packed):
+        filename = filename.numpy().decode("utf-8")
+        data = packed.numpy()
+        name = os.path.basename(filename)
+        with self._lock:
+            if name in self._entries:
+                return True
+            if self._bytes + data.size > self.max_bytes:
+                return False
+            self._entries[name] = data.size
+            self._bytes += data.size
+        temporary = "{}.{}.{}".format(
+            filename, os.getpid(), threading.get_ident()
+        )
+        with open(temporary, "wb") as cached:
+            cached.write(data.tobytes())
+        os.replace(temporary, filename)
+        return True
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-import Polygon as plg
 import pyclipper
 import tensorflow as tf
 
@@ -21,29 +20,70 @@ def random_flip(images, prob=0.5, dim=1):
     return outputs
 
 
-def rotate(image):
-    max_angle = config.MAX_ROTATION_ANGLE
-    angle = tf.random.uniform([]) * 2 * max_angle - max_angle
-    image = np.asarray(image, dtype="uint8")
-    height, width = np.asarray(image.shape).astype("uint64")[:2]
-    rotation_matrix = cv2.getRotationMatrix2D(
-        (height / 2, width / 2), angle, 1
+def rotation_transform(angle, height, width):
+    """Maps the output pixels of a rotation about the center to the input."""
+    angle = angle * np.pi / 180
+    cos = tf.math.cos(angle)
+    sin = tf.math.sin(angle)
+    center_x = tf.cast(width, tf.float32) / 2
+    center_y = tf.cast(height, tf.float32) / 2
+    return tf.stack(
+        [
+            cos,
+            -sin,
+            center_x - cos * center_x + sin * center_y,
+            sin,
+            cos,
+            center_y - sin * center_x - cos * center_y,
+            0.0,
+            0.0,
+        ]
     )
-    image = cv2.warpAffine(image, rotation_matrix, (height, width))
-    return image
 
 
-def random_rotate(images, prob=0.5):
-    random_value = tf.random.uniform([])
-    is_rotated = tf.less_equal(random_value, prob)
+def rotate(image, angle):
+    """Rotates the `(H, W, C)` image by `angle` degrees counterclockwise,
+    as `cv2.warpAffine` with `cv2.getRotationMatrix2D` would, filling the
+    corners with zeros. The pixels are sampled, not interpolated, so that
+    binary maps stay binary."""
+    image_shape = tf.shape(image)
+    transform = rotation_transform(angle, image_shape[0], image_shape[1])
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=image[tf.newaxis],
+        transforms=transform[tf.newaxis],
+        output_shape=image_shape[:2],
+        fill_value=0.0,
+        interpolation="NEAREST",
+        fill_mode="CONSTANT",
+    )[0]
+
+
+def random_rotate(images, prob=0.5, max_angle=config.MAX_ROTATION_ANGLE):
+    """Rotates all the `images` of the same sides by one random angle.
+
+    The images are stacked along their channels and rotated at once.
+    """
+    channels = [
+        image.shape[2] if image.shape.rank == 3 else 1 for image in images
+    ]
+    stacked = tf.concat(
+        [
+            image if image.shape.rank == 3 else image[..., tf.newaxis]
+            for image in images
+        ],
+        axis=2,
+    )
+    angle = tf.random.uniform([], -max_angle, max_angle)
+    stacked = tf.cond(
+        tf.less_equal(tf.random.uniform([]), prob),
+        lambda: rotate(stacked, angle),
+        lambda: stacked,
+    )
     rotated_images = []
-    for image in images:
-        image = tf.cond(
-            is_rotated,
-            lambda: tf.py_function(func=rotate, inp=[image], Tout=tf.uint8),
-            lambda: image,
-        )
-        rotated_images.append(image)
+    for image, image_stack in zip(images, tf.split(stacked, channels, axis=2)):
+        if image.shape.rank != 3:
+            image_stack = image_stack[..., 0]
+        rotated_images.append(image_stack)
     return rotated_images
 
 
@@ -74,7 +114,8 @@ def random_background_crop(
         tf.less_equal(width, crop_size), tf.less_equal(height, crop_size)
     )
     should_search = tf.logical_and(
-        tf.greater(random_value, prob), tf.greater(tf.count_nonzero(text), 0)
+        tf.greater(random_value, prob),
+        tf.greater(tf.math.count_nonzero(text), 0),
     )
 
     def search_for_the_background():
@@ -143,6 +184,22 @@ def random_background_crop(
     return output
 
 
+def pad_or_crop(images, size=config.CROP_SIZE):
+    """Crops the `images` to at most `size` by `size` pixels from the top
+    left and pads them with zeros to exactly that, with static shapes."""
+    outputs = []
+    for image in images:
+        image = image[:size, :size]
+        image_shape = tf.shape(image)
+        paddings = [[0, size - image_shape[0]], [0, size - image_shape[1]]]
+        paddings += [[0, 0]] * (image.shape.rank - 2)
+        image = tf.pad(image, paddings)
+        outputs.append(
+            tf.ensure_shape(image, [size, size] + image.shape[2:].as_list())
+        )
+    return outputs
+
+
 def adjust_side(side, divisor=config.MIN_SIDE, min_side=config.MIN_SIDE):
     if tf.is_tensor(side):
         new_side = tf.math.maximum(
@@ -212,18 +269,27 @@ def scale(
     return output
 
 
-def random_scale(
-    image,
-    prob=0.5,
-    resize_length=config.RESIZE_LENGTH,
-    crop_size=config.CROP_SIZE,
-):
-    image = scale(image, resize_length=resize_length)
+def random_scale(images, prob=0.5, crop_size=config.CROP_SIZE):
+    """Resizes all the `images` of the same sides by one random factor.
+
+    The images are stacked along their channels and resized at once, by
+    their nearest pixels, so that binary maps stay binary.
+    """
+    channels = [
+        image.shape[2] if image.shape.rank == 3 else 1 for image in images
+    ]
+    stacked = tf.concat(
+        [
+            image if image.shape.rank == 3 else image[..., tf.newaxis]
+            for image in images
+        ],
+        axis=2,
+    )
     random_value = tf.random.uniform([])
     random_scaling_factor = tf.random.uniform(
         [], minval=0.5, maxval=3.0, dtype=tf.float32
     )
-    image_shape = tf.shape(image)
+    image_shape = tf.shape(stacked)
     height = tf.cast(image_shape[0], tf.float32)
     width = tf.cast(image_shape[1], tf.float32)
     min_side = tf.math.minimum(width, height)
@@ -235,10 +301,10 @@ def random_scale(
         lambda: random_scaling_factor,
     )
     should_resize = tf.less_equal(random_value, prob)
-    output = tf.cond(
+    stacked = tf.cond(
         should_resize,
         lambda: tf.image.resize(
-            image,
+            stacked,
             [
                 tf.cast(
                     adjust_side(tf.round(random_scaling_factor * height)),
@@ -251,46 +317,87 @@ def random_scale(
             ],
             method=tf.image.ResizeMethod.NEAREST_NEIGHBOR,
         ),
-        lambda: image,
+        lambda: stacked,
+    )
+    scaled_images = []
+    for image, image_stack in zip(images, tf.split(stacked, channels, axis=2)):
+        if image.shape.rank != 3:
+            image_stack = image_stack[..., 0]
+        scaled_images.append(image_stack)
+    return scaled_images
+
+
+def polygon_areas(polygons):
+    """The areas of `(N, P, 2)` polygons, by the shoelace formula."""
+    polygons = np.asarray(polygons, dtype="float64")
+    following = np.roll(polygons, -1, axis=1)
+    return (
+        np.abs(
+            np.sum(
+                polygons[..., 0] * following[..., 1]
+                - following[..., 0] * polygons[..., 1],
+                axis=1,
+            )
+        )
+        / 2
     )
-    return output
-
-
-def dist(a, b):
-    return np.sqrt(np.sum((a - b) ** 2))
-
-
-def perimeter(bbox):
-    peri = 0.0
-    for i in range(bbox.shape[0]):
-        peri += dist(bbox[i], bbox[(i + 1) % bbox.shape[0]])
-    return peri
 
 
-def shrink(bboxes, rate, max_shr=20):
-    rate = rate * rate
-    shrinked_bboxes = []
-    for bbox in bboxes:
-        area = plg.Polygon(bbox).area()
-        peri = perimeter(bbox)
+def polygon_perimeters(polygons):
+    """The perimeters of `(N, P, 2)` polygons."""
+    polygons = np.asarray(polygons, dtype="float64")
+    following = np.roll(polygons, -1, axis=1)
+    return np.sum(np.linalg.norm(following - polygons, axis=2), axis=1)
+
+
+def shrink_scales(bboxes, rates, max_shr=20):
+    """Shrinks the `(N, P, 2)` integer boxes once for every rate.
+
+    A box moves its outline inwards by area * (1 - rate^2) / perimeter
+    pixels, at most `max_shr`, and stays whole if it would vanish. Returns
+    one list of polygons per rate.
+    """
+    shrinked_bboxes = [[] for _ in rates]
+    if len(bboxes) == 0:
+        return shrinked_bboxes
+
+    rates = np.asarray(rates, dtype="float64")[:, np.newaxis] ** 2
+    offsets = np.minimum(
+        (
+            polygon_areas(bboxes)
+            * (1 - rates)
+            / (polygon_perimeters(bboxes) + 0.001)
+            + 0.5
+        ).astype("int64"),
+        max_shr,
+    )
 
-        pco = pyclipper.PyclipperOffset()
+    pco = pyclipper.PyclipperOffset()
+    for i, bbox in enumerate(bboxes):
+        pco.Clear()
         pco.AddPath(bbox, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
-        offset = min((int)(area * (1 - rate) / (peri + 0.001) + 0.5), max_shr)
-
-        shrinked_bbox = pco.Execute(-offset)
-        if len(shrinked_bbox) == 0:
-            shrinked_bboxes.append(bbox)
-            continue
+        for scale, offset in enumerate(offsets[:, i]):
+            shrinked_bbox = pco.Execute(-int(offset))
+            if len(shrinked_bbox) == 0 or len(shrinked_bbox[0]) <= 2:
+                shrinked_bboxes[scale].append(bbox)
+            else:
+                shrinked_bboxes[scale].append(np.array(shrinked_bbox[0]))
 
-        shrinked_bbox = np.array(shrinked_bbox)[0]
-        if shrinked_bbox.shape[0] <= 2:
-            shrinked_bboxes.append(bbox)
-            continue
+    return shrinked_bboxes
 
-        shrinked_bboxes.append(shrinked_bbox)
 
-    return np.array(shrinked_bboxes)
+def shrink(bboxes, rate, max_shr=20):
+    """Shrinks the `(N, P, 2)` integer boxes by one rate.
+
+    Returns them as an array, of objects if their numbers of points differ.
+    """
+    shrinked_bboxes = shrink_scales(bboxes, [rate], max_shr)[0]
+    if len({len(bbox) for bbox in shrinked_bboxes}) <= 1:
+        return np.array(shrinked_bboxes)
+    ragged_bboxes = np.empty(len(shrinked_bboxes), dtype=object)
+    for idx, bbox in enumerate(shrinked_bboxes):
+        ragged_bboxes[idx] = bbox
+    return ragged_bboxes
 
 
 def check_image_validity(
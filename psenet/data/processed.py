@@ -4,11 +4,26 @@ import tensorflow as tf
 from tensorflow.python.platform import tf_logging as logging
 
 from psenet import config
+from psenet.backbones.factory import Backbones
+from psenet.data import batching
 from psenet.data import preprocess
 
+_BITS = tf.constant([7, 6, 5, 4, 3, 2, 1, 0], dtype=tf.uint8)
+
+
+def unpack_bits(data, shape):
+    """Decodes the bytes of `np.packbits` into a uint8 tensor of `shape`."""
+    packed = tf.io.decode_raw(data, tf.uint8)
+    bits = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(tf.expand_dims(packed, 1), _BITS), 1
+    )
+    bits = tf.reshape(bits, [-1])[: tf.math.reduce_prod(shape)]
+    return tf.reshape(bits, shape)
+
 
 class ProcessedDataset:
-    def __init__(self, FLAGS):
+    def __init__(self, FLAGS, version=1):
+        self.version = version
         self.batch_size = FLAGS.batch_size
         self.dataset_dir = FLAGS.dataset_dir
         self.input_context = FLAGS.input_context
@@ -18,23 +33,46 @@ class ProcessedDataset:
         self.should_repeat = FLAGS.should_repeat
         self.should_shuffle = FLAGS.should_shuffle
         self.resize_length = FLAGS.resize_length
+        self.bucket_by_shape = getattr(FLAGS, "bucket_by_shape", False)
+        # The evaluation images are kept whole.
+        self.fixed_crop = getattr(FLAGS, "fixed_crop", False) and getattr(
+            FLAGS, "is_training", True
+        )
+        self.crop_size = FLAGS.resize_length // 2
+        if version == 2:
+            self.preprocess = Backbones.get_preprocessing(FLAGS.backbone_name)
+
+    def _parse_batch(self, example_protos):
+        if self.version == 2:
+            features = {
+                "features/image": tf.io.FixedLenFeature((), tf.string),
+                "features/image/format": tf.io.FixedLenFeature(
+                    (), tf.string, default_value="raw"
+                ),
+                "features/mask": tf.io.FixedLenFeature((), tf.string),
+                "labels": tf.io.FixedLenFeature((), tf.string),
+            }
+        else:
+            features = {
+                name: tf.io.FixedLenSequenceFeature(
+                    (), tf.float32, allow_missing=True
+                )
+                for name in ["features/image", "features/mask", "labels"]
+            }
+        features["height"] = tf.io.FixedLenFeature(
+            (), tf.int64, default_value=0
+        )
+        features["width"] = tf.io.FixedLenFeature(
+            (), tf.int64, default_value=0
+        )
+        return tf.io.parse_example(example_protos, features)
 
-    def _parse_example(self, example_proto):
-        features = {
-            "height": tf.io.FixedLenFeature((), tf.int64, default_value=0),
-            "width": tf.io.FixedLenFeature((), tf.int64, default_value=0),
-            "features/image": tf.io.VarLenFeature(tf.float32),
-            "features/mask": tf.io.VarLenFeature(tf.float32),
-            "labels": tf.io.VarLenFeature(tf.float32),
-        }
-        parsed_features = tf.io.parse_single_example(example_proto, features)
-
+    def _decode_example(self, parsed_features):
         height = parsed_features["height"]
         width = parsed_features["width"]
 
-        image = tf.sparse.to_dense(
-            parsed_features["features/image"], default_value=0
-        )
+        # The batch pads the flat features to its longest record.
+        image = parsed_features["features/image"][: height * width * 3]
         image = tf.reshape(image, [height, width, 3])
         image = preprocess.scale(
             image,
@@ -42,19 +80,61 @@ class ProcessedDataset:
             method=tf.image.ResizeMethod.BICUBIC,
         )
 
-        mask = tf.sparse.to_dense(
-            parsed_features["features/mask"], default_value=0
-        )
+        mask = parsed_features["features/mask"][: height * width]
         mask = tf.reshape(mask, [height, width, 1])
         mask = preprocess.scale(mask, resize_length=self.resize_length)
 
-        labels = tf.sparse.to_dense(parsed_features["labels"], default_value=0)
+        labels = parsed_features["labels"][: height * width * self.kernel_num]
         labels = tf.reshape(labels, [height, width, self.kernel_num])
         labels = preprocess.scale(labels, resize_length=self.resize_length)
         labels = tf.concat([mask, labels], axis=-1)
 
         return ({config.IMAGE: image}, labels)
 
+    def _decode_example_v2(self, parsed_features):
+        height = parsed_features["height"]
+        width = parsed_features["width"]
+
+        image_data = parsed_features["features/image"]
+        image = tf.cond(
+            tf.equal(parsed_features["features/image/format"], "raw"),
+            lambda: tf.reshape(
+                tf.io.decode_raw(image_data, tf.uint8), [height, width, 3]
+            ),
+            lambda: tf.image.decode_png(image_data, 3),
+        )
+        image = self.preprocess(tf.cast(image, tf.float32))
+        image = preprocess.scale(
+            image,
+            resize_length=self.resize_length,
+            method=tf.image.ResizeMethod.BICUBIC,
+        )
+
+        mask = unpack_bits(
+            parsed_features["features/mask"], [height, width, 1]
+        )
+        mask = preprocess.scale(
+            tf.cast(mask, tf.float32), resize_length=self.resize_length
+        )
+
+        labels = unpack_bits(
+            parsed_features["labels"], [height, width, self.kernel_num]
+        )
+        labels = preprocess.scale(
+            tf.cast(labels, tf.float32), resize_length=self.resize_length
+        )
+        labels = tf.concat([mask, labels], axis=-1)
+
+        return ({config.IMAGE: image}, labels)
+
+    def _pad_or_crop(self, inputs, labels):
+        # The mask is the first channel of the labels, so the padding is
+        # masked out of the loss.
+        image, labels = preprocess.pad_or_crop(
+            [inputs[config.IMAGE], labels], size=self.crop_size
+        )
+        return ({config.IMAGE: image}, labels)
+
     def _get_all_tfrecords(self):
         return tf.data.Dataset.list_files(
             os.path.join(self.dataset_dir, "*.tfrecord"), shuffle=False
@@ -93,22 +173,42 @@ class ProcessedDataset:
             num_parallel_calls=self.num_readers,
         )
 
+        # Records are parsed a batch at a time and decoded one at a time,
+        # since their sides differ.
+        dataset = dataset.batch(self.batch_size)
+        dataset = dataset.map(
+            self._parse_batch, num_parallel_calls=self.num_readers
+        )
+        dataset = dataset.unbatch()
+        if self.version == 2:
+            decode_example = self._decode_example_v2
+        else:
+            decode_example = self._decode_example
         dataset = dataset.map(
-            self._parse_example, num_parallel_calls=self.num_readers
+            decode_example, num_parallel_calls=self.num_readers
         )
+        if self.fixed_crop:
+            dataset = dataset.map(
+                self._pad_or_crop, num_parallel_calls=self.num_readers
+            )
 
-        dataset = dataset.padded_batch(
+        side = self.crop_size if self.fixed_crop else None
+        dataset = batching.batch(
+            dataset,
             self.batch_size,
             padded_shapes=(
-                {config.IMAGE: [None, None, 3]},
-                [None, None, self.kernel_num + 1],
+                {config.IMAGE: [side, side, 3]},
+                [side, side, self.kernel_num + 1],
             ),
+            get_shape=batching.image_shape,
+            bucket=self.bucket_by_shape,
+            drop_remainder=self.fixed_crop,
         ).prefetch(self.prefetch)
 
         return dataset
 
 
-def build(FLAGS):
+def build(FLAGS, version=1):
     def input_fn(input_context=None):
         is_training = FLAGS.mode == tf.estimator.ModeKeys.TRAIN
         if FLAGS.augment_training_data:
@@ -123,8 +223,13 @@ def build(FLAGS):
         FLAGS.dataset_dir = dataset_dir
         FLAGS.should_repeat = True
         FLAGS.should_shuffle = is_training
+        FLAGS.is_training = is_training
         FLAGS.input_context = input_context
-        dataset = ProcessedDataset(FLAGS).build()
+        dataset = ProcessedDataset(FLAGS, version).build()
         return dataset
 
     return input_fn
+
+
+def build_v2(FLAGS):
+    return build(FLAGS, version=2)
@@ -0,0 +1,207 @@
+"""Draws the text, kernel and mask maps of text boxes in TensorFlow ops.
+
+A box covers one span of columns in every row it crosses, bounded by the
+lines through its edges. The kernels move every edge line inwards by the
+PSENet offset of `preprocess.shrink`, so they share the rows and cost no
+polygon clipping. The spans are drawn by adding +1 at their starts and -1
+past their ends and summing along the rows, so a map costs O(boxes * rows +
+pixels) and, unlike `tf.py_function`, scales with `num_parallel_calls`.
+
+The boxes are taken as convex: a concave one is drawn as the intersection
+of the half-planes of its edges.
+"""
+
+import sys
+
+import tensorflow as tf
+
+# Pixels this close to the outline are inside, like the outline that
+# `cv2.drawContours` draws around filled polygons.
+_OUTLINE = 0.5
+_EPSILON = 1e-6
+# The channels whose coverage counts share an int64.
+_BYTES = 8
+
+
+def _spans(points, offsets, height):
+    """The column spans of the boxes shrunk by `offsets`, for every row.
+
+    `points` are the `(N, P, 2)` vertices of N boxes in pixels, as (x, y),
+    and `offsets` the `(C, N)` distances to move their edges inwards.
+    Returns the `(C, N, height)` first and last columns, which may lie out
+    of the map; the spans are empty where the first exceeds the last.
+    """
+    x = points[..., 0]
+    y = points[..., 1]
+    next_x = tf.roll(x, -1, axis=1)
+    next_y = tf.roll(y, -1, axis=1)
+    edge_x = next_x - x
+    edge_y = next_y - y
+    length = tf.math.sqrt(edge_x**2 + edge_y**2)
+    is_edge = tf.greater(length, _EPSILON)
+
+    # The shoelace sign makes the normals point inside either orientation.
+    orientation = tf.math.sign(
+        tf.reduce_sum(x * next_y - next_x * y, axis=1, keepdims=True)
+    )
+    length = tf.where(is_edge, length, 1.0)
+    normal_x = -edge_y / length * orientation
+    normal_y = edge_x / length * orientation
+
+    # A point p of row r is inside if normal . (p - vertex) >= offset - the
+    # outline for every edge, which bounds the column of p on one side:
+    # from the left if normal_x > 0 and from the right if normal_x < 0.
+    # The edges are unrolled, which is faster than reducing over them.
+    rows = tf.cast(tf.range(height), points.dtype)
+    bounds = normal_x * x + normal_y * y
+    offsets = offsets[..., tf.newaxis] - _OUTLINE
+    first = -float("inf")
+    last = float("inf")
+    flat_bound = -float("inf")
+    for edge in range(points.shape[1]):
+        normal = normal_x[:, edge, tf.newaxis]
+        bound = bounds[:, edge, tf.newaxis] - (
+            normal_y[:, edge, tf.newaxis] * rows
+        )
+        is_left = tf.logical_and(
+            is_edge[:, edge, tf.newaxis], tf.greater(normal, _EPSILON)
+        )
+        is_right = tf.logical_and(
+            is_edge[:, edge, tf.newaxis], tf.less(normal, -_EPSILON)
+        )
+        is_flat = tf.logical_and(
+            is_edge[:, edge, tf.newaxis],
+            tf.logical_not(tf.logical_or(is_left, is_right)),
+        )
+        normal = tf.where(tf.logical_or(is_left, is_right), normal, 1.0)
+        first = tf.math.maximum(
+            first,
+            tf.where(is_left, bound / normal, -float("inf"))
+            + tf.where(is_left, offsets / normal, 0.0),
+        )
+        last = tf.math.minimum(
+            last,
+            tf.where(is_right, bound / normal, float("inf"))
+            + tf.where(is_right, offsets / normal, 0.0),
+        )
+        # A horizontal edge bounds the rows instead.
+        flat_bound = tf.math.maximum(
+            flat_bound, tf.where(is_flat, bound, -float("inf"))
+        )
+    first = tf.where(
+        tf.less_equal(flat_bound, -offsets), tf.math.ceil(first), float("inf")
+    )
+    return first, tf.math.floor(last)
+
+
+def fill_spans(first, last, width):
+    """Draws the union of the `(C, N, H)` spans into `(C, H, width)` maps.
+
+    Every span adds 1 to the count of its channel at its first column and
+    takes it back past its last one, so the counts summed along the rows
+    cover the spans. The counts of eight channels are packed in the bytes of
+    one int64, which takes one cumulative sum for all of them.
+    """
+    channels_num = first.shape[0]
+    if channels_num > _BYTES:
+        return tf.concat(
+            [
+                fill_spans(
+                    first[start : start + _BYTES],
+                    last[start : start + _BYTES],
+                    width,
+                )
+                for start in range(0, channels_num, _BYTES)
+            ],
+            axis=0,
+        )
+
+    height = tf.shape(first)[2]
+    stride = width + 1
+    columns_num = tf.cast(width, first.dtype)
+    first = tf.clip_by_value(first, 0.0, columns_num)
+    # The ends of empty spans cancel their starts.
+    stop = tf.clip_by_value(last + 1, first, columns_num)
+    row_starts = tf.range(height) * stride
+    starts = tf.cast(first, tf.int32) + row_starts
+    stops = tf.cast(stop, tf.int32) + row_starts
+    counts = tf.bitwise.left_shift(
+        tf.ones_like(starts, dtype=tf.int64),
+        tf.reshape(tf.range(channels_num, dtype=tf.int64) * 8, [-1, 1, 1]),
+    )
+    coverage = tf.math.unsorted_segment_sum(
+        tf.reshape(tf.stack([counts, -counts]), [-1]),
+        tf.reshape(tf.stack([starts, stops]), [-1]),
+        height * stride,
+    )
+    coverage = tf.math.cumsum(
+        tf.reshape(coverage, [height, stride])[:, :-1], axis=1
+    )
+    counts = tf.bitcast(coverage, tf.uint8)
+    if sys.byteorder == "big":
+        counts = tf.reverse(counts, [-1])
+    return tf.not_equal(tf.transpose(counts[..., :channels_num], [2, 0, 1]), 0)
+
+
+def shrink_offsets(points, rates, max_shr=20):
+    """The `(len(rates), N)` inward offsets of `preprocess.shrink`."""
+    x = points[..., 0]
+    y = points[..., 1]
+    next_x = tf.roll(x, -1, axis=1)
+    next_y = tf.roll(y, -1, axis=1)
+    area = tf.math.abs(tf.reduce_sum(x * next_y - next_x * y, axis=1)) / 2
+    perimeter = tf.reduce_sum(
+        tf.math.sqrt((next_x - x) ** 2 + (next_y - y) ** 2), axis=1
+    )
+    rates = tf.convert_to_tensor(rates, points.dtype)[:, tf.newaxis]
+    return tf.math.minimum(
+        tf.math.floor(area * (1 - rates**2) / (perimeter + 0.001) + 0.5),
+        max_shr,
+    )
+
+
+def draw_labels(bboxes, tags, height, width, kernel_num, min_scale):
+    """Draws the labels of `RawDataset` from normalized boxes.
+
+    `bboxes` are `(N, 8)` corners relative to the image sides and `tags`
+    holds one character per box, "0" for the boxes to ignore. Returns the
+    `(kernel_num - 1, height, width)` kernels, from the largest to the
+    smallest, the text map and the mask of the pixels to learn from, as
+    uint8 maps.
+    """
+    bboxes = tf.reshape(tf.cast(bboxes, tf.float32), [-1, 4, 2])
+    size = tf.cast(tf.stack([width, height]), tf.float32)
+    # The corners are truncated to pixels, as `cv2.drawContours` takes them.
+    points = tf.math.floor(bboxes * size)
+
+    rates = [
+        1.0 - (1.0 - min_scale) / (kernel_num - 1) * i
+        for i in range(1, kernel_num)
+    ]
+    offsets = tf.concat(
+        [
+            tf.zeros_like(points[tf.newaxis, :, 0, 0]),
+            shrink_offsets(points, rates),
+        ],
+        axis=0,
+    )
+    first, last = _spans(points, offsets, height)
+    # Like `preprocess.shrink`, a box too thin for its offset stays whole.
+    is_empty = tf.reduce_all(tf.greater(first, last), axis=-1, keepdims=True)
+    first = tf.where(is_empty, first[:1], first)
+    last = tf.where(is_empty, last[:1], last)
+
+    is_ignored = tf.equal(tf.strings.bytes_split(tags), "0")
+    maps = fill_spans(
+        tf.concat(
+            [
+                first,
+                tf.where(is_ignored[:, tf.newaxis], first[:1], float("inf")),
+            ],
+            axis=0,
+        ),
+        tf.concat([last, last[:1]], axis=0),
+        width,
+    )
+    maps = tf.cast(maps, tf.uint8)
+    return maps[1:-1], maps[0], 1 - maps[-1]
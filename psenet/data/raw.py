@@ -1,12 +1,13 @@
 import os
 
-import cv2
-import numpy as np
 import tensorflow as tf
 from tensorflow.python.platform import tf_logging as logging
 
 from psenet import config
+from psenet.data import batching
 from psenet.data import preprocess
+from psenet.data import rasterize
+from psenet.data.cache import LabelCache
 from psenet.backbones.factory import Backbones
 
 
@@ -25,8 +26,21 @@ class RawDataset:
         self.preprocess = Backbones.get_preprocessing(FLAGS.backbone_name)
         self.resize_length = FLAGS.resize_length
         self.crop_size = FLAGS.resize_length // 2
+        self.bucket_by_shape = getattr(FLAGS, "bucket_by_shape", False)
+        # The evaluation images are kept whole.
+        self.fixed_crop = getattr(FLAGS, "fixed_crop", False) and getattr(
+            FLAGS, "is_training", True
+        )
+        self.label_cache = None
+        label_cache_dir = getattr(FLAGS, "label_cache_dir", None)
+        if label_cache_dir:
+            self.label_cache = LabelCache(
+                label_cache_dir,
+                getattr(FLAGS, "label_cache_size", config.LABEL_CACHE_SIZE)
+                * 2**20,
+            )
 
-    def _parse_example(self, example_proto):
+    def _parse_batch(self, example_protos):
         features = {
             "image/encoded": tf.io.FixedLenFeature(
                 (), tf.string, default_value=""
@@ -49,28 +63,45 @@ class RawDataset:
             "image/text/boxes/count": tf.io.FixedLenFeature(
                 (), tf.int64, default_value=0
             ),
-            "image/text/boxes/encoded": tf.io.VarLenFeature(tf.float32),
+            "image/text/boxes/encoded": tf.io.FixedLenSequenceFeature(
+                (), tf.float32, allow_missing=True
+            ),
         }
-        parsed_features = tf.io.parse_single_example(example_proto, features)
+        return tf.io.parse_example(example_protos, features)
+
+    def _decode_example(self, parsed_features):
         image_data = parsed_features["image/encoded"]
         image = tf.cond(
             tf.image.is_jpeg(image_data),
             lambda: tf.image.decode_jpeg(image_data, 3),
             lambda: tf.image.decode_png(image_data, 3),
         )
-        bboxes = tf.sparse.to_dense(
-            parsed_features["image/text/boxes/encoded"], default_value=0
-        )
         n_bboxes = tf.cast(parsed_features["image/text/boxes/count"], "int64")
+        # The batch pads the boxes to the record with the most of them.
+        bboxes = parsed_features["image/text/boxes/encoded"][
+            : n_bboxes * config.BBOX_SIZE
+        ]
         bboxes_shape = tf.stack([n_bboxes, config.BBOX_SIZE])
         bboxes = tf.reshape(bboxes, bboxes_shape)
         image_name = parsed_features["image/filename"]
         if image_name is None:
             image_name = tf.constant("")
         tags = parsed_features["image/text/tags/encoded"]
+        # The id hashes the contents of the record, which, unlike its file
+        # name, are always set.
+        image_id = tf.strings.join(
+            [
+                tf.strings.as_string(
+                    tf.strings.to_hash_bucket_fast(part, 2**63 - 1)
+                )
+                for part in [image_data, tf.io.serialize_tensor(bboxes), tags]
+            ],
+            separator="-",
+        )
         sample = {
             config.BBOXES: bboxes,
             config.HEIGHT: parsed_features["image/height"],
+            config.IMAGE_ID: image_id,
             config.IMAGE_NAME: image_name,
             config.IMAGE: image,
             config.WIDTH: parsed_features["image/width"],
@@ -78,61 +109,69 @@ class RawDataset:
         }
         return sample
 
-    def _process_tagged_bboxes(self, bboxes, tags, height, width):
-        tags = str(tags)
-        gt_text = np.zeros([height, width], dtype="uint8")
-        mask = np.ones([height, width], dtype="uint8")
-        bboxes_count, num_points = np.asarray(bboxes.shape).astype("int64")[:2]
-        if bboxes_count > 0:
-            bboxes = np.reshape(
-                bboxes * ([width, height] * 4),
-                (bboxes_count, int(num_points / 2), 2),
-            ).astype("int32")
-            for i in range(bboxes_count):
-                cv2.drawContours(gt_text, [bboxes[i]], -1, i + 1, -1)
-                if tags[i] == "0":
-                    cv2.drawContours(mask, [bboxes[i]], -1, 0, -1)
-
-        gt_kernels = []
-        for i in range(1, self.kernel_num):
-            rate = 1.0 - (1.0 - self.min_scale) / (self.kernel_num - 1) * i
-            gt_kernel = np.zeros([height, width], dtype="uint8")
-            kernel_bboxes = preprocess.shrink(bboxes, rate)
-            for i in range(bboxes_count):
-                cv2.drawContours(gt_kernel, [kernel_bboxes[i]], -1, 1, -1)
-            gt_kernels.append(gt_kernel)
-        return gt_kernels, gt_text, mask
+    def _label_key(self, image_id, height, width):
+        # The labels only depend on the sample, its scaled size and the
+        # kernel settings.
+        return tf.strings.join(
+            [
+                image_id,
+                tf.strings.as_string(height),
+                tf.strings.as_string(width),
+                "{}-{}".format(self.kernel_num, self.min_scale),
+            ],
+            separator="-",
+        )
+
+    def _draw_labels(self, image_id, bboxes, tags, height, width):
+        def draw():
+            gt_kernels, gt_text, mask = rasterize.draw_labels(
+                bboxes, tags, height, width, self.kernel_num, self.min_scale
+            )
+            return tf.concat([gt_kernels, [gt_text, mask]], axis=0)
+
+        if self.label_cache is None:
+            maps = draw()
+        else:
+            key = self._label_key(image_id, height, width)
+            cached_maps, is_cached = self.label_cache.load(
+                key, [self.kernel_num + 1, height, width]
+            )
+            maps = tf.cond(
+                is_cached,
+                lambda: cached_maps,
+                lambda: self.label_cache.store(key, draw()),
+            )
+        return maps[:-2], maps[-2], maps[-1]
 
     def _preprocess_example(self, sample):
         image = sample[config.IMAGE]
         tags = sample[config.TAGS]
         bboxes = sample[config.BBOXES]
 
-        if self.should_augment:
-            image = preprocess.random_scale(
-                image,
-                resize_length=self.resize_length,
-                crop_size=self.crop_size,
+        # Without a cache, the labels are drawn at the size of the randomly
+        # scaled image. With one, they are drawn, or loaded, at the scaled
+        # size only, and randomly scaled along with the image.
+        rescale_labels = self.should_augment and self.label_cache is not None
+        image = preprocess.scale(image, resize_length=self.resize_length)
+        if self.should_augment and not rescale_labels:
+            (image,) = preprocess.random_scale(
+                [image], crop_size=self.crop_size
             )
-        else:
-            image = preprocess.scale(image, resize_length=self.resize_length)
-
         image_shape = tf.shape(image)
         height = image_shape[0]
         width = image_shape[1]
-        processed = tf.py_function(
-            func=self._process_tagged_bboxes,
-            inp=[bboxes, tags, height, width],
-            Tout=[tf.uint8, tf.uint8, tf.uint8],
+        gt_kernels, gt_text, mask = self._draw_labels(
+            sample[config.IMAGE_ID], bboxes, tags, height, width
         )
-        gt_kernels = processed[0]
-        gt_text = processed[1]
-        mask = processed[2]
 
         if self.should_augment:
             tensors = [image, gt_text, mask]
             for idx in range(1, self.kernel_num):
                 tensors.append(gt_kernels[idx - 1])
+            if rescale_labels:
+                tensors = preprocess.random_scale(
+                    tensors, crop_size=self.crop_size
+                )
             tensors = preprocess.random_flip(tensors)
             tensors = preprocess.random_rotate(tensors)
             tensors = preprocess.random_background_crop(
@@ -153,10 +192,16 @@ class RawDataset:
         gt_text = tf.sign(gt_text)
         gt_text = tf.cast(gt_text, tf.uint8)
         gt_text = tf.expand_dims(gt_text, axis=0)
-        label = tf.concat([gt_text, gt_kernels], axis=0)
+        # The loss and the metrics read the mask from the first channel.
+        label = tf.concat([[mask], gt_text, gt_kernels], axis=0)
         label = tf.transpose(label, perm=[1, 2, 0])
         label = tf.cast(label, tf.float32)
         mask = tf.cast(mask, tf.float32)
+        if self.fixed_crop:
+            # The padding is masked out of the loss.
+            image, label, mask = preprocess.pad_or_crop(
+                [image, label, mask], size=self.crop_size
+            )
         return ({config.IMAGE: image, config.MASK: mask}, label)
 
     def _get_all_tfrecords(self):
@@ -196,8 +241,14 @@ class RawDataset:
             num_parallel_calls=self.num_readers,
         )
 
+        dataset = dataset.batch(self.batch_size)
+        dataset = dataset.map(
+            self._parse_batch, num_parallel_calls=self.num_readers
+        )
+        # `unbatch` crashes on batches where no record has boxes.
+        dataset = dataset.flat_map(tf.data.Dataset.from_tensor_slices)
         dataset = dataset.map(
-            self._parse_example, num_parallel_calls=self.num_readers
+            self._decode_example, num_parallel_calls=self.num_readers
         )
         dataset = dataset.map(
             self._preprocess_example, num_parallel_calls=self.num_readers
@@ -207,12 +258,17 @@ class RawDataset:
             lambda inputs, labels: preprocess.check_image_validity(inputs)
         )
 
-        dataset = dataset.padded_batch(
+        side = self.crop_size if self.fixed_crop else None
+        dataset = batching.batch(
+            dataset,
             self.batch_size,
             padded_shapes=(
-                {config.IMAGE: [None, None, 3], config.MASK: [None, None]},
-                [None, None, self.kernel_num],
+                {config.IMAGE: [side, side, 3], config.MASK: [side, side]},
+                [side, side, self.kernel_num + 1],
             ),
+            get_shape=batching.image_shape,
+            bucket=self.bucket_by_shape,
+            drop_remainder=self.fixed_crop,
         ).prefetch(self.prefetch)
 
         return dataset
@@ -232,6 +288,7 @@ def build(FLAGS):
             FLAGS.training_data_dir if is_training else FLAGS.eval_data_dir
         )
         FLAGS.should_shuffle = is_training
+        FLAGS.is_training = is_training
         dataset = RawDataset(FLAGS).build()
         return dataset
 
@@ -185,6 +185,25 @@ if __name__ == "__main__":
         const=True,
         default=True,
     )
+    PARSER.add_argument(
+        "--label-cache-dir",
+        help="The directory to cache the raw dataset labels in",
+        default=None,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--label-cache-size",
+        help="The maximum size of the label cache in megabytes; "
+        + "it stops caching when full",
+        default=config.LABEL_CACHE_SIZE,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--bucket-by-shape",
+        help="Whether to batch only images of the same sides",
+        default=False,
+        type=config.str2bool,
+    )
 
     FLAGS, _ = PARSER.parse_known_args()
     tf.compat.v1.logging.set_verbosity("DEBUG")
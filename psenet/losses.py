@@ -5,12 +5,18 @@ import tensorflow as tf
 
 
 def dice_loss(labels, predictions, masks):
+    """The dice loss of `(B, H, W)` maps, or of every channel of `(B, H, W,
+    C)` ones as a `(C,)` tensor, from the same reductions for all of them.
+    """
+    labels = tf.convert_to_tensor(labels)
     predictions = tf.math.sigmoid(predictions)
 
+    has_channels = labels.shape.rank == 4
     batch_size = tf.shape(labels)[0]
-    labels = tf.reshape(labels, [batch_size, -1])
-    predictions = tf.reshape(predictions, [batch_size, -1])
-    masks = tf.reshape(masks, [batch_size, -1])
+    channels_num = tf.shape(labels)[3] if has_channels else 1
+    labels = tf.reshape(labels, [batch_size, -1, channels_num])
+    predictions = tf.reshape(predictions, [batch_size, -1, channels_num])
+    masks = tf.reshape(masks, [batch_size, -1, channels_num])
 
     labels *= masks
     predictions *= masks
@@ -22,7 +28,8 @@ def dice_loss(labels, predictions, masks):
         + config.EPSILON
     )
 
-    return 1.0 - 2.0 * tf.math.reduce_mean(intersection / union)
+    losses = 1.0 - 2.0 * tf.math.reduce_mean(intersection / union, axis=0)
+    return losses if has_channels else losses[0]
 
 
 def ohem_single(labels, predictions, masks):
@@ -80,54 +87,123 @@ def ohem_single(labels, predictions, masks):
     return output
 
 
+def _flip_negatives(bits):
+    # Orders the int32 bits of floats like the floats, and back.
+    return tf.where(
+        tf.less(bits, 0), tf.bitwise.bitwise_xor(bits, 0x7FFFFFFF), bits
+    )
+
+
+def kth_largest(scores, k):
+    """The `k[i]`-th largest of the float32 `scores[i]`, for every row.
+
+    The floats are bisected as ordered integers, 32 times, which costs a
+    pass over `scores` each instead of a sort.
+    """
+    keys = _flip_negatives(tf.bitcast(scores, tf.int32))
+    rows_num = tf.shape(scores)[0]
+    low = tf.fill([rows_num], tf.constant(-(2**31), tf.int64))
+    high = tf.fill([rows_num], tf.constant(2**31 - 1, tf.int64))
+    for _ in range(32):
+        middle = (low + high + 1) // 2
+        greater_num = tf.math.reduce_sum(
+            tf.cast(
+                tf.greater_equal(
+                    keys, tf.cast(middle, tf.int32)[:, tf.newaxis]
+                ),
+                tf.int32,
+            ),
+            axis=1,
+        )
+        is_low = tf.greater_equal(greater_num, k)
+        low = tf.where(is_low, middle, low)
+        high = tf.where(is_low, high, middle - 1)
+    return tf.bitcast(_flip_negatives(tf.cast(low, tf.int32)), tf.float32)
+
+
 def ohem_batch(labels, predictions, masks):
-    texts_count = tf.shape(predictions)[0]
-    texts_count = tf.cast(texts_count, tf.int64)
+    """Selects the pixels of `ohem_single` for a whole `(B, H, W)` batch.
+
+    The threshold of every sample is its k-th largest negative score, found
+    for all of them at once by `kth_largest` instead of a sort per sample.
+    """
+    batch_size = tf.shape(predictions)[0]
+    has_positive_texts = tf.greater(labels, 0.5)
+    has_positive_masks = tf.greater(masks, 0.5)
+    has_negative_texts = tf.logical_not(has_positive_texts)
+
+    def count(condition):
+        condition = tf.reshape(condition, [batch_size, -1])
+        return tf.math.reduce_sum(tf.cast(condition, tf.int32), axis=1)
+
+    positive_texts_num = count(
+        tf.logical_and(has_positive_texts, has_positive_masks)
+    )
+    negative_texts_num = tf.math.minimum(
+        positive_texts_num * 3, count(has_negative_texts)
+    )
+
+    negative_scores = tf.where(has_negative_texts, predictions, -float("inf"))
+    thresholds = kth_largest(
+        tf.reshape(negative_scores, [batch_size, -1]), negative_texts_num
+    )
 
-    indices = tf.range(texts_count, dtype=tf.int64)
-    selected_masks = tf.map_fn(
-        lambda idx: ohem_single(
-            labels[idx, :, :], predictions[idx, :, :], masks[idx, :, :]
+    selected_masks = tf.logical_and(
+        has_positive_masks,
+        tf.logical_or(
+            tf.greater_equal(
+                predictions, thresholds[:, tf.newaxis, tf.newaxis]
+            ),
+            has_positive_texts,
         ),
-        indices,
-        dtype=tf.float32,
     )
-    return selected_masks
+    is_default = tf.logical_or(
+        tf.math.equal(positive_texts_num, 0),
+        tf.math.equal(negative_texts_num, 0),
+    )
+    return tf.where(
+        is_default[:, tf.newaxis, tf.newaxis],
+        tf.cast(masks, tf.float32),
+        tf.cast(selected_masks, tf.float32),
+    )
 
 
 def psenet_loss(labels, predictions):
+    # The sigmoid, OHEM and dice math runs in float32 whatever the policy.
+    labels = tf.cast(labels, tf.float32)
+    predictions = tf.cast(predictions, tf.float32)
     masks = labels[:, :, :, 0]
     ground_truth = labels[:, :, :, 1:]
 
     predicted_texts = predictions[:, :, :, 0]
     ground_truth_texts = ground_truth[:, :, :, 0]
 
-    predicted_kernels = predictions[:, :, :, 1:]
     ground_truth_kernels = ground_truth[:, :, :, 1:]
 
-    # compute text loss
+    # The text is learnt on the OHEM pixels and the kernels inside the
+    # predicted texts, and all their losses come from one dice loss.
     text_masks = ohem_batch(ground_truth_texts, predicted_texts, masks)
-    text_loss = dice_loss(ground_truth_texts, predicted_texts, text_masks)
-
-    # compute kernel loss
     kernel_masks = tf.logical_and(
         tf.greater(tf.math.sigmoid(predicted_texts), 0.5),
         tf.greater(masks, 0.5),
     )
     kernel_masks = tf.cast(kernel_masks, tf.float32)
-
-    indices = tf.range(tf.shape(ground_truth_kernels)[3])
-
-    def compute_kernel_loss(index):
-        return dice_loss(
-            ground_truth_kernels[:, :, :, index],
-            predicted_kernels[:, :, :, index],
-            kernel_masks,
-        )
-
-    kernel_loss = tf.math.reduce_mean(
-        tf.map_fn(compute_kernel_loss, indices, dtype=tf.float32)
+    losses = dice_loss(
+        ground_truth,
+        predictions,
+        tf.concat(
+            [
+                text_masks[..., tf.newaxis],
+                tf.broadcast_to(
+                    kernel_masks[..., tf.newaxis],
+                    tf.shape(ground_truth_kernels),
+                ),
+            ],
+            axis=3,
+        ),
     )
+    text_loss = losses[0]
+    kernel_loss = tf.math.reduce_mean(losses[1:])
 
     current_loss = (
         config.TEXT_LOSS_WEIGHT * text_loss
@@ -43,66 +43,106 @@ def filter_input(input_type):
         )
 
 
+def confusion_counts(labels, predictions, masks, n_classes=2):
+    """Counts the pixels of the text and the kernel confusion matrices of a
+    batch, with one segment sum, into a `(2, n_classes, n_classes)` tensor."""
+    pairs = []
+    for index, input_type in enumerate(
+        [config.TEXT_METRICS, config.KERNEL_METRICS]
+    ):
+        ground_truth, prediction = filter_input(input_type)(
+            labels, predictions, masks
+        )
+        ground_truth = tf.cast(ground_truth, tf.int32)
+        prediction = tf.cast(prediction, tf.int32)
+        is_valid = tf.logical_and(
+            tf.greater_equal(ground_truth, 0), tf.less(ground_truth, n_classes)
+        )
+        pairs.append(
+            tf.where(
+                is_valid,
+                (index * n_classes + ground_truth) * n_classes + prediction,
+                -1,
+            )
+        )
+    pairs = tf.reshape(tf.stack(pairs), [-1])
+    # A segment sum drops the invalid pixels and, unlike `bincount`, also
+    # compiles with XLA.
+    counts = tf.math.unsorted_segment_sum(
+        tf.ones_like(pairs, dtype=tf.int64), pairs, 2 * n_classes**2
+    )
+    return tf.reshape(counts, [2, n_classes, n_classes])
+
+
 def compute_confusion_matrix(
     labels, predictions, masks, input_type, n_classes=2
 ):
-    y_true, y_pred = filter_input(input_type)(labels, predictions, masks)
+    """The confusion matrix of `input_type`, averaged over the samples."""
+    counts = confusion_counts(labels, predictions, masks, n_classes)
+    index = [config.TEXT_METRICS, config.KERNEL_METRICS].index(input_type)
+    batch_size = tf.cast(tf.shape(labels)[0], tf.float32)
+    return tf.cast(counts[index], tf.float32) / batch_size
 
-    def _compute_confusion(ground_truth, prediction):
-        mask = tf.logical_and(
-            tf.greater_equal(ground_truth, 0), tf.less(ground_truth, n_classes)
-        )
-        masked_gt = tf.boolean_mask(ground_truth, mask)
-        masked_gt = tf.cast(masked_gt, tf.int32)
-        masked_pred = tf.boolean_mask(prediction, mask)
-        masked_pred = tf.cast(masked_pred, tf.int32)
-        confusion = tf.math.confusion_matrix(
-            masked_gt, masked_pred, num_classes=n_classes
-        )
-        confusion = tf.cast(confusion, tf.float32)
-        return confusion
 
-    def get_increment(index):
-        ground_truth_increment = y_true[index]
-        prediction_increment = y_pred[index]
-        return _compute_confusion(ground_truth_increment, prediction_increment)
+def overall_accuracy_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    total_sum = tf.math.reduce_sum(confusion_matrix)
+    return tf.math.divide(tf.math.reduce_sum(diagonal), (total_sum + epsilon))
 
-    batch_size = tf.shape(y_true)[0]
-    batch_size = tf.cast(batch_size, tf.int64)
-    indices = tf.range(batch_size)
 
-    matrix = tf.math.reduce_mean(
-        tf.map_fn(get_increment, indices, dtype=tf.float32), axis=0
-    )
-    return matrix
+def precision_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    col_sum = tf.math.reduce_sum(confusion_matrix, axis=0)
+    return diagonal[0] / (col_sum[0] + epsilon)
 
 
-class OverallAccuracy(tf.keras.metrics.Metric):
-    def __init__(self, name="overall_accuracy", **kwargs):
-        super(OverallAccuracy, self).__init__(name=name, **kwargs)
-        self.overall_accuracy_sum = self.add_weight(
-            name="overall_accuracy_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="overall_accuracy_count", initializer="zeros"
-        )
+def recall_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
+    return diagonal[0] / (row_sum[0] + epsilon)
 
-    def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = overall_accuracy(
-            ground_truth, y_pred, masks, self.name.split("/")[0]
-        )
-        self.overall_accuracy_sum.assign_add(value)
-        self.count.assign_add(1.0)
 
-    def result(self):
-        return tf.math.divide_no_nan(self.overall_accuracy_sum, self.count)
+def f1_score_of(confusion_matrix, epsilon=config.EPSILON):
+    precision = precision_of(confusion_matrix, epsilon)
+    recall = recall_of(confusion_matrix, epsilon)
+    return 2 * precision * recall / (precision + recall + epsilon)
 
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.overall_accuracy_sum.assign(0.0)
-        self.count.assign(0.0)
+
+def mean_accuracy_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
+    return tf.math.reduce_mean(diagonal / (row_sum + epsilon))
+
+
+def mean_iou_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
+    col_sum = tf.math.reduce_sum(confusion_matrix, axis=0)
+    iou = diagonal / (row_sum + col_sum - diagonal + epsilon)
+    return tf.math.reduce_mean(iou)
+
+
+def frequency_weighted_accuracy_of(confusion_matrix, epsilon=config.EPSILON):
+    diagonal = tf.linalg.diag_part(confusion_matrix)
+    columns = tf.math.reduce_sum(confusion_matrix, axis=1)
+    rows = tf.math.reduce_sum(confusion_matrix, axis=0)
+    total_sum = tf.math.reduce_sum(confusion_matrix)
+    iou = diagonal / (columns + rows - diagonal + epsilon)
+    frequency = columns / (total_sum + epsilon)
+    return tf.math.reduce_sum(
+        tf.where(tf.greater(frequency, 0), frequency * iou, 0.0)
+    )
+
+
+METRICS = {
+    "overall_accuracy": overall_accuracy_of,
+    "mean_accuracy": mean_accuracy_of,
+    "mean_iou": mean_iou_of,
+    "frequency_weighted_accuracy": frequency_weighted_accuracy_of,
+    "precision": precision_of,
+    "recall": recall_of,
+    "f1_score": f1_score_of,
+}
 
 
 def overall_accuracy(
@@ -111,270 +151,151 @@ def overall_accuracy(
     confusion_matrix = compute_confusion_matrix(
         labels, predictions, masks, input_type
     )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    total_sum = tf.math.reduce_sum(confusion_matrix)
-    overall_accuracy = tf.math.divide(
-        tf.math.reduce_sum(diagonal), (total_sum + epsilon)
-    )
     return tf.identity(
-        overall_accuracy, name="{}/{}".format(input_type, "overall_accuracy")
+        overall_accuracy_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "overall_accuracy"),
     )
 
 
-class Precision(tf.keras.metrics.Metric):
-    def __init__(self, name="precision", **kwargs):
-        super(Precision, self).__init__(name=name, **kwargs)
-        self.precision_sum = self.add_weight(
-            name="precision_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="precision_count", initializer="zeros"
-        )
-
-    def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = precision(ground_truth, y_pred, masks, self.name.split("/")[0])
-        self.precision_sum.assign_add(value)
-        self.count.assign_add(1.0)
-
-    def result(self):
-        return tf.math.divide_no_nan(self.precision_sum, self.count)
-
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.precision_sum.assign(0.0)
-        self.count.assign(0.0)
-
-
 def precision(labels, predictions, masks, input_type, epsilon=config.EPSILON):
     confusion_matrix = compute_confusion_matrix(
         labels, predictions, masks, input_type
     )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    col_sum = tf.math.reduce_sum(confusion_matrix, axis=0)
-    precision = diagonal[0] / (col_sum[0] + epsilon)
-    return tf.identity(precision, name="{}/{}".format(input_type, "precision"))
-
-
-class Recall(tf.keras.metrics.Metric):
-    def __init__(self, name="recall", **kwargs):
-        super(Recall, self).__init__(name=name, **kwargs)
-        self.recall_sum = self.add_weight(
-            name="recall_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(name="recall_count", initializer="zeros")
-
-    def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = recall(ground_truth, y_pred, masks, self.name.split("/")[0])
-        self.recall_sum.assign_add(value)
-        self.count.assign_add(1.0)
-
-    def result(self):
-        return tf.math.divide_no_nan(self.recall_sum, self.count)
-
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.recall_sum.assign(0.0)
-        self.count.assign(0.0)
+    return tf.identity(
+        precision_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "precision"),
+    )
 
 
 def recall(labels, predictions, masks, input_type, epsilon=config.EPSILON):
     confusion_matrix = compute_confusion_matrix(
         labels, predictions, masks, input_type
     )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
-    recall = diagonal[0] / (row_sum[0] + epsilon)
-    return tf.identity(recall, name="{}/{}".format(input_type, "recall"))
-
-
-class F1Score(tf.keras.metrics.Metric):
-    def __init__(self, name="f1_score", **kwargs):
-        super(F1Score, self).__init__(name=name, **kwargs)
-        self.f1_score_sum = self.add_weight(
-            name="f1_score_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="f1_score_count", initializer="zeros"
-        )
-
-    def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = f1_score(ground_truth, y_pred, masks, self.name.split("/")[0])
-        self.f1_score_sum.assign_add(value)
-        self.count.assign_add(1.0)
-
-    def result(self):
-        return tf.math.divide_no_nan(self.f1_score_sum, self.count)
-
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.f1_score_sum.assign(0.0)
-        self.count.assign(0.0)
+    return tf.identity(
+        recall_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "recall"),
+    )
 
 
 def f1_score(labels, predictions, masks, input_type, epsilon=config.EPSILON):
     confusion_matrix = compute_confusion_matrix(
         labels, predictions, masks, input_type
     )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    col_sum = tf.math.reduce_sum(confusion_matrix, axis=0)
-    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
-    precision = diagonal[0] / (col_sum[0] + epsilon)
-    recall = diagonal[0] / (row_sum[0] + epsilon)
-    f1_score = 2 * precision * recall / (precision + recall + epsilon)
-    return tf.identity(f1_score, name="{}/{}".format(input_type, "f1_score"))
-
+    return tf.identity(
+        f1_score_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "f1_score"),
+    )
 
-class MeanAccuracy(tf.keras.metrics.Metric):
-    def __init__(self, name="mean_accuracy", **kwargs):
-        super(MeanAccuracy, self).__init__(name=name, **kwargs)
-        self.mean_accuracy_sum = self.add_weight(
-            name="mean_accuracy_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="mean_accuracy_count", initializer="zeros"
-        )
 
-    def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = mean_accuracy(
-            ground_truth, y_pred, masks, self.name.split("/")[0]
-        )
-        self.mean_accuracy_sum.assign_add(value)
-        self.count.assign_add(1.0)
+def mean_accuracy(
+    labels, predictions, masks, input_type, epsilon=config.EPSILON
+):
+    confusion_matrix = compute_confusion_matrix(
+        labels, predictions, masks, input_type
+    )
+    return tf.identity(
+        mean_accuracy_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "mean_accuracy"),
+    )
 
-    def result(self):
-        return tf.math.divide_no_nan(self.mean_accuracy_sum, self.count)
 
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.mean_accuracy_sum.assign(0.0)
-        self.count.assign(0.0)
+def mean_iou(labels, predictions, masks, input_type, epsilon=config.EPSILON):
+    confusion_matrix = compute_confusion_matrix(
+        labels, predictions, masks, input_type
+    )
+    return tf.identity(
+        mean_iou_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "mean_iou"),
+    )
 
 
-def mean_accuracy(
+def frequency_weighted_accuracy(
     labels, predictions, masks, input_type, epsilon=config.EPSILON
 ):
     confusion_matrix = compute_confusion_matrix(
         labels, predictions, masks, input_type
     )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
-    mean_accuracy = tf.math.reduce_mean(diagonal / (row_sum + epsilon))
     return tf.identity(
-        mean_accuracy, name="{}/{}".format(input_type, "mean_accuracy")
+        frequency_weighted_accuracy_of(confusion_matrix, epsilon),
+        name="{}/{}".format(input_type, "fwaccuracy"),
     )
 
 
-class MeanIoU(tf.keras.metrics.Metric):
-    def __init__(self, name="mean_iou", **kwargs):
-        super(MeanIoU, self).__init__(name=name, **kwargs)
-        self.mean_iou_sum = self.add_weight(
-            name="mean_iou_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="mean_iou_count", initializer="zeros"
+class ConfusionMatrices(tf.keras.metrics.Metric):
+    """Accumulates the pixel counts of the text and the kernel confusion
+    matrices, from which all the PSENet metrics follow."""
+
+    def __init__(self, name="confusion_matrices", **kwargs):
+        super(ConfusionMatrices, self).__init__(name=name, **kwargs)
+        self.counts = self.add_weight(
+            name="counts", shape=[2, 2, 2], initializer="zeros", dtype="int64"
         )
 
     def update_state(self, y_true, y_pred, sample_weight=None):
+        y_true = tf.cast(y_true, tf.float32)
+        y_pred = tf.cast(y_pred, tf.float32)
         masks = y_true[:, :, :, 0]
         ground_truth = y_true[:, :, :, 1:]
-        value = mean_iou(ground_truth, y_pred, masks, self.name.split("/")[0])
-        self.mean_iou_sum.assign_add(value)
-        self.count.assign_add(1.0)
+        self.counts.assign_add(confusion_counts(ground_truth, y_pred, masks))
 
-    def result(self):
-        return tf.math.divide_no_nan(self.mean_iou_sum, self.count)
+    def confusion_matrix(self, input_type):
+        index = [config.TEXT_METRICS, config.KERNEL_METRICS].index(input_type)
+        return tf.cast(self.counts[index], tf.float64)
 
-    def reset_states(self):
+    def result(self):
+        return {
+            "{}/{}".format(input_type, name): metric(
+                self.confusion_matrix(input_type)
+            )
+            for input_type in [config.KERNEL_METRICS, config.TEXT_METRICS]
+            for name, metric in METRICS.items()
+        }
+
+    def reset_state(self):
         # The state of the metric will be reset at the start of each epoch.
-        self.mean_iou_sum.assign(0.0)
-        self.count.assign(0.0)
+        self.counts.assign(tf.zeros_like(self.counts))
 
 
-def mean_iou(labels, predictions, masks, input_type, epsilon=config.EPSILON):
-    confusion_matrix = compute_confusion_matrix(
-        labels, predictions, masks, input_type
-    )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    row_sum = tf.math.reduce_sum(confusion_matrix, axis=1)
-    col_sum = tf.math.reduce_sum(confusion_matrix, axis=0)
-    iou = diagonal / (row_sum + col_sum - diagonal + epsilon)
-    mean_iou = tf.math.reduce_mean(iou)
-    return tf.identity(mean_iou, name="{}/{}".format(input_type, "mean_iou"))
+class ConfusionMetric(tf.keras.metrics.Metric):
+    """Reads one metric off shared `ConfusionMatrices`.
 
+    Keras updates and resets every metric it is given, so only the view
+    that `owns` the matrices updates and resets them.
+    """
 
-class FrequencyWeightedAccuracy(tf.keras.metrics.Metric):
-    def __init__(self, name="frequency_weighted_accuracy", **kwargs):
-        super(FrequencyWeightedAccuracy, self).__init__(name=name, **kwargs)
-        self.frequency_weighted_accuracy_sum = self.add_weight(
-            name="frequency_weighted_accuracy_sum", initializer="zeros"
-        )
-        self.count = self.add_weight(
-            name="frequency_weighted_accuracy_count", initializer="zeros"
-        )
+    def __init__(self, matrices, name, owns=False, **kwargs):
+        super(ConfusionMetric, self).__init__(name=name, **kwargs)
+        self.matrices = matrices
+        self.owns = owns
+        self.input_type, self.metric_name = name.split("/")
 
     def update_state(self, y_true, y_pred, sample_weight=None):
-        masks = y_true[:, :, :, 0]
-        ground_truth = y_true[:, :, :, 1:]
-        value = frequency_weighted_accuracy(
-            ground_truth, y_pred, masks, self.name.split("/")[0]
-        )
-        self.frequency_weighted_accuracy_sum.assign_add(value)
-        self.count.assign_add(1.0)
+        if self.owns:
+            self.matrices.update_state(y_true, y_pred)
 
     def result(self):
-        return tf.math.divide_no_nan(
-            self.frequency_weighted_accuracy_sum, self.count
+        value = METRICS[self.metric_name](
+            self.matrices.confusion_matrix(self.input_type)
         )
+        return tf.cast(value, self.dtype)
 
-    def reset_states(self):
-        # The state of the metric will be reset at the start of each epoch.
-        self.frequency_weighted_accuracy_sum.assign(0.0)
-        self.count.assign(0.0)
-
-
-def frequency_weighted_accuracy(
-    labels, predictions, masks, input_type, epsilon=config.EPSILON
-):
-    confusion_matrix = compute_confusion_matrix(
-        labels, predictions, masks, input_type
-    )
-    diagonal = tf.linalg.diag_part(confusion_matrix)
-    columns = tf.math.reduce_sum(confusion_matrix, axis=1)
-    rows = tf.math.reduce_sum(confusion_matrix, axis=0)
-    total_sum = tf.math.reduce_sum(confusion_matrix)
-    iou = diagonal / (columns + rows - diagonal + epsilon)
-    frequency = columns / (total_sum + epsilon)
-    fwaccuracy = tf.math.reduce_sum(
-        tf.boolean_mask(frequency, tf.greater(frequency, 0))
-        * tf.boolean_mask(iou, tf.greater(frequency, 0))
-    )
-    return tf.identity(
-        fwaccuracy, name="{}/{}".format(input_type, "fwaccuracy")
-    )
+    def reset_state(self):
+        if self.owns:
+            self.matrices.reset_state()
 
 
 def keras_psenet_metrics():
-    ingots = {
-        "overall_accuracy": OverallAccuracy,
-        "mean_accuracy": MeanAccuracy,
-        "mean_iou": MeanIoU,
-        "frequency_weighted_accuracy": FrequencyWeightedAccuracy,
-        "precision": Precision,
-        "recall": Recall,
-        "f1_score": F1Score,
-    }
+    matrices = ConfusionMatrices()
     metrics = []
     for m_type in [config.KERNEL_METRICS, config.TEXT_METRICS]:
-        for name, Metric in ingots.items():
-            metrics.append(Metric(name="{}/{}".format(m_type, name)))
+        for name in METRICS:
+            metrics.append(
+                ConfusionMetric(
+                    matrices,
+                    name="{}/{}".format(m_type, name),
+                    owns=not metrics,
+                )
+            )
     return metrics
 
 
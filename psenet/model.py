@@ -4,12 +4,16 @@ from psenet.nets.fpn import FPN
 
 
 def build_model(params):
+    # The crops of a fixed size make the input shape static.
+    side = None
+    if getattr(params, "fixed_crop", False):
+        side = params.resize_length // 2
     images = tf.keras.Input(
-        shape=[None, None, 3], name=config.IMAGE, dtype=tf.float32
+        shape=[side, side, 3], name=config.IMAGE, dtype=tf.float32
     )
     kernels = FPN(
         backbone_name=params.backbone_name,
-        input_shape=(None, None, 3),
+        input_shape=(side, side, 3),
         classes=params.kernel_num,
         activation="linear",
         weights=None,
@@ -171,7 +171,10 @@ def build_fpn(
         kernel_initializer="glorot_uniform",
         name="head_conv",
     )(x)
-    x = tf.keras.layers.Activation(activation, name=activation)(x)
+    # The outputs stay float32 under a mixed precision policy.
+    x = tf.keras.layers.Activation(
+        activation, name=activation, dtype="float32"
+    )(x)
 
     # create keras model instance
     model = tf.keras.Model(input_, x)
@@ -3,7 +3,7 @@ import tensorflow as tf
 
 
 def build_optimizer(FLAGS):
-    return tf.keras.optimizers.SGD(
+    optimizer = tf.keras.optimizers.SGD(
         learning_rate=tf.keras.optimizers.schedules.ExponentialDecay(
             FLAGS.learning_rate,
             decay_steps=FLAGS.decay_steps,
@@ -12,3 +12,8 @@ def build_optimizer(FLAGS):
         ),
         momentum=config.MOMENTUM,
     )
+    # Small float16 gradients underflow unless the loss is scaled up;
+    # bfloat16 has the range of float32 and needs no scaling.
+    if getattr(FLAGS, "mixed_precision", None) == "float16":
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
@@ -0,0 +1,196 @@
+import argparse
+import collections
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from psenet import config
+from psenet.backbones.factory import Backbones
+from psenet.data.preprocess import adjust_side
+from psenet.model import build_model
+from psenet.pse import pse_batch
+
+
+class Predictor:
+    """Detects text lines in lists of images within the current process.
+
+    Every image is resized like in training, so that its longer side is at
+    most `resize_length` and both sides are multiples of `config.MIN_SIDE`.
+    Images whose sides round up to the same multiple of `bucket_step` go to
+    the same bucket, where they are zero-padded to a common shape and run
+    through the model and the expansion `batch_size` at a time.
+    """
+
+    def __init__(
+        self,
+        model_dir=config.MODEL_DIR,
+        backbone_name=config.BACKBONE_NAME,
+        kernel_num=config.KERNEL_NUM,
+        batch_size=config.BATCH_SIZE,
+        resize_length=config.RESIZE_LENGTH,
+        bucket_step=2 * config.MIN_SIDE,
+        min_area=config.MIN_KERNEL_AREA,
+        num_threads=0,
+        model=None,
+    ):
+        if model is None:
+            params = argparse.Namespace(
+                backbone_name=backbone_name,
+                kernel_num=kernel_num,
+                encoder_weights=None,
+            )
+            model = build_model(params)
+            model.load_weights(tf.train.latest_checkpoint(model_dir))
+        self.model = model
+        self.preprocess = Backbones.get_preprocessing(backbone_name)
+        self.batch_size = batch_size
+        self.resize_length = resize_length
+        self.bucket_step = bucket_step
+        self.min_area = min_area
+        self.num_threads = num_threads
+
+    def _resize(self, image):
+        height, width = image.shape[:2]
+        ratio = min(1.0, self.resize_length / max(height, width))
+        return cv2.resize(
+            image,
+            (
+                adjust_side(round(width * ratio)),
+                adjust_side(round(height * ratio)),
+            ),
+            interpolation=cv2.INTER_LINEAR,
+        )
+
+    def _bucket(self, shape):
+        return tuple(
+            -(-side // self.bucket_step) * self.bucket_step
+            for side in shape[:2]
+        )
+
+    def _predict_batch(self, images, shape):
+        batch = np.zeros([len(images), *shape, 3], dtype="float32")
+        for i, image in enumerate(images):
+            height, width = image.shape[:2]
+            batch[i, :height, :width] = self.preprocess(
+                image.astype("float32")
+            )
+
+        logits = self.model.predict_on_batch({config.IMAGE: batch})
+        if isinstance(logits, dict):
+            logits = logits[config.KERNELS]
+        logits = np.asarray(logits)
+
+        kernels = logits > 0
+        kernels &= kernels[..., :1]
+        for i, image in enumerate(images):
+            # Nothing may grow into the padding.
+            height, width = image.shape[:2]
+            kernels[i, height:] = False
+            kernels[i, :, width:] = False
+        labels = pse_batch(
+            np.ascontiguousarray(kernels.transpose([0, 3, 1, 2])),
+            self.min_area,
+            self.num_threads,
+        )
+        scores = 1 / (1 + np.exp(-logits[..., 0]))
+        return labels, scores
+
+    def predict(self, images):
+        """Runs the model and the expansion on a list of RGB images.
+
+        Returns one dict per image, in order, with the `(H, W)` int32 text
+        line `config.LABELS` and float32 `config.TEXT` scores at the size of
+        that image.
+        """
+        buckets = collections.defaultdict(list)
+        for index, image in enumerate(images):
+            resized = self._resize(np.asarray(image))
+            buckets[self._bucket(resized.shape)].append((index, resized))
+
+        predictions = [None] * len(images)
+        for shape, members in buckets.items():
+            for start in range(0, len(members), self.batch_size):
+                chunk = members[start : start + self.batch_size]
+                labels, scores = self._predict_batch(
+                    [resized for _, resized in chunk], shape
+                )
+                for i, (index, resized) in enumerate(chunk):
+                    height, width = np.asarray(images[index]).shape[:2]
+                    resized_height, resized_width = resized.shape[:2]
+                    predictions[index] = {
+                        config.LABELS: cv2.resize(
+                            labels[i, :resized_height, :resized_width],
+                            (width, height),
+                            interpolation=cv2.INTER_NEAREST,
+                        ),
+                        config.TEXT: cv2.resize(
+                            scores[i, :resized_height, :resized_width],
+                            (width, height),
+                            interpolation=cv2.INTER_LINEAR,
+                        ),
+                    }
+        return predictions
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "images", help="The paths of the images to read", nargs="+"
+    )
+    PARSER.add_argument(
+        "--model-dir",
+        help="The directory with the model",
+        default=config.MODEL_DIR,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--backbone-name",
+        help="The name of the FPN backbone",
+        default=config.BACKBONE_NAME,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of output kernels from FPN",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--batch-size",
+        help="The number of images per model call",
+        default=8,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--resize-length",
+        help="The maximum side of the images fed to the model",
+        default=config.RESIZE_LENGTH,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--min-area",
+        help="The minimum area of the seed kernels",
+        default=config.MIN_KERNEL_AREA,
+        type=float,
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    predictor = Predictor(
+        model_dir=FLAGS.model_dir,
+        backbone_name=FLAGS.backbone_name,
+        kernel_num=FLAGS.kernel_num,
+        batch_size=FLAGS.batch_size,
+        resize_length=FLAGS.resize_length,
+        min_area=FLAGS.min_area,
+    )
+    images = [
+        cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        for path in FLAGS.images
+    ]
+    for path, prediction in zip(FLAGS.images, predictor.predict(images)):
+        print(
+            "{}: {} text lines".format(
+                path, len(np.unique(prediction[config.LABELS])) - 1
+            )
+        )
@@ -1,19 +1,81 @@
-import subprocess
-import os
+import warnings
+
 import numpy as np
-import time
 
-BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+from psenet import config
+
+try:
+    from . import adaptor as _adaptor
+except ImportError:
+    # The extension is built by `setup.py`; without it every entry point
+    # runs on NumPy/SciPy, with the same results but slower.
+    warnings.warn(
+        "The PSE extension is not built, using the NumPy fallback. "
+        "Run `python setup.py build_ext --inplace` to build it."
+    )
+    from . import fallback as _adaptor
+
+NATIVE = _adaptor.__name__.endswith(".adaptor")
+
+
+def _as_uint8_kernels(kernels):
+    kernels = np.ascontiguousarray(kernels)
+    if kernels.dtype == np.bool_:
+        kernels = kernels.view(np.uint8)
+    if kernels.dtype != np.uint8:
+        raise TypeError(
+            "Expected uint8 or bool kernels, got {}.".format(kernels.dtype)
+        )
+    return kernels
+
+
+def pse(polys, min_area, out=None):
+    """Runs PSE on a `(K, H, W)` kernel stack.
+
+    Returns the `(H, W)` int32 label map. Passing a C-contiguous int32 `out`
+    of that shape makes the adaptor overwrite it instead of allocating.
+    """
+    return _adaptor.pse(polys, min_area, out)
+
+
+def pse_uint8(kernels, min_area, out=None):
+    """Runs PSE on a `(K, H, W)` uint8 or bool kernel stack without copying.
+
+    The kernels are handed to the adaptor as-is, so C-contiguous uint8 input
+    skips both the int32 cast and the per-pixel copy done by `pse`. `out`
+    is reused the same way as in `pse`.
+    """
+    return _adaptor.pse_uint8(_as_uint8_kernels(kernels), min_area, out)
+
+
+def pse_batch(kernels, min_area, num_threads=0):
+    """Runs PSE on a `(N, K, H, W)` uint8 or bool batch of kernel stacks.
 
-if subprocess.call(["make", "-C", BASE_DIR]) != 0:
-    raise RuntimeError("Cannot compile pse: {}".format(BASE_DIR))
+    The GIL is released and the images are expanded in parallel on
+    `num_threads` threads, all available cores if it is not positive.
+    Returns the stacked `(N, H, W)` int32 label maps.
+    """
+    return _adaptor.pse_batch(
+        _as_uint8_kernels(kernels), min_area, num_threads
+    )
 
-from .adaptor import pse as cpse
 
+def extract_instances(
+    labels,
+    scores,
+    min_area=config.MIN_TEXT_AREA,
+    min_score=config.MIN_TEXT_SCORE,
+    mode="rect",
+):
+    """Turns a PSE label map into text instances in one pass.
 
-def pse(polys, min_area):
-    # start = time.time()
-    ret = np.array(cpse(polys, min_area), dtype="int32")
-    # end = time.time()
-    # print (end - start), 's'
-    return ret
+    `scores` is the `(H, W)` text score map. Instances smaller than
+    `min_area` pixels or with a mean score below `min_score` are dropped.
+    Returns a dict with the kept `labels`, their pixel `areas`, mean
+    `scores`, `[x_min, y_min, x_max, y_max]` `bboxes` and `polygons`: a
+    `(M, 4, 2)` float32 array of min-area rectangles if `mode` is "rect", or
+    a list of `(P, 2)` int32 outlines if `mode` is "contour".
+    """
+    return _adaptor.extract_instances(
+        labels, scores, min_area, min_score, mode
+    )
@@ -1,7 +1,7 @@
 import numpy as np
 
 
-from . import merge_quadrangle_n9
+from .nms import merge_quadrangle_n9
 
 if __name__ == "__main__":
     # unit square with confidence 1
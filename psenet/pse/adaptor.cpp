@@ -3,132 +3,451 @@
 #include "pybind11/stl.h"
 #include "pybind11/stl_bind.h"
 
-#include <iostream>
-#include <queue>
+#include <algorithm>
+#include <atomic>
+#include <cstring>
+#include <exception>
+#include <limits>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <thread>
 
-#include <opencv2/core/core.hpp>
-#include <opencv2/highgui/highgui.hpp>
-#include <opencv2/imgproc/imgproc.hpp>
-#include <opencv2/opencv.hpp>
+#include "postprocess.h"
 
 using namespace std;
-using namespace cv;
 
 namespace py = pybind11;
 
 namespace pse_adaptor {
+struct KernelStack {
+  // Owns the pixels only when the input had to be converted.
+  vector<uint8_t> storage;
+  // One (rows, cols) plane per kernel, from the largest to the smallest.
+  vector<const uint8_t *> planes;
+  int rows = 0, cols = 0;
+};
+
 void get_kernels(const int *data, vector<long int> data_shape,
-                 vector<Mat> &kernels) {
+                 KernelStack &kernels) {
+  long int plane = data_shape[1] * data_shape[2];
+  kernels.rows = data_shape[1];
+  kernels.cols = data_shape[2];
+  kernels.storage.resize(data_shape[0] * plane);
+  for (long int i = 0; i < data_shape[0] * plane; ++i) {
+    // Only the low byte counts, as it did when the kernels were char Mats.
+    kernels.storage[i] = (uint8_t)data[i];
+  }
   for (int i = 0; i < data_shape[0]; ++i) {
-    Mat kernel = Mat::zeros(data_shape[1], data_shape[2], CV_8UC1);
-    for (int x = 0; x < kernel.rows; ++x) {
-      for (int y = 0; y < kernel.cols; ++y) {
-        kernel.at<char>(x, y) =
-            data[i * data_shape[1] * data_shape[2] + x * data_shape[2] + y];
+    kernels.planes.push_back(kernels.storage.data() + i * plane);
+  }
+}
+
+void wrap_kernels(const uint8_t *data, vector<long int> data_shape,
+                  KernelStack &kernels) {
+  // Views over the caller's buffer: no allocation, no copy.
+  long int plane = data_shape[1] * data_shape[2];
+  kernels.rows = data_shape[1];
+  kernels.cols = data_shape[2];
+  for (int i = 0; i < data_shape[0]; ++i) {
+    kernels.planes.push_back(data + i * plane);
+  }
+}
+
+struct Run {
+  int row, start, end;
+  int32_t label;
+};
+
+int32_t find_root(vector<int32_t> &parent, int32_t label) {
+  while (parent[label] != label) {
+    parent[label] = parent[parent[label]];
+    label = parent[label];
+  }
+  return label;
+}
+
+/**
+ * Appends the runs of non-zero pixels of one row, skipping eight background
+ * pixels at a time.
+ */
+void find_runs(const uint8_t *row, int row_id, int cols, vector<Run> &runs) {
+  int y = 0;
+  while (y < cols) {
+    uint64_t word;
+    while (y + 8 <= cols && (memcpy(&word, row + y, 8), word == 0)) y += 8;
+    while (y < cols && row[y] == 0) ++y;
+    if (y == cols) break;
+    int start = y;
+    while (y < cols && row[y] != 0) ++y;
+    runs.push_back({row_id, start, y, 0});
+  }
+}
+
+/**
+ * 4-connected component labelling of the non-zero pixels of `image`.
+ * Components are numbered from 1 in the raster order of their first pixel,
+ * as cv::connectedComponents does. The returned runs cover every foreground
+ * pixel in raster order and carry their final label, or 0 for components
+ * smaller than `min_area`; the other labels are not renumbered.
+ */
+vector<Run> connected_components(const uint8_t *image, int rows, int cols,
+                                 float min_area) {
+  // First pass: provisional labels, with every equivalence class rooted at
+  // its smallest, i.e. earliest, provisional label.
+  vector<Run> runs;
+  vector<int32_t> parent = {0};
+  vector<long int> provisional_area = {0};
+  size_t up_begin = 0, up_end = 0;
+  for (int x = 0; x < rows; ++x) {
+    size_t begin = runs.size();
+    find_runs(image + (long int)x * cols, x, cols, runs);
+    size_t up = up_begin;
+    for (size_t i = begin; i < runs.size(); ++i) {
+      Run &run = runs[i];
+      while (up < up_end && runs[up].end <= run.start) ++up;
+      // Runs of the previous row overlapping this one share its component.
+      for (size_t j = up; j < up_end && runs[j].start < run.end; ++j) {
+        int32_t root = find_root(parent, runs[j].label);
+        if (run.label == 0) {
+          run.label = root;
+        } else if (root != run.label) {
+          parent[max(root, run.label)] = min(root, run.label);
+          run.label = min(root, run.label);
+        }
       }
+      if (run.label == 0) {
+        run.label = parent.size();
+        parent.push_back(run.label);
+        provisional_area.push_back(0);
+      }
+      provisional_area[run.label] += run.end - run.start;
     }
-    kernels.emplace_back(kernel);
+    up_begin = begin;
+    up_end = runs.size();
   }
-}
 
-void growing_text_line(vector<Mat> &kernels, vector<vector<int>> &text_line,
-                       float min_area) {
-  Mat label_mat;
-  int label_num =
-      connectedComponents(kernels[kernels.size() - 1], label_mat, 4);
-
-  // cout << "label num: " << label_num << endl;
-
-  int area[label_num + 1];
-  memset(area, 0, sizeof(area));
-  for (int x = 0; x < label_mat.rows; ++x) {
-    for (int y = 0; y < label_mat.cols; ++y) {
-      int label = label_mat.at<int>(x, y);
-      if (label == 0) continue;
-      area[label] += 1;
+  // Every parent is smaller than its child, so one increasing sweep resolves
+  // the final labels. Roots are met in creation order, which numbers the
+  // components in raster order.
+  vector<int32_t> final_label(parent.size(), 0);
+  vector<long int> area = {0};
+  for (size_t label = 1; label < parent.size(); ++label) {
+    if (parent[label] == (int32_t)label) {
+      final_label[label] = area.size();
+      area.push_back(0);
+    } else {
+      final_label[label] = final_label[parent[label]];
     }
+    area[final_label[label]] += provisional_area[label];
   }
+  for (size_t label = 1; label < parent.size(); ++label) {
+    if (area[final_label[label]] < min_area) final_label[label] = 0;
+  }
+  for (Run &run : runs) {
+    run.label = final_label[run.label];
+  }
+  return runs;
+}
 
-  queue<Point> queue, next_queue;
-  for (int x = 0; x < label_mat.rows; ++x) {
-    vector<int> row(label_mat.cols);
-    for (int y = 0; y < label_mat.cols; ++y) {
-      int label = label_mat.at<int>(x, y);
+/**
+ * The progressive scale expansion engine. Labels live in a flat map with a
+ * one pixel border of -1, which is never claimed, so neighbours need no
+ * bounds checks. The frontier of every kernel level is one preallocated
+ * buffer used as a queue: claimed pixels are appended at the tail while the
+ * pixels that claimed nothing are compacted in front of the head, in order,
+ * to become the queue of the next level. The buffers are kept between
+ * calls, so one engine should serve a whole batch.
+ */
+class Expansion {
+ public:
+  void run(const KernelStack &kernels, float min_area, int32_t *text_line);
 
-      if (label == 0) continue;
-      if (area[label] < min_area) continue;
+ private:
+  struct Pixel {
+    // Positions in the bordered label map and in the kernels.
+    int32_t padded, flat;
+  };
 
-      Point point(x, y);
-      queue.push(point);
-      row[y] = label;
-    }
-    text_line.emplace_back(row);
+  vector<int32_t> labels;
+  vector<Pixel> frontier;
+};
+
+void Expansion::run(const KernelStack &kernels, float min_area,
+                    int32_t *text_line) {
+  int rows = kernels.rows;
+  int cols = kernels.cols;
+  int32_t stride = cols + 2;
+  if ((long int)(rows + 2) * stride > numeric_limits<int32_t>::max()) {
+    throw invalid_argument("the kernels are too large");
   }
 
-  // cout << "ok" << endl;
+  labels.assign((long int)(rows + 2) * stride, 0);
+  fill(labels.begin(), labels.begin() + stride, -1);
+  fill(labels.end() - stride, labels.end(), -1);
+  for (int x = 1; x <= rows; ++x) {
+    labels[x * stride] = labels[x * stride + cols + 1] = -1;
+  }
+  // Every pixel is queued at most once per level, edges included.
+  frontier.resize((long int)rows * cols);
+
+  size_t tail = 0;
+  for (const Run &run : connected_components(kernels.planes.back(), rows,
+                                             cols, min_area)) {
+    if (run.label == 0) continue;
+    for (int y = run.start; y < run.end; ++y) {
+      int32_t padded = (run.row + 1) * stride + y + 1;
+      labels[padded] = run.label;
+      frontier[tail++] = {padded, run.row * cols + y};
+    }
+  }
 
-  int dx[] = {-1, 1, 0, 0};
-  int dy[] = {0, 0, -1, 1};
+  // Up, down, left, right.
+  const int32_t padded_offsets[] = {-stride, stride, -1, 1};
+  const int32_t flat_offsets[] = {-cols, cols, -1, 1};
 
-  for (int kernel_id = kernels.size() - 2; kernel_id >= 0; --kernel_id) {
-    while (!queue.empty()) {
-      Point point = queue.front();
-      queue.pop();
-      int x = point.x;
-      int y = point.y;
-      int label = text_line[x][y];
-      // cout << text_line.size() << ' ' << text_line[0].size() << ' ' << x << '
-      // ' << y << endl;
+  for (int kernel_id = kernels.planes.size() - 2; kernel_id >= 0;
+       --kernel_id) {
+    const uint8_t *kernel = kernels.planes[kernel_id];
+    size_t head = 0, edges = 0;
+    while (head < tail) {
+      Pixel pixel = frontier[head++];
+      int32_t label = labels[pixel.padded];
 
       bool is_edge = true;
       for (int d = 0; d < 4; ++d) {
-        int tmp_x = x + dx[d];
-        int tmp_y = y + dy[d];
+        int32_t neighbour = pixel.padded + padded_offsets[d];
+        if (labels[neighbour] != 0) continue;
+        int32_t flat = pixel.flat + flat_offsets[d];
+        if (kernel[flat] == 0) continue;
 
-        if (tmp_x < 0 || tmp_x >= (int)text_line.size()) continue;
-        if (tmp_y < 0 || tmp_y >= (int)text_line[1].size()) continue;
-        if (kernels[kernel_id].at<char>(tmp_x, tmp_y) == 0) continue;
-        if (text_line[tmp_x][tmp_y] > 0) continue;
-
-        Point point(tmp_x, tmp_y);
-        queue.push(point);
-        text_line[tmp_x][tmp_y] = label;
+        labels[neighbour] = label;
+        frontier[tail++] = {neighbour, flat};
         is_edge = false;
       }
 
       if (is_edge) {
-        next_queue.push(point);
+        frontier[edges++] = pixel;
       }
     }
-    swap(queue, next_queue);
+    tail = edges;
+  }
+
+  for (int x = 0; x < rows; ++x) {
+    const int32_t *row = labels.data() + (x + 1) * stride + 1;
+    copy(row, row + cols, text_line + (long int)x * cols);
   }
 }
 
-vector<vector<int>> pse(
+py::array_t<int32_t> get_text_line(py::object out, long int rows,
+                                   long int cols) {
+  // Either a fresh (H, W) label map or the caller's reusable one.
+  if (out.is_none()) {
+    return py::array_t<int32_t>({rows, cols});
+  }
+  if (!py::isinstance<py::array_t<int32_t, py::array::c_style>>(out)) {
+    throw invalid_argument("out must be a C-contiguous int32 array");
+  }
+  auto text_line = out.cast<py::array_t<int32_t, py::array::c_style>>();
+  if (text_line.ndim() != 2 || text_line.shape(0) != rows ||
+      text_line.shape(1) != cols) {
+    throw invalid_argument("out must have the (H, W) shape of the kernels");
+  }
+  return text_line;
+}
+
+py::array_t<int32_t> pse(
     py::array_t<int, py::array::c_style | py::array::forcecast> quad_n9,
-    float min_area) {
+    float min_area, py::object out) {
   auto buf = quad_n9.request();
+  if (buf.ndim != 3 || buf.shape[0] < 1) {
+    throw invalid_argument("expected a non-empty (K, H, W) kernel stack");
+  }
   auto data = static_cast<int *>(buf.ptr);
-  vector<Mat> kernels;
+  KernelStack kernels;
   get_kernels(data, buf.shape, kernels);
 
-  // cout << "min_area: " << min_area << endl;
-  // for (int i = 0; i < kernels.size(); ++i) {
-  //     cout << "kernel" << i <<" shape: " << kernels[i].rows << ' ' <<
-  //     kernels[i].cols << endl;
-  // }
+  auto text_line = get_text_line(out, buf.shape[1], buf.shape[2]);
+  Expansion().run(kernels, min_area, text_line.mutable_data());
 
-  vector<vector<int>> text_line;
-  growing_text_line(kernels, text_line, min_area);
+  return text_line;
+}
+
+py::array_t<int32_t> pse_uint8(
+    py::array_t<uint8_t, py::array::c_style> kernels_stack, float min_area,
+    py::object out) {
+  auto buf = kernels_stack.request();
+  if (buf.ndim != 3 || buf.shape[0] < 1) {
+    throw invalid_argument("expected a non-empty (K, H, W) kernel stack");
+  }
+  KernelStack kernels;
+  wrap_kernels(static_cast<uint8_t *>(buf.ptr), buf.shape, kernels);
+
+  auto text_line = get_text_line(out, buf.shape[1], buf.shape[2]);
+  Expansion().run(kernels, min_area, text_line.mutable_data());
 
   return text_line;
 }
-}  // namespace pse_adaptor
 
-PYBIND11_PLUGIN(adaptor) {
-  py::module m("adaptor", "pse");
+py::array_t<int32_t> pse_batch(
+    py::array_t<uint8_t, py::array::c_style> kernels_batch, float min_area,
+    int num_threads) {
+  auto buf = kernels_batch.request();
+  if (buf.ndim != 4 || buf.shape[1] < 1) {
+    throw invalid_argument("expected a (N, K, H, W) batch of kernel stacks");
+  }
+  long int batch_size = buf.shape[0];
+  long int kernel_num = buf.shape[1];
+  long int rows = buf.shape[2];
+  long int cols = buf.shape[3];
+  long int image_size = kernel_num * rows * cols;
+
+  py::array_t<int32_t> text_lines({batch_size, rows, cols});
+  auto data = static_cast<uint8_t *>(buf.ptr);
+  auto labels = text_lines.mutable_data();
+
+  {
+    // Images are independent, so every worker pulls the next unclaimed one
+    // and expands it without touching any Python object.
+    py::gil_scoped_release release;
+
+    if (num_threads <= 0) {
+      num_threads = max(1, (int)thread::hardware_concurrency());
+    }
+    num_threads = (int)min((long int)num_threads, max(batch_size, 1L));
+
+    atomic<long int> next_image(0);
+    exception_ptr error = nullptr;
+    mutex error_mutex;
+    auto worker = [&]() {
+      try {
+        Expansion expansion;
+        for (long int i = next_image++; i < batch_size; i = next_image++) {
+          KernelStack kernels;
+          wrap_kernels(data + i * image_size, {kernel_num, rows, cols},
+                       kernels);
+          expansion.run(kernels, min_area, labels + i * rows * cols);
+        }
+      } catch (...) {
+        lock_guard<mutex> lock(error_mutex);
+        if (!error) error = current_exception();
+      }
+    };
+
+    vector<thread> threads;
+    for (int t = 1; t < num_threads; ++t) {
+      threads.emplace_back(worker);
+    }
+    worker();
+    for (auto &t : threads) {
+      t.join();
+    }
+    if (error) {
+      rethrow_exception(error);
+    }
+  }
+
+  return text_lines;
+}
+
+py::dict extract_instances(
+    py::array_t<int32_t, py::array::c_style | py::array::forcecast> label_map,
+    py::array_t<float, py::array::c_style | py::array::forcecast> score_map,
+    float min_area, float min_score, const string &mode) {
+  auto labels_buf = label_map.request();
+  auto scores_buf = score_map.request();
+  if (labels_buf.ndim != 2 || labels_buf.shape != scores_buf.shape) {
+    throw invalid_argument("expected (H, W) labels and scores");
+  }
+  if (mode != "rect" && mode != "contour") {
+    throw invalid_argument("mode must be either 'rect' or 'contour'");
+  }
+  bool with_contours = mode == "contour";
+  int rows = labels_buf.shape[0];
+  int cols = labels_buf.shape[1];
+  auto labels = static_cast<int32_t *>(labels_buf.ptr);
+  auto scores = static_cast<float *>(scores_buf.ptr);
+
+  vector<postprocess::Instance> kept;
+  vector<postprocess::Point> rects;
+  vector<vector<int>> contours;
+  {
+    py::gil_scoped_release release;
+    auto instances =
+        postprocess::collect_instances(labels, scores, rows, cols);
+    for (auto &instance : instances) {
+      if (instance.area == 0 || instance.area < min_area) continue;
+      if (instance.score_sum / instance.area < min_score) continue;
+
+      if (with_contours) {
+        contours.emplace_back(
+            postprocess::trace_contour(labels, rows, cols, instance));
+      } else {
+        postprocess::Point corners[4];
+        postprocess::min_area_rect(
+            postprocess::convex_hull(instance.row_extremes), corners);
+        rects.insert(rects.end(), corners, corners + 4);
+      }
+      instance.row_extremes = {};
+      kept.emplace_back(move(instance));
+    }
+  }
+
+  long int count = kept.size();
+  py::array_t<int32_t> kept_labels(count);
+  py::array_t<int64_t> areas(count);
+  py::array_t<float> mean_scores(count);
+  py::array_t<int32_t> bboxes({count, 4L});
+  auto bboxes_data = bboxes.mutable_data();
+  for (long int i = 0; i < count; ++i) {
+    kept_labels.mutable_data()[i] = kept[i].label;
+    areas.mutable_data()[i] = kept[i].area;
+    mean_scores.mutable_data()[i] = kept[i].score_sum / kept[i].area;
+    bboxes_data[4 * i] = kept[i].min_x;
+    bboxes_data[4 * i + 1] = kept[i].min_y;
+    bboxes_data[4 * i + 2] = kept[i].max_x;
+    bboxes_data[4 * i + 3] = kept[i].max_y;
+  }
+
+  py::dict result;
+  result["labels"] = kept_labels;
+  result["areas"] = areas;
+  result["scores"] = mean_scores;
+  result["bboxes"] = bboxes;
+  if (with_contours) {
+    py::list polygons;
+    for (auto &contour : contours) {
+      long int points = contour.size() / 2;
+      py::array_t<int32_t> polygon({points, 2L});
+      copy(contour.begin(), contour.end(), polygon.mutable_data());
+      polygons.append(polygon);
+    }
+    result["polygons"] = polygons;
+  } else {
+    py::array_t<float> polygons({count, 4L, 2L});
+    auto corners = reinterpret_cast<const float *>(rects.data());
+    copy(corners, corners + 2 * rects.size(), polygons.mutable_data());
+    result["polygons"] = polygons;
+  }
+  return result;
+}
+}  // namespace pse_adaptor
 
-  m.def("pse", &pse_adaptor::pse, "pse");
+PYBIND11_MODULE(adaptor, m) {
+  m.doc() = "pse";
 
-  return m.ptr();
+  m.def("pse", &pse_adaptor::pse, "pse", py::arg("kernels"),
+        py::arg("min_area"), py::arg("out") = py::none());
+  m.def("pse_uint8", &pse_adaptor::pse_uint8,
+        "pse over a C-contiguous uint8 kernel stack, without copying",
+        py::arg("kernels").noconvert(), py::arg("min_area"),
+        py::arg("out") = py::none());
+  m.def("pse_batch", &pse_adaptor::pse_batch,
+        "pse over a (N, K, H, W) uint8 batch, one image per thread",
+        py::arg("kernels").noconvert(), py::arg("min_area"),
+        py::arg("num_threads") = 0);
+  m.def("extract_instances", &pse_adaptor::extract_instances,
+        "per-instance statistics and polygons of a label map",
+        py::arg("labels"), py::arg("scores"), py::arg("min_area"),
+        py::arg("min_score"), py::arg("mode") = "rect");
 }
\ No newline at end of file
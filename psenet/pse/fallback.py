@@ -0,0 +1,185 @@
+"""NumPy/SciPy implementation of the adaptor, used when it is not built.
+
+The functions mirror the signatures of `psenet.pse.adaptor` and return the
+same label maps. The expansion reproduces the queue order of the C++
+breadth-first search one layer at a time, so contested pixels go to the same
+instance as in `growing_text_line`.
+"""
+
+import numpy as np
+from scipy import ndimage
+
+_FOUR_CONNECTIVITY = ndimage.generate_binary_structure(2, 1)
+
+
+def _check_kernels(kernels, ndim, description):
+    if kernels.ndim != ndim or kernels.shape[ndim - 3] < 1:
+        raise ValueError("expected a non-empty {}".format(description))
+
+
+def _check_out(out, shape):
+    if out is None:
+        return np.empty(shape, dtype=np.int32)
+    if (
+        not isinstance(out, np.ndarray)
+        or out.dtype != np.int32
+        or not out.flags.c_contiguous
+    ):
+        raise ValueError("out must be a C-contiguous int32 array")
+    if out.shape != tuple(shape):
+        raise ValueError("out must have the (H, W) shape of the kernels")
+    return out
+
+
+def _expand(frontier, text_line, kernel, cols):
+    """Runs one kernel level of the breadth-first search.
+
+    `frontier` holds flat pixel indices in queue order. Every layer claims
+    the unlabelled kernel pixels next to it; a pixel reachable from several
+    frontier pixels goes to the first one in queue order, trying the up,
+    down, left and right neighbours in turn, exactly like the C++ queue.
+    Frontier pixels that claim nothing are returned, in order, as the queue
+    for the next kernel.
+    """
+    size = text_line.size
+    edges = []
+    while frontier.size:
+        rows, columns = np.divmod(frontier, cols)
+        candidates = np.stack(
+            [frontier - cols, frontier + cols, frontier - 1, frontier + 1],
+            axis=1,
+        )
+        valid = np.stack(
+            [
+                rows > 0,
+                frontier + cols < size,
+                columns > 0,
+                columns < cols - 1,
+            ],
+            axis=1,
+        )
+        candidates = np.where(valid, candidates, 0)
+        valid &= kernel[candidates] & (text_line[candidates] == 0)
+
+        owners = np.repeat(np.arange(frontier.size), 4).reshape(-1, 4)
+        candidates = candidates[valid]
+        owners = owners[valid]
+        claimed, first = np.unique(candidates, return_index=True)
+        order = np.argsort(first, kind="stable")
+        claimed = claimed[order]
+        claimers = owners[first[order]]
+
+        text_line[claimed] = text_line[frontier[claimers]]
+        is_edge = np.ones(frontier.size, dtype=bool)
+        is_edge[claimers] = False
+        edges.append(frontier[is_edge])
+        frontier = claimed
+    if not edges:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(edges)
+
+
+def _growing_text_line(kernels, text_line, min_area):
+    _, rows, cols = kernels.shape
+    labels, _ = ndimage.label(kernels[-1], structure=_FOUR_CONNECTIVITY)
+    labels = labels.ravel()
+    area = np.bincount(labels)
+
+    text_line = text_line.reshape(-1)
+    text_line[:] = np.where(
+        (labels > 0) & (area[labels] >= min_area), labels, 0
+    )
+    frontier = np.flatnonzero(text_line)
+
+    for kernel_id in range(kernels.shape[0] - 2, -1, -1):
+        kernel = kernels[kernel_id].reshape(-1)
+        frontier = _expand(frontier, text_line, kernel, cols)
+
+
+def _as_binary(kernels):
+    # The adaptor stores each value in a char, so only the low byte counts.
+    kernels = np.asarray(kernels)
+    if kernels.dtype != np.bool_:
+        kernels = kernels.astype(np.int32).astype(np.uint8) != 0
+    return kernels
+
+
+def pse(kernels, min_area, out=None):
+    kernels = _as_binary(kernels)
+    _check_kernels(kernels, 3, "(K, H, W) kernel stack")
+    text_line = _check_out(out, kernels.shape[1:])
+    _growing_text_line(kernels, text_line, min_area)
+    return text_line
+
+
+def pse_uint8(kernels, min_area, out=None):
+    return pse(kernels, min_area, out)
+
+
+def pse_batch(kernels, min_area, num_threads=0):
+    kernels = _as_binary(kernels)
+    _check_kernels(kernels, 4, "(N, K, H, W) batch of kernel stacks")
+    text_lines = np.empty(
+        (kernels.shape[0],) + kernels.shape[2:], dtype=np.int32
+    )
+    for image_kernels, text_line in zip(kernels, text_lines):
+        _growing_text_line(image_kernels, text_line, min_area)
+    return text_lines
+
+
+def extract_instances(labels, scores, min_area, min_score, mode="rect"):
+    import cv2
+
+    if mode not in ("rect", "contour"):
+        raise ValueError("mode must be either 'rect' or 'contour'")
+    labels = np.ascontiguousarray(labels, dtype=np.int32)
+    scores = np.ascontiguousarray(scores, dtype=np.float32)
+    if labels.ndim != 2 or labels.shape != scores.shape:
+        raise ValueError("expected (H, W) labels and scores")
+
+    flat_labels = np.maximum(labels.ravel(), 0)
+    areas = np.bincount(flat_labels)
+    score_sums = np.bincount(
+        flat_labels, weights=scores.ravel().astype(np.float64)
+    )
+    areas[0] = 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_scores = score_sums / areas
+    kept = np.flatnonzero(
+        (areas > 0) & (areas >= min_area) & (mean_scores >= min_score)
+    )
+
+    slices = ndimage.find_objects(flat_labels.reshape(labels.shape))
+    bboxes = np.zeros([len(kept), 4], dtype=np.int32)
+    polygons = []
+    for i, label in enumerate(kept):
+        rows, columns = slices[label - 1]
+        bboxes[i] = [
+            columns.start,
+            rows.start,
+            columns.stop - 1,
+            rows.stop - 1,
+        ]
+        mask = labels[rows, columns] == label
+        if mode == "rect":
+            points = np.argwhere(mask)[:, ::-1] + [columns.start, rows.start]
+            rect = cv2.minAreaRect(points.astype(np.float32))
+            polygons.append(cv2.boxPoints(rect))
+        else:
+            contours = cv2.findContours(
+                mask.astype(np.uint8),
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_SIMPLE,
+                offset=(columns.start, rows.start),
+            )[-2]
+            polygons.append(contours[0][:, 0, :].astype(np.int32))
+
+    if mode == "rect":
+        polygons = np.asarray(polygons, dtype=np.float32).reshape(-1, 4, 2)
+    return {
+        "labels": kept.astype(np.int32),
+        "areas": areas[kept].astype(np.int64),
+        "scores": mean_scores[kept].astype(np.float32),
+        "bboxes": bboxes,
+        "polygons": polygons,
+    }
@@ -0,0 +1,174 @@
+"""Progressive scale expansion in TensorFlow ops, for in-graph post-processing.
+
+The kernels grow one pixel layer at a time, from the smallest kernel to the
+largest, and a labelled pixel is never relabelled. Like the C++ queue, only
+the pixels that claimed nothing in a layer keep growing into the next kernel.
+The only difference with `psenet.pse.pse` is the order in which instances
+reaching the same pixel in the same layer are served: here the upper, then
+the left, the right and the lower neighbour wins, which is the raster order
+of the claimers rather than their queue order.
+"""
+
+import tensorflow as tf
+
+# The tie-breaking order of the neighbours, see above.
+_UP, _LEFT, _RIGHT, _DOWN = range(4)
+
+
+def _neighbours(tensor, fill):
+    """The (up, left, right, down) neighbours of every pixel of a 2D map."""
+    return (
+        tf.pad(tensor, [[1, 0], [0, 0]], constant_values=fill)[:-1],
+        tf.pad(tensor, [[0, 0], [1, 0]], constant_values=fill)[:, :-1],
+        tf.pad(tensor, [[0, 0], [0, 1]], constant_values=fill)[:, 1:],
+        tf.pad(tensor, [[0, 1], [0, 0]], constant_values=fill)[1:],
+    )
+
+
+def _runs(mask):
+    """Numbers the horizontal runs of a 2D mask from 1, the background is 0."""
+    starts = tf.logical_and(
+        mask, tf.logical_not(_neighbours(mask, False)[_LEFT])
+    )
+    runs = tf.math.cumsum(tf.reshape(tf.cast(starts, tf.int32), [-1]))
+    return tf.where(tf.reshape(mask, [-1]), runs, 0)
+
+
+def connected_components(mask):
+    """4-connected components of a boolean (H, W) mask.
+
+    Components are numbered from 1 in the raster order of their first pixel,
+    like `cv2.connectedComponents`; the background is 0.
+    """
+    shape = tf.shape(mask)
+    size = shape[0] * shape[1]
+    background = size + 1
+
+    # Every pixel starts with its own flat index plus one, and components
+    # agree on the index of their first pixel by repeatedly taking the
+    # minimum over whole horizontal and vertical runs. A label is also the
+    # index of a pixel of the same component, so following it (pointer
+    # jumping) carries minima across turns without another iteration.
+    rows = _runs(mask)
+    columns = _runs(tf.transpose(mask))
+    segments = tf.math.maximum(tf.reduce_max(rows), tf.reduce_max(columns))
+    ids = tf.reshape(tf.range(1, size + 1), shape)
+    labels = tf.reshape(tf.where(mask, ids, background), [-1])
+
+    def run_minimum(labels, runs):
+        # The background is segment 0, whose minimum stays `background`.
+        minimum = tf.math.unsorted_segment_min(labels, runs, segments + 1)
+        return tf.gather(minimum, runs)
+
+    def transpose(labels, shape):
+        return tf.reshape(tf.transpose(tf.reshape(labels, shape)), [-1])
+
+    def propagate(labels, _):
+        smallest = run_minimum(labels, rows)
+        smallest = run_minimum(transpose(smallest, shape), columns)
+        smallest = transpose(smallest, tf.reverse(shape, [0]))
+        pointers = tf.concat([smallest, [background]], 0)
+        jumped = tf.gather(pointers, smallest - 1)
+        jumped.set_shape(labels.shape)
+        return jumped, tf.math.reduce_any(jumped < labels)
+
+    labels, _ = tf.while_loop(
+        lambda labels, changed: changed, propagate, (labels, True)
+    )
+
+    roots = tf.boolean_mask(labels, labels < background)
+    roots = tf.sort(tf.unique(roots).y)
+    ranks = tf.searchsorted(roots, labels) + 1
+    return tf.where(mask, tf.reshape(ranks, shape), 0)
+
+
+def _expand(labels, frontier, kernel):
+    """Grows `labels` inside `kernel` from the `frontier` pixels.
+
+    Returns the new labels and the pixels that stopped growing, which are
+    the frontier of the next kernel.
+    """
+
+    def grow(labels, frontier, edges):
+        up, left, right, down = _neighbours(tf.where(frontier, labels, 0), 0)
+        grown = tf.where(
+            up > 0,
+            up,
+            tf.where(left > 0, left, tf.where(right > 0, right, down)),
+        )
+        free = tf.logical_and(kernel, tf.equal(labels, 0))
+        claimed = tf.logical_and(free, grown > 0)
+
+        # Where every claimed pixel got its label from, in the same order.
+        from_up = tf.logical_and(claimed, up > 0)
+        rest = tf.logical_and(claimed, tf.logical_not(from_up))
+        from_left = tf.logical_and(rest, left > 0)
+        rest = tf.logical_and(rest, tf.logical_not(from_left))
+        from_right = tf.logical_and(rest, right > 0)
+        from_down = tf.logical_and(rest, tf.logical_not(from_right))
+        # A pixel claimed from above has its claimer above it, and so on.
+        claimers = tf.logical_or(
+            tf.logical_or(
+                _neighbours(from_up, False)[_DOWN],
+                _neighbours(from_left, False)[_RIGHT],
+            ),
+            tf.logical_or(
+                _neighbours(from_right, False)[_LEFT],
+                _neighbours(from_down, False)[_UP],
+            ),
+        )
+        edges = tf.logical_or(
+            edges, tf.logical_and(frontier, tf.logical_not(claimers))
+        )
+        return tf.where(claimed, grown, labels), claimed, edges
+
+    labels, _, edges = tf.while_loop(
+        lambda labels, frontier, edges: tf.math.reduce_any(frontier),
+        grow,
+        (labels, frontier, tf.zeros_like(frontier)),
+    )
+    return labels, edges
+
+
+def pse(kernels, min_area):
+    """Progressive scale expansion of a (K, H, W) kernel stack.
+
+    The first kernel is the largest and the last one seeds the instances;
+    seeds smaller than `min_area` pixels are dropped. Returns the (H, W)
+    int32 label map.
+    """
+    if kernels.dtype != tf.bool:
+        kernels = tf.not_equal(kernels, 0)
+    labels = connected_components(kernels[-1])
+    areas = tf.math.bincount(tf.reshape(labels, [-1]))
+    labels = tf.where(
+        tf.cast(tf.gather(areas, labels), tf.float32) >= min_area, labels, 0
+    )
+
+    def expand(kernel_id, labels, frontier):
+        labels, frontier = _expand(labels, frontier, kernels[kernel_id])
+        return kernel_id - 1, labels, frontier
+
+    _, labels, _ = tf.while_loop(
+        lambda kernel_id, labels, frontier: kernel_id >= 0,
+        expand,
+        (tf.shape(kernels)[0] - 2, labels, labels > 0),
+    )
+    return labels
+
+
+def kernels_from_logits(logits):
+    """Binarizes (B, H, W, K) FPN logits into (B, K, H, W) kernel stacks.
+
+    Every kernel is restricted to the text map, the first channel.
+    """
+    kernels = tf.greater(logits, 0.0)
+    kernels = tf.logical_and(kernels, kernels[:, :, :, :1])
+    return tf.transpose(kernels, [0, 3, 1, 2])
+
+
+def pse_batch(kernels, min_area):
+    """Runs `pse` over a (N, K, H, W) batch and returns (N, H, W) labels."""
+    return tf.map_fn(
+        lambda k: pse(k, min_area), kernels, fn_output_signature=tf.int32
+    )
@@ -109,9 +109,9 @@
 #  endif
 #endif
 
-#include <python2.7/Python.h>
-#include <python2.7/frameobject.h>
-#include <python2.7/pythread.h>
+#include <Python.h>
+#include <frameobject.h>
+#include <pythread.h>
 
 #if defined(_WIN32) && (defined(min) || defined(max))
 #  error Macro clash with min and max -- define NOMINMAX when compiling your program on Windows
@@ -1,5 +1,13 @@
 #pragma once
 
+#include <algorithm>
+#include <cassert>
+#include <cstdint>
+#include <cstring>
+#include <limits>
+#include <numeric>
+#include <vector>
+
 #include "clipper/clipper.hpp"
 
 // locality-aware NMS
@@ -33,7 +41,19 @@ namespace lanms {
 		return std::abs(inter_area) / std::max(std::abs(uni_area), 1.0f);
 	}
 
+	bool bounds_overlap(const Polygon &a, const Polygon &b) {
+		auto x_a = std::minmax({a.poly[0].X, a.poly[1].X, a.poly[2].X, a.poly[3].X});
+		auto y_a = std::minmax({a.poly[0].Y, a.poly[1].Y, a.poly[2].Y, a.poly[3].Y});
+		auto x_b = std::minmax({b.poly[0].X, b.poly[1].X, b.poly[2].X, b.poly[3].X});
+		auto y_b = std::minmax({b.poly[0].Y, b.poly[1].Y, b.poly[2].Y, b.poly[3].Y});
+		return x_a.first < x_b.second && x_b.first < x_a.second
+			&& y_a.first < y_b.second && y_b.first < y_a.second;
+	}
+
 	bool should_merge(const Polygon &a, const Polygon &b, float iou_threshold) {
+		// Disjoint bounding boxes mean a zero IoU: skip the polygon clipping.
+		if (iou_threshold >= 0 && !bounds_overlap(a, b))
+			return false;
 		return poly_iou(a, b) > iou_threshold;
 	}
 
@@ -196,8 +216,12 @@ namespace lanms {
 		return ret;
 	}
 
+	/**
+	 * Merges `n` (x1, y1, ..., x4, y4, score) quadrangles. Clipper works on
+	 * integers, so coordinates are multiplied by `precision` on the way in.
+	 */
 	std::vector<Polygon>
-		merge_quadrangle_n9(const float *data, size_t n, float iou_threshold) {
+		merge_quadrangle_n9(const float *data, size_t n, float iou_threshold, float precision = 1.0f) {
 			using cInt = cl::cInt;
 
 			// first pass
@@ -206,10 +230,10 @@ namespace lanms {
 				auto p = data + i * 9;
 				Polygon poly{
 					{
-						{cInt(p[0]), cInt(p[1])},
-						{cInt(p[2]), cInt(p[3])},
-						{cInt(p[4]), cInt(p[5])},
-						{cInt(p[6]), cInt(p[7])},
+						{cInt(p[0] * precision), cInt(p[1] * precision)},
+						{cInt(p[2] * precision), cInt(p[3] * precision)},
+						{cInt(p[4] * precision), cInt(p[5] * precision)},
+						{cInt(p[6] * precision), cInt(p[7] * precision)},
 					},
 					p[8],
 				};
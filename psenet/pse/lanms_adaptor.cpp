@@ -0,0 +1,51 @@
+#include "pybind11/numpy.h"
+#include "pybind11/pybind11.h"
+
+#include <stdexcept>
+
+#include "lanms.h"
+
+using namespace std;
+
+namespace py = pybind11;
+
+namespace lanms_adaptor {
+py::array_t<float> merge_quadrangle_n9(
+    py::array_t<float, py::array::c_style> quad_n9, float iou_threshold,
+    float precision) {
+  auto buf = quad_n9.request();
+  if (buf.ndim != 2 || buf.shape[1] != 9) {
+    throw invalid_argument("expected a (N, 9) array of quadrangles");
+  }
+  if (precision <= 0) {
+    throw invalid_argument("precision must be positive");
+  }
+
+  vector<lanms::Polygon> polys;
+  {
+    py::gil_scoped_release release;
+    polys = lanms::merge_quadrangle_n9(static_cast<float *>(buf.ptr),
+                                       buf.shape[0], iou_threshold, precision);
+  }
+
+  py::array_t<float> merged({(long int)polys.size(), 9L});
+  auto data = merged.mutable_data();
+  for (auto &poly : polys) {
+    for (int i = 0; i < 4; ++i) {
+      *data++ = poly.poly[i].X / precision;
+      *data++ = poly.poly[i].Y / precision;
+    }
+    *data++ = poly.score;
+  }
+  return merged;
+}
+}  // namespace lanms_adaptor
+
+PYBIND11_MODULE(lanms_adaptor, m) {
+  m.doc() = "lanms";
+
+  m.def("merge_quadrangle_n9", &lanms_adaptor::merge_quadrangle_n9,
+        "locality-aware NMS over (N, 9) float32 quadrangles",
+        py::arg("quads").noconvert(), py::arg("iou_threshold"),
+        py::arg("precision"));
+}
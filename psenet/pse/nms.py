@@ -0,0 +1,30 @@
+"""Locality-aware NMS (LANMS) over EAST-style quadrangles."""
+
+import numpy as np
+
+from psenet import config
+
+try:
+    from .lanms_adaptor import merge_quadrangle_n9 as cmerge_quadrangle_n9
+except ImportError as error:
+    # Unlike PSE, LANMS has no NumPy fallback.
+    raise ImportError(
+        "The LANMS extension is not built. "
+        "Run `python setup.py build_ext --inplace` to build it."
+    ) from error
+
+
+def merge_quadrangle_n9(
+    quads, iou_threshold=config.NMS_IOU_THRESHOLD, precision=10000
+):
+    """Merges overlapping `(x1, y1, ..., x4, y4, score)` quadrangles.
+
+    Neighbouring quadrangles whose IoU exceeds `iou_threshold` are averaged
+    with their scores as weights, then standard NMS runs on the result, so
+    the input should be ordered by location, e.g. row by row. A C-contiguous
+    float32 `(N, 9)` array is read in place; anything else is converted
+    first. Coordinates are snapped to a `1 / precision` grid while merging.
+    Returns the merged `(M, 9)` float32 quadrangles.
+    """
+    quads = np.ascontiguousarray(quads, dtype=np.float32)
+    return cmerge_quadrangle_n9(quads, iou_threshold, precision)
@@ -0,0 +1,194 @@
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <vector>
+
+// Turns a PSE label map into per-instance statistics and polygons.
+namespace postprocess {
+
+struct Point {
+  float x, y;
+};
+
+struct Instance {
+  int32_t label = 0;
+  long int area = 0;
+  double score_sum = 0.0;
+  int min_x = 0, min_y = 0, max_x = -1, max_y = -1;
+  // The first pixel in raster order: the top-left corner of the outline.
+  int start_x = 0, start_y = 0;
+  // The leftmost and rightmost pixel of every row the instance spans; their
+  // convex hull is the convex hull of the whole instance.
+  std::vector<Point> row_extremes;
+};
+
+/**
+ * Accumulates areas, score sums, bounding boxes and row extremes of every
+ * label in one raster pass. instances[label] describes `label`, and unused
+ * labels keep a zero area.
+ */
+std::vector<Instance> collect_instances(const int32_t *labels,
+                                        const float *scores, int rows,
+                                        int cols) {
+  std::vector<Instance> instances;
+  std::vector<int> last_row;
+  for (int y = 0; y < rows; ++y) {
+    const int32_t *row = labels + (long int)y * cols;
+    const float *row_scores = scores + (long int)y * cols;
+    for (int x = 0; x < cols; ++x) {
+      int32_t label = row[x];
+      if (label <= 0) continue;
+      if (label >= (int32_t)instances.size()) {
+        instances.resize(label + 1);
+        last_row.resize(label + 1, -1);
+      }
+
+      Instance &instance = instances[label];
+      if (instance.area == 0) {
+        instance.label = label;
+        instance.min_x = instance.max_x = instance.start_x = x;
+        instance.min_y = instance.start_y = y;
+      }
+      instance.area += 1;
+      instance.score_sum += row_scores[x];
+      instance.min_x = std::min(instance.min_x, x);
+      instance.max_x = std::max(instance.max_x, x);
+      instance.max_y = y;
+
+      if (last_row[label] != y) {
+        last_row[label] = y;
+        instance.row_extremes.push_back({(float)x, (float)y});
+        instance.row_extremes.push_back({(float)x, (float)y});
+      } else {
+        instance.row_extremes.back().x = (float)x;
+      }
+    }
+  }
+  return instances;
+}
+
+inline float cross(const Point &o, const Point &a, const Point &b) {
+  return (a.x - o.x) * (b.y - o.y) - (a.y - o.y) * (b.x - o.x);
+}
+
+/**
+ * Andrew's monotone chain. Collinear points are dropped.
+ */
+std::vector<Point> convex_hull(std::vector<Point> points) {
+  std::sort(points.begin(), points.end(), [](const Point &a, const Point &b) {
+    return a.x < b.x || (a.x == b.x && a.y < b.y);
+  });
+  points.erase(std::unique(points.begin(), points.end(),
+                           [](const Point &a, const Point &b) {
+                             return a.x == b.x && a.y == b.y;
+                           }),
+               points.end());
+  if (points.size() < 3) return points;
+
+  std::vector<Point> hull(2 * points.size());
+  size_t k = 0;
+  for (size_t i = 0; i < points.size(); ++i) {
+    while (k >= 2 && cross(hull[k - 2], hull[k - 1], points[i]) <= 0) --k;
+    hull[k++] = points[i];
+  }
+  for (size_t i = points.size() - 1, t = k + 1; i > 0; --i) {
+    while (k >= t && cross(hull[k - 2], hull[k - 1], points[i - 1]) <= 0) --k;
+    hull[k++] = points[i - 1];
+  }
+  hull.resize(k - 1);
+  return hull;
+}
+
+/**
+ * The minimum-area enclosing rectangle of a convex polygon. One of its sides
+ * is collinear with a hull edge, so every edge direction is tried.
+ */
+void min_area_rect(const std::vector<Point> &hull, Point corners[4]) {
+  if (hull.size() == 1) {
+    for (int i = 0; i < 4; ++i) corners[i] = hull[0];
+    return;
+  }
+
+  double best_area = -1.0;
+  for (size_t i = 0; i < hull.size(); ++i) {
+    const Point &a = hull[i];
+    const Point &b = hull[(i + 1) % hull.size()];
+    double length = std::hypot(b.x - a.x, b.y - a.y);
+    if (length == 0.0) continue;
+    double ux = (b.x - a.x) / length, uy = (b.y - a.y) / length;
+
+    double min_u = 0.0, max_u = 0.0, min_v = 0.0, max_v = 0.0;
+    for (const Point &p : hull) {
+      double u = (p.x - a.x) * ux + (p.y - a.y) * uy;
+      double v = -(p.x - a.x) * uy + (p.y - a.y) * ux;
+      min_u = std::min(min_u, u);
+      max_u = std::max(max_u, u);
+      min_v = std::min(min_v, v);
+      max_v = std::max(max_v, v);
+    }
+
+    double area = (max_u - min_u) * (max_v - min_v);
+    if (best_area >= 0.0 && area >= best_area) continue;
+    best_area = area;
+    double us[4] = {min_u, max_u, max_u, min_u};
+    double vs[4] = {min_v, min_v, max_v, max_v};
+    for (int c = 0; c < 4; ++c) {
+      corners[c].x = (float)(a.x + us[c] * ux - vs[c] * uy);
+      corners[c].y = (float)(a.y + us[c] * uy + vs[c] * ux);
+    }
+  }
+}
+
+/**
+ * Moore-neighbour tracing of the outer boundary of `label`, starting from its
+ * first pixel in raster order. Only runs of pixels that change direction are
+ * kept, as with OpenCV's CHAIN_APPROX_SIMPLE.
+ */
+std::vector<int> trace_contour(const int32_t *labels, int rows, int cols,
+                               const Instance &instance) {
+  // Clockwise in image coordinates, starting east.
+  static const int dx[] = {1, 1, 0, -1, -1, -1, 0, 1};
+  static const int dy[] = {0, 1, 1, 1, 0, -1, -1, -1};
+  auto inside = [&](int x, int y) {
+    return x >= 0 && x < cols && y >= 0 && y < rows &&
+           labels[(long int)y * cols + x] == instance.label;
+  };
+  auto next_direction = [&](int x, int y, int direction) {
+    // Resume right after the background neighbour we backtracked from.
+    for (int i = 0; i < 8; ++i) {
+      int d = (direction + 6 + i) % 8;
+      if (inside(x + dx[d], y + dy[d])) return d;
+    }
+    return -1;
+  };
+
+  int x = instance.start_x, y = instance.start_y;
+  std::vector<int> contour = {x, y};
+  int first_direction = next_direction(x, y, 7);
+  if (first_direction < 0) return contour;
+
+  int direction = first_direction;
+  while (true) {
+    x += dx[direction];
+    y += dy[direction];
+    int next = next_direction(x, y, direction);
+    if (x == instance.start_x && y == instance.start_y &&
+        next == first_direction) {
+      break;
+    }
+    if (next != direction) {
+      contour.push_back(x);
+      contour.push_back(y);
+    }
+    direction = next;
+  }
+  // The start is a corner unless the outline passes straight through it.
+  if (contour.size() > 2 && direction == first_direction) {
+    contour.erase(contour.begin(), contour.begin() + 2);
+  }
+  return contour;
+}
+
+}  // namespace postprocess
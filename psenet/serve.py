@@ -1,11 +1,32 @@
 import tensorflow as tf
 from psenet import config
 from psenet.model import build_model
+from psenet.pse import graph
 import argparse
 
 
+def add_postprocessing(model, min_area):
+    logits = model.outputs[0]
+    labels = tf.keras.layers.Lambda(
+        lambda logits: graph.pse_batch(
+            graph.kernels_from_logits(logits), min_area
+        ),
+        name=config.LABELS,
+    )(logits)
+    return tf.keras.Model(
+        inputs={config.IMAGE: model.inputs[0]},
+        outputs={config.KERNELS: logits, config.LABELS: labels},
+        name=config.LABELS,
+    )
+
+
+def export(model, target_dir):
+    """Saves `model` with a `serve` endpoint taking batches of images."""
+    model.export(target_dir, format="tf_saved_model")
+
+
 def export_saved_model(FLAGS):
-    params = tf.contrib.training.HParams(
+    params = argparse.Namespace(
         kernel_num=7,
         backbone_name=FLAGS.backbone_name,
         encoder_weights="imagenet",
@@ -13,7 +34,9 @@ def export_saved_model(FLAGS):
     model = build_model(params)
     latest_checkpoint = tf.train.latest_checkpoint(FLAGS.source_dir)
     model.load_weights(latest_checkpoint)
-    tf.keras.experimental.export_saved_model(model, FLAGS.target_dir)
+    if FLAGS.postprocess == "pse":
+        model = add_postprocessing(model, FLAGS.min_area)
+    export(model, FLAGS.target_dir)
 
 
 if __name__ == "__main__":
@@ -49,6 +72,23 @@ if __name__ == "__main__":
         default=config.BACKBONE_NAME,
         type=str,
     )
+    PARSER.add_argument(
+        "--postprocess",
+        help="""What the saved model returns:
+                - 'kernels': the raw kernel logits
+                - 'pse': the logits and the text line labels, expanded
+                  in-graph so that serving needs no custom ops
+        """,
+        default="kernels",
+        choices=["kernels", "pse"],
+        type=str,
+    )
+    PARSER.add_argument(
+        "--min-area",
+        help="The minimum area of the seed kernels for --postprocess=pse",
+        default=config.MIN_KERNEL_AREA,
+        type=float,
+    )
 
     FLAGS, _ = PARSER.parse_known_args()
     export_saved_model(FLAGS)
@@ -1,5 +1,7 @@
 import argparse
 import os
+import statistics
+import time
 
 import tensorflow as tf
 from tensorflow.python.client import device_lib
@@ -26,6 +28,60 @@ def build_callbacks(FLAGS):
     return callbacks
 
 
+def time_train_steps(model, data, jit_compile, steps):
+    """Times the first step of the `fit` train function on a batch of
+    `data`, which traces and compiles it, and the median of the next
+    `steps` ones, all in seconds.
+
+    The steps run through the distribution strategy of the model, as in
+    `fit`, and its variables and metrics are put back afterwards.
+    """
+    model.jit_compile = jit_compile
+    model.make_train_function(force=True)
+    batch = data.take(1).cache().repeat()
+    iterator = iter(
+        model.distribute_strategy.experimental_distribute_dataset(batch)
+    )
+    timings = []
+    for _ in range(steps + 1):
+        start = time.perf_counter()
+        logs = model.train_function(iterator)
+        tf.nest.map_structure(lambda tensor: tensor.numpy(), logs)
+        timings.append(time.perf_counter() - start)
+    return timings[0], statistics.median(timings[1:])
+
+
+def log_xla_speedup(model, data, steps):
+    if not model.optimizer.built:
+        model.optimizer.build(model.trainable_variables)
+    # The timed steps train the model, so its state is put back afterwards.
+    variables = model.variables + model.optimizer.variables
+    values = [variable.numpy() for variable in variables]
+    jit_compile = model.jit_compile
+
+    first_step, step = time_train_steps(
+        model, data, jit_compile=False, steps=steps
+    )
+    xla_first_step, xla_step = time_train_steps(
+        model, data, jit_compile=True, steps=steps
+    )
+    logging.info(
+        "XLA first step minus steady-state step: {:.1f}s, steady-state"
+        " step: {:.1f} ms without XLA, {:.1f} ms with XLA, x{:.2f}".format(
+            xla_first_step - xla_step,
+            step * 1000,
+            xla_step * 1000,
+            step / xla_step,
+        )
+    )
+
+    for variable, value in zip(variables, values):
+        variable.assign(value)
+    model.reset_metrics()
+    model.jit_compile = jit_compile
+    model.make_train_function(force=True)
+
+
 def train(FLAGS):
     strategy = tf.distribute.MirroredStrategy()
     logging.info(
@@ -35,6 +91,18 @@ def train(FLAGS):
     FLAGS.mode = tf.estimator.ModeKeys.TRAIN
     FLAGS.encoder_weights = "imagenet"
 
+    if FLAGS.mixed_precision:
+        # The backbone and the decoder compute in half precision.
+        tf.keras.mixed_precision.set_global_policy(
+            "mixed_{}".format(FLAGS.mixed_precision)
+        )
+
+    if FLAGS.xla and not FLAGS.fixed_crop:
+        logging.warning(
+            "XLA compiles the training step again for every new batch shape;"
+            " --fixed-crop makes them static."
+        )
+
     data = build_input_fn(FLAGS)()
     with strategy.scope():
         model = build_model(FLAGS)
@@ -44,7 +112,10 @@ def train(FLAGS):
             loss=psenet_loss,
             optimizer=build_optimizer(FLAGS),
             metrics=keras_psenet_metrics(),
+            jit_compile=FLAGS.xla,
         )
+        if FLAGS.xla and FLAGS.xla_timing_steps > 0:
+            log_xla_speedup(model, data, FLAGS.xla_timing_steps)
         model.fit(
             data,
             epochs=FLAGS.num_epochs,
@@ -233,6 +304,53 @@ if __name__ == "__main__":
         const=True,
         default=True,
     )
+    PARSER.add_argument(
+        "--label-cache-dir",
+        help="The directory to cache the raw dataset labels in",
+        default=None,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--label-cache-size",
+        help="The maximum size of the label cache in megabytes; "
+        + "it stops caching when full",
+        default=config.LABEL_CACHE_SIZE,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--bucket-by-shape",
+        help="Whether to batch only images of the same sides",
+        default=False,
+        type=config.str2bool,
+    )
+    PARSER.add_argument(
+        "--fixed-crop",
+        help="""Whether to crop or pad the training images to exactly
+        half the resize length, for batches of a static shape""",
+        default=False,
+        type=config.str2bool,
+    )
+    PARSER.add_argument(
+        "--mixed-precision",
+        help="""The half precision type to compute the model in, 'float16'
+        on GPUs or 'bfloat16' on TPUs and CPUs; float32 if unset""",
+        default=None,
+        choices=["float16", "bfloat16"],
+        type=str,
+    )
+    PARSER.add_argument(
+        "--xla",
+        help="Whether to compile the training step with XLA",
+        default=False,
+        type=config.str2bool,
+    )
+    PARSER.add_argument(
+        "--xla-timing-steps",
+        help="""The number of training steps to time with and without XLA
+        before training, to log the first step overhead and the speedup""",
+        default=5,
+        type=int,
+    )
 
     FLAGS, _ = PARSER.parse_known_args()
     tf.compat.v1.logging.set_verbosity("DEBUG")
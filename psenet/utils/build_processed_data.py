@@ -10,10 +10,15 @@ from functools import partial
 from pathlib import Path
 from multiprocessing import Pool
 from tqdm import tqdm
+import tensorflow as tf
 
 from psenet import config
 from psenet.data import preprocess
-from psenet.utils.examples import int64_list_feature, float_list_feature
+from psenet.utils.examples import (
+    bytes_list_feature,
+    float_list_feature,
+    int64_list_feature,
+)
 from psenet.utils.readers import ImageReader
 from psenet.backbones.factory import Backbones
 import cv2
@@ -21,24 +26,25 @@ import cv2
 _NUM_SHARDS = 256
 
 
-def build_processed_example(
+def build_processed_arrays(
     image,
     texts,
     bboxes,
     kernel_num=config.KERNEL_NUM,
     min_scale=config.MIN_SCALE,
-    backbone_name=config.BACKBONE_NAME,
     resize_length=config.RESIZE_LENGTH,
 ):
+    """Scales the image and draws its mask and labels.
+
+    Returns the scaled uint8 image, the `(H, W)` uint8 mask and the
+    `(H, W, kernel_num)` uint8 labels: the text map followed by the kernels.
+    """
     tags = "".join(
         map(lambda text: str(int(not text.startswith("###"))), texts)
     )
     assert len(tags) == len(bboxes)
 
-    preprocessing_fn = Backbones.get_preprocessing(backbone_name)
-
-    image = preprocess.scale(image)
-    image = preprocessing_fn(image)
+    image = preprocess.scale(image, resize_length=resize_length)
     height, width = image.shape[:2]
     text_score = np.zeros([height, width], dtype="uint8")
     mask = np.ones([height, width], dtype="uint8")
@@ -54,37 +60,112 @@ def build_processed_example(
             if tags[i] == "0":
                 cv2.drawContours(mask, [bboxes[i]], -1, 0, -1)
 
+    rates = [
+        1.0 - (1.0 - min_scale) / (kernel_num - 1) * i
+        for i in range(1, kernel_num)
+    ]
     kernels = []
-    for i in range(1, kernel_num):
-        rate = 1.0 - (1.0 - min_scale) / (kernel_num - 1) * i
+    for kernel_bboxes in preprocess.shrink_scales(bboxes, rates):
         kernel = np.zeros([height, width], dtype="uint8")
-        kernel_bboxes = preprocess.shrink(bboxes, rate)
-        for i in range(bboxes_count):
-            cv2.drawContours(kernel, [kernel_bboxes[i]], -1, 1, -1)
+        for kernel_bbox in kernel_bboxes:
+            cv2.drawContours(kernel, [kernel_bbox], -1, 1, -1)
         kernels.append(kernel)
 
-    text_score = np.expand_dims(text_score, axis=0).astype("float32")
-    kernels = np.asarray(kernels, dtype="float32")
-    label = np.concatenate([text_score, kernels], axis=0)
+    label = np.concatenate(
+        [np.expand_dims(text_score, axis=0), np.asarray(kernels, "uint8")],
+        axis=0,
+    )
     label = np.transpose(label, [1, 2, 0])
 
-    mask = mask.astype("float32")
-
     assert preprocess.check_numpy_image_validity(
         {config.IMAGE: image}
     ), "Got an invalid image shape {}".format(image.shape)
 
+    return image, mask, label
+
+
+def build_processed_example(
+    image,
+    texts,
+    bboxes,
+    kernel_num=config.KERNEL_NUM,
+    min_scale=config.MIN_SCALE,
+    backbone_name=config.BACKBONE_NAME,
+    resize_length=config.RESIZE_LENGTH,
+):
+    """Returns the flat float32 image, mask and labels of the v1 format."""
+    image, mask, label = build_processed_arrays(
+        image, texts, bboxes, kernel_num, min_scale, resize_length
+    )
+    height, width = image.shape[:2]
+    preprocessing_fn = Backbones.get_preprocessing(backbone_name)
+    image = preprocessing_fn(image.astype("float32"))
+
     image = np.reshape(image, [-1])
-    mask = np.reshape(mask, [-1])
-    label = np.reshape(label, [-1])
+    mask = np.reshape(mask.astype("float32"), [-1])
+    label = np.reshape(label.astype("float32"), [-1])
 
     return height, width, image, mask, label
 
 
-def _convert_shard(shard_id, target_dir, images_filenames, labels_filenames):
-    import tensorflow as tf
-    from pathlib import Path
+def build_v1_example(height, width, image, mask, label):
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                "height": int64_list_feature(height),
+                "width": int64_list_feature(width),
+                "features/image": float_list_feature(image),
+                "features/mask": float_list_feature(mask),
+                "labels": float_list_feature(label),
+            }
+        )
+    )
+
+
+def encode_processed_example(image, mask, label, image_format="raw"):
+    """Builds a v2 `tf.train.Example` out of `build_processed_arrays`.
+
+    The image is stored as uint8 bytes, either raw or PNG-encoded, and the
+    binary mask and labels are bit-packed, 8 pixels per byte.
+    """
+    height, width = image.shape[:2]
+    if image_format == "raw":
+        image_data = np.ascontiguousarray(image, dtype="uint8").tobytes()
+    elif image_format == "png":
+        image_data = cv2.imencode(
+            ".png", cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        )[1].tobytes()
+    else:
+        raise ValueError(
+            "The image format {} is not supported".format(image_format)
+        )
+    return tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                "version": int64_list_feature(2),
+                "height": int64_list_feature(height),
+                "width": int64_list_feature(width),
+                "features/image": bytes_list_feature(image_data),
+                "features/image/format": bytes_list_feature(image_format),
+                "features/mask": bytes_list_feature(
+                    np.packbits(mask.reshape(-1) > 0).tobytes()
+                ),
+                "labels": bytes_list_feature(
+                    np.packbits(label.reshape(-1) > 0).tobytes()
+                ),
+            }
+        )
+    )
+
 
+def _convert_shard(
+    shard_id,
+    target_dir,
+    images_filenames,
+    labels_filenames,
+    format_version=1,
+    image_format="raw",
+):
     num_images = len(images_filenames)
     num_per_shard = int(math.ceil(num_images / float(_NUM_SHARDS)))
 
@@ -101,10 +182,10 @@ def _convert_shard(shard_id, target_dir, images_filenames, labels_filenames):
             end_idx = min((shard_id + 1) * num_per_shard, num_images)
             for i in range(start_idx, end_idx):
                 image_filename = images_filenames[i]
-                image_format = Path(image_filename).name.split(".")[1]
+                file_format = Path(image_filename).name.split(".")[1]
                 image_data = tf.io.gfile.GFile(image_filename, "rb").read()
                 image = image_reader.decode_image(
-                    image_data, image_format, channels=3
+                    image_data, file_format, channels=3
                 )
                 height, width = image.shape[:2]
 
@@ -126,26 +207,20 @@ def _convert_shard(shard_id, target_dir, images_filenames, labels_filenames):
                         text_datum = line[9]
                         texts.append(text_datum)
 
-                height, width, image, mask, label = build_processed_example(
-                    image, texts, bboxes
-                )
-                example = tf.train.Example(
-                    features=tf.train.Features(
-                        feature={
-                            "height": int64_list_feature(height),
-                            "width": int64_list_feature(width),
-                            "features/image": float_list_feature(image),
-                            "features/mask": float_list_feature(mask),
-                            "labels": float_list_feature(label),
-                        }
+                if format_version == 2:
+                    example = encode_processed_example(
+                        *build_processed_arrays(image, texts, bboxes),
+                        image_format=image_format,
+                    )
+                else:
+                    example = build_v1_example(
+                        *build_processed_example(image, texts, bboxes)
                     )
-                )
                 tfrecord_writer.write(example.SerializeToString())
 
 
-def _convert_images(data_dir, target_dir):
-    """Converts the ADE20k dataset into into tfrecord format.
-    """
+def _convert_images(data_dir, target_dir, format_version, image_format):
+    """Converts the ADE20k dataset into into tfrecord format."""
 
     Path(target_dir).mkdir(parents=True)
     images_filenames = glob(
@@ -169,6 +244,8 @@ def _convert_images(data_dir, target_dir):
                     target_dir=target_dir,
                     images_filenames=images_filenames,
                     labels_filenames=labels_filenames,
+                    format_version=format_version,
+                    image_format=image_format,
                 ),
                 range(_NUM_SHARDS),
             ),
@@ -201,13 +278,40 @@ def main():
         default=config.BASE_DATA_DIR,
         type=str,
     )
+    PARSER.add_argument(
+        "--format-version",
+        help="The version of the processed format: 1 stores float32 lists, "
+        + "2 stores uint8 images and bit-packed masks and labels, "
+        + "which the training reads with --dataset "
+        + config.PROCESSED_V2_DATA_LABEL,
+        default=1,
+        choices=[1, 2],
+        type=int,
+    )
+    PARSER.add_argument(
+        "--image-format",
+        help="How version 2 stores the images: 'raw' or 'png'",
+        default="raw",
+        choices=["raw", "png"],
+        type=str,
+    )
     FLAGS, _ = PARSER.parse_known_args()
 
     train_target_dir = Path(FLAGS.output_dir, "train")
     eval_target_dir = Path(FLAGS.output_dir, "eval")
 
-    _convert_images(FLAGS.training_data_dir, train_target_dir)
-    _convert_images(FLAGS.eval_data_dir, eval_target_dir)
+    _convert_images(
+        FLAGS.training_data_dir,
+        train_target_dir,
+        FLAGS.format_version,
+        FLAGS.image_format,
+    )
+    _convert_images(
+        FLAGS.eval_data_dir,
+        eval_target_dir,
+        FLAGS.format_version,
+        FLAGS.image_format,
+    )
 
 
 if __name__ == "__main__":
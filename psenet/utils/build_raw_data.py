@@ -4,7 +4,9 @@ import argparse
 import math
 import os
 import random
-import threading
+import time
+from functools import partial
+from multiprocessing import Pool
 
 import numpy as np
 from tensorflow.python.platform import tf_logging as logging
@@ -17,9 +19,7 @@ from psenet.utils.examples import (
     float_list_feature,
     int64_list_feature,
 )
-from psenet.utils.readers import ImageReader
-
-_NUM_SHARDS = 8
+from psenet.utils.readers import read_image_size
 
 
 def build_raw_example(image_data, text_data, filename, height, width, bboxes):
@@ -44,85 +44,118 @@ def build_raw_example(image_data, text_data, filename, height, width, bboxes):
     )
 
 
+def _read_labels(labels_filename, height, width):
+    labels_data = tf.io.gfile.GFile(labels_filename, "r").read().split("\n")
+    bboxes = []
+    text_data = []
+    for line in labels_data:
+        line = line.strip("\ufeff").strip("\xef\xbb\xbf").split(",")
+        if len(line) > 8:
+            bbox = np.asarray(list(map(float, line[:8]))) / (
+                [width * 1.0, height * 1.0] * 4
+            )
+            bboxes.extend(bbox)
+            text_datum = line[9]
+            text_data.append(text_datum)
+    return bboxes, text_data
+
+
 def _convert_shard(
-    target_dir, shard_id, jpeg_images_filenames, labels_filenames
+    shard_id, target_dir, images_filenames, labels_filenames, num_shards
 ):
-    num_images = len(jpeg_images_filenames)
-    num_per_shard = int(math.ceil(num_images / float(_NUM_SHARDS)))
+    """Writes a shard and returns its id, number of images, bytes and the
+    seconds it took."""
+    start_time = time.perf_counter()
+    num_images = len(images_filenames)
+    num_per_shard = int(math.ceil(num_images / float(num_shards)))
+    start_idx = shard_id * num_per_shard
+    end_idx = min((shard_id + 1) * num_per_shard, num_images)
 
-    image_reader = ImageReader()
     output_filename = os.path.join(
-        target_dir, f"shard-{(shard_id + 1):05}-of-{_NUM_SHARDS:05}.tfrecord"
+        target_dir, f"shard-{(shard_id + 1):05}-of-{num_shards:05}.tfrecord"
     )
+    num_bytes = 0
     with tf.io.TFRecordWriter(output_filename) as tfrecord_writer:
-        start_idx = shard_id * num_per_shard
-        end_idx = min((shard_id + 1) * num_per_shard, num_images)
-        for i in tqdm(range(start_idx, end_idx)):
-            image_filename = jpeg_images_filenames[i]
-            image_format = os.path.basename(image_filename).split(".")[1]
-            image_data = tf.io.gfile.GFile(image_filename, "rb").read()
-            height, width = image_reader.read_image_dims(
-                image_data, image_format, channels=3
-            )
-
-            labels_filename = labels_filenames[i]
-            labels_data = (
-                tf.io.gfile.GFile(labels_filename, "r").read().split("\n")
+        for i in range(start_idx, end_idx):
+            image_data = tf.io.gfile.GFile(images_filenames[i], "rb").read()
+            # The header is enough for the dimensions.
+            height, width = read_image_size(image_data)
+            bboxes, text_data = _read_labels(
+                labels_filenames[i], height, width
             )
-            bboxes = []
-            text_data = []
-            for line in labels_data:
-                line = line.strip("\ufeff").strip("\xef\xbb\xbf").split(",")
-                if len(line) > 8:
-                    bbox = np.asarray(list(map(float, line[:8]))) / (
-                        [width * 1.0, height * 1.0] * 4
-                    )
-                    bboxes.extend(bbox)
-                    text_datum = line[9]
-                    text_data.append(text_datum)
-
             example = build_raw_example(
                 image_data,
                 text_data,
-                jpeg_images_filenames[i],
+                images_filenames[i],
                 height,
                 width,
                 bboxes,
             )
             tfrecord_writer.write(example.SerializeToString())
+            num_bytes += len(image_data)
+    return (
+        shard_id,
+        max(end_idx - start_idx, 0),
+        num_bytes,
+        time.perf_counter() - start_time,
+    )
 
 
-def _convert_images(data_dir, target_dir):
-    """Converts the ADE20k dataset into into tfrecord format.
+def _convert_images(data_dir, target_dir, num_shards, num_processes=None):
+    """Converts the ICDAR MLT dataset into tfrecord format, with a process
+    per shard at a time.
     """
-
-    jpeg_images_filenames = tf.io.gfile.glob(
+    start_time = time.perf_counter()
+    images_filenames = tf.io.gfile.glob(
         os.path.join(data_dir, config.IMAGES_DIR, "*.jpg")
     ) + tf.io.gfile.glob(os.path.join(data_dir, config.IMAGES_DIR, "*.png"))
-    random.shuffle(jpeg_images_filenames)
+    random.shuffle(images_filenames)
     labels_filenames = []
-    for f in jpeg_images_filenames:
+    for f in images_filenames:
         basename = os.path.basename(f).split(".")[0]
         labels_filename = os.path.join(
             data_dir, config.LABELS_DIR, basename + ".txt"
         )
         labels_filenames.append(labels_filename)
-    coord = tf.train.Coordinator()
-    threads = []
-    for shard_id in range(_NUM_SHARDS):
-        thread = threading.Thread(
-            target=_convert_shard,
-            args=(
-                target_dir,
-                shard_id,
-                jpeg_images_filenames,
-                labels_filenames,
+
+    total_images = 0
+    with Pool(num_processes) as pool:
+        shards = pool.imap_unordered(
+            partial(
+                _convert_shard,
+                target_dir=target_dir,
+                images_filenames=images_filenames,
+                labels_filenames=labels_filenames,
+                num_shards=num_shards,
             ),
+            range(num_shards),
         )
-        thread.start()
-        threads.append(thread)
-    coord.join(threads)
-    logging.info("Done processing {} to {}".format(data_dir, target_dir))
+        for shard_id, num_images, num_bytes, seconds in tqdm(
+            shards, total=num_shards
+        ):
+            total_images += num_images
+            logging.info(
+                "Shard {}/{}: {} images in {:.1f}s, {:.1f} images/s,"
+                " {:.1f} MB/s".format(
+                    shard_id + 1,
+                    num_shards,
+                    num_images,
+                    seconds,
+                    num_images / seconds,
+                    num_bytes / seconds / 2**20,
+                )
+            )
+    seconds = time.perf_counter() - start_time
+    logging.info(
+        "Done processing {} images from {} to {} in {:.1f}s,"
+        " {:.1f} images/s".format(
+            total_images,
+            data_dir,
+            target_dir,
+            seconds,
+            total_images / seconds,
+        )
+    )
 
 
 def main():
@@ -146,7 +179,20 @@ def main():
         default=config.BASE_DATA_DIR,
         type=str,
     )
+    PARSER.add_argument(
+        "--num-shards",
+        help="The number of TFRecord shards of each subdirectory",
+        default=8,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--num-processes",
+        help="The number of shards to write at once; all cores if unset",
+        default=None,
+        type=int,
+    )
     FLAGS, _ = PARSER.parse_known_args()
+    logging.set_verbosity(logging.INFO)
 
     train_target_dir = os.path.join(FLAGS.output_dir, "train")
     eval_target_dir = os.path.join(FLAGS.output_dir, "eval")
@@ -154,8 +200,18 @@ def main():
     tf.io.gfile.makedirs(train_target_dir)
     tf.io.gfile.makedirs(eval_target_dir)
 
-    _convert_images(FLAGS.training_data_dir, train_target_dir)
-    _convert_images(FLAGS.eval_data_dir, eval_target_dir)
+    _convert_images(
+        FLAGS.training_data_dir,
+        train_target_dir,
+        FLAGS.num_shards,
+        FLAGS.num_processes,
+    )
+    _convert_images(
+        FLAGS.eval_data_dir,
+        eval_target_dir,
+        FLAGS.num_shards,
+        FLAGS.num_processes,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""Converts processed TFRecords from the float32 v1 format to the v2 one."""
+
+import argparse
+from functools import partial
+from glob import glob
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from tqdm import tqdm
+
+from psenet import config
+from psenet.backbones.factory import Backbones
+from psenet.utils.build_processed_data import encode_processed_example
+
+
+def invert_preprocessing(image, backbone_name=config.BACKBONE_NAME):
+    """Recovers the uint8 RGB image from its preprocessed float32 values.
+
+    The backbone preprocessing functions are affine per pixel, possibly
+    swapping channels, so they are probed on the zero and unit colours and
+    inverted.
+    """
+    preprocessing_fn = Backbones.get_preprocessing(backbone_name)
+
+    def apply(colour):
+        colour = np.asarray(colour, dtype="float32").reshape([1, 1, 3])
+        return np.asarray(preprocessing_fn(colour), "float64").reshape([3])
+
+    offset = apply([0, 0, 0])
+    transform = np.stack(
+        [apply(np.eye(3)[c] * 255) - offset for c in range(3)], axis=1
+    )
+    colours = np.linalg.solve(transform, (image.reshape([-1, 3]) - offset).T).T
+    colours = np.clip(np.round(colours * 255), 0, 255).astype("uint8")
+    return colours.reshape(image.shape)
+
+
+def convert_example(
+    serialized,
+    kernel_num=config.KERNEL_NUM,
+    backbone_name=config.BACKBONE_NAME,
+    image_format="raw",
+):
+    feature = tf.train.Example.FromString(serialized).features.feature
+    height = feature["height"].int64_list.value[0]
+    width = feature["width"].int64_list.value[0]
+    image = np.asarray(feature["features/image"].float_list.value, "float32")
+    mask = np.asarray(feature["features/mask"].float_list.value)
+    label = np.asarray(feature["labels"].float_list.value)
+
+    image = invert_preprocessing(
+        image.reshape([height, width, 3]), backbone_name
+    )
+    return encode_processed_example(
+        image,
+        (mask > 0.5).reshape([height, width]),
+        (label > 0.5).reshape([height, width, kernel_num]),
+        image_format=image_format,
+    )
+
+
+def _convert_shard(
+    source_filename, target_dir, kernel_num, backbone_name, image_format
+):
+    target_filename = str(Path(target_dir, Path(source_filename).name))
+    with tf.io.TFRecordWriter(target_filename) as tfrecord_writer:
+        for serialized in tf.data.TFRecordDataset(source_filename):
+            example = convert_example(
+                serialized.numpy(), kernel_num, backbone_name, image_format
+            )
+            tfrecord_writer.write(example.SerializeToString())
+
+
+def main():
+    PARSER = argparse.ArgumentParser()
+    PARSER.add_argument(
+        "--source-dir",
+        help="The directory with the v1 TFRecords",
+        default=config.TRAINING_DATA_DIR,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--target-dir",
+        help="The directory for the v2 TFRecords",
+        required=True,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--backbone-name",
+        help="The backbone whose preprocessing the v1 images went through",
+        default=config.BACKBONE_NAME,
+        type=str,
+    )
+    PARSER.add_argument(
+        "--kernel-num",
+        help="The number of label channels of the v1 TFRecords",
+        default=config.KERNEL_NUM,
+        type=int,
+    )
+    PARSER.add_argument(
+        "--image-format",
+        help="How to store the images: 'raw' or 'png'",
+        default="raw",
+        choices=["raw", "png"],
+        type=str,
+    )
+    FLAGS, _ = PARSER.parse_known_args()
+
+    Path(FLAGS.target_dir).mkdir(parents=True, exist_ok=True)
+    source_filenames = sorted(glob(str(Path(FLAGS.source_dir, "*.tfrecord"))))
+    with Pool() as pool:
+        list(
+            tqdm(
+                pool.imap_unordered(
+                    partial(
+                        _convert_shard,
+                        target_dir=FLAGS.target_dir,
+                        kernel_num=FLAGS.kernel_num,
+                        backbone_name=FLAGS.backbone_name,
+                        image_format=FLAGS.image_format,
+                    ),
+                    source_filenames,
+                ),
+                total=len(source_filenames),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
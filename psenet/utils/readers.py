@@ -1,5 +1,59 @@
+import struct
+
 import tensorflow as tf
 
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# The JPEG start of frame markers, which hold the image dimensions.
+_JPEG_FRAME_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# The JPEG markers without a length.
+_JPEG_BARE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+
+def read_image_size(image_data):
+    """Reads the dimensions of a JPEG or PNG image from its header.
+
+    Args:
+      image_data: string of image data.
+
+    Returns:
+      image_height and image_width.
+
+    Raises:
+      ValueError: The image is neither a JPEG nor a PNG, or is truncated.
+    """
+    if (
+        image_data.startswith(_PNG_SIGNATURE)
+        and image_data[12:16] == b"IHDR"
+        and len(image_data) >= 24
+    ):
+        width, height = struct.unpack(">II", image_data[16:24])
+        return height, width
+    if image_data.startswith(b"\xff\xd8"):
+        position = 2
+        while position + 4 <= len(image_data):
+            if image_data[position] != 0xFF:
+                break
+            marker = image_data[position + 1]
+            if marker == 0xFF:
+                # A fill byte.
+                position += 1
+                continue
+            if marker in _JPEG_BARE_MARKERS:
+                position += 2
+                continue
+            (length,) = struct.unpack(
+                ">H", image_data[position + 2 : position + 4]
+            )
+            if marker in _JPEG_FRAME_MARKERS:
+                if position + 9 > len(image_data):
+                    break
+                height, width = struct.unpack(
+                    ">HH", image_data[position + 5 : position + 9]
+                )
+                return height, width
+            position += 2 + length
+    raise ValueError("Could not read the size of the image")
+
 
 class ImageReader:
     """Helper class that provides TensorFlow image coding utilities."""
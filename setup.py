@@ -1,18 +1,60 @@
+from setuptools import Extension
 from setuptools import find_packages
 from setuptools import setup
 
 REQUIRED_PACKAGES = [
     "opencv-python",
-    "Polygon3",
     "pyclipper",
+    "scipy",
     "tensorflow-gpu==2.0.0-beta1",
 ]
 
+PSE_DIR = "psenet/pse"
+CXX_FLAGS = ["-std=c++11", "-O3", "-pthread"]
+
+
+class PybindInclude:
+    """Resolves the pybind11 headers lazily, once it has been installed.
+
+    Falls back to the copy vendored in `psenet/pse/include`.
+    """
+
+    def __str__(self):
+        try:
+            import pybind11
+        except ImportError:
+            return PSE_DIR + "/include"
+        return pybind11.get_include()
+
+
+def pse_extension(name, sources):
+    # The extensions are optional: without them `psenet.pse` falls back to
+    # NumPy, so a missing compiler does not break the install.
+    return Extension(
+        "psenet.pse." + name,
+        sources=[PSE_DIR + "/" + source for source in sources],
+        include_dirs=[PybindInclude(), PSE_DIR, PSE_DIR + "/include"],
+        depends=[PSE_DIR + "/lanms.h", PSE_DIR + "/postprocess.h"],
+        extra_compile_args=CXX_FLAGS,
+        extra_link_args=["-pthread"],
+        language="c++",
+        optional=True,
+    )
+
+
 setup(
     name="psenet",
     version="0.0.1",
     install_requires=REQUIRED_PACKAGES,
+    setup_requires=["pybind11>=2.3"],
     packages=find_packages(),
     include_package_data=True,
+    ext_modules=[
+        pse_extension("adaptor", ["adaptor.cpp"]),
+        pse_extension(
+            "lanms_adaptor",
+            ["lanms_adaptor.cpp", "include/clipper/clipper.cpp"],
+        ),
+    ],
     description="PSENet",
 )
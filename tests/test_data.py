@@ -0,0 +1,442 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+
+@pytest.mark.parametrize("image_format", ["raw", "png"])
+def test_processed_v2_example_round_trip(image_format):
+    from psenet.data.processed import unpack_bits
+    from psenet.utils.build_processed_data import encode_processed_example
+
+    rng = np.random.RandomState(0)
+    image = rng.randint(0, 256, [13, 17, 3]).astype("uint8")
+    mask = rng.randint(0, 2, [13, 17]).astype("uint8")
+    label = rng.randint(0, 2, [13, 17, 3]).astype("uint8")
+
+    feature = encode_processed_example(
+        image, mask, label, image_format=image_format
+    ).features.feature
+    image_data = feature["features/image"].bytes_list.value[0]
+    if image_format == "raw":
+        decoded = tf.reshape(
+            tf.io.decode_raw(image_data, tf.uint8), [13, 17, 3]
+        )
+    else:
+        decoded = tf.image.decode_png(image_data, 3)
+    assert np.array_equal(decoded.numpy(), image)
+    assert np.array_equal(
+        unpack_bits(feature["features/mask"].bytes_list.value[0], [13, 17]),
+        mask,
+    )
+    assert np.array_equal(
+        unpack_bits(feature["labels"].bytes_list.value[0], [13, 17, 3]),
+        label,
+    )
+
+
+def test_invert_preprocessing_recovers_uint8_images():
+    from psenet.utils.convert_processed_data import invert_preprocessing
+    from psenet.backbones.factory import Backbones
+
+    image = np.random.RandomState(0).randint(0, 256, [8, 8, 3])
+    image = image.astype("uint8")
+    for backbone_name in ["mobilenetv2", "vgg16"]:
+        preprocessed = Backbones.get_preprocessing(backbone_name)(
+            image.astype("float32")
+        )
+        assert np.array_equal(
+            invert_preprocessing(np.asarray(preprocessed), backbone_name),
+            image,
+        )
+
+
+def test_raw_dataset_parses_batches_of_records(tmp_path):
+    import argparse
+
+    import cv2
+
+    from psenet import config
+    from psenet.data.raw import RawDataset
+    from psenet.utils.build_raw_data import build_raw_example
+
+    rng = np.random.RandomState(0)
+    boxes_nums = [1, 3, 0]
+    with tf.io.TFRecordWriter(str(tmp_path / "shard.tfrecord")) as writer:
+        for boxes_num in boxes_nums:
+            image = rng.randint(0, 256, [64, 96, 3]).astype("uint8")
+            bboxes = list(rng.uniform(size=boxes_num * config.BBOX_SIZE))
+            example = build_raw_example(
+                cv2.imencode(".png", image)[1].tobytes(),
+                ["text"] * boxes_num,
+                "image.png",
+                64,
+                96,
+                bboxes,
+            )
+            writer.write(example.SerializeToString())
+
+    params = argparse.Namespace(
+        backbone_name=config.BACKBONE_NAME,
+        batch_size=2,
+        dataset_dir=str(tmp_path),
+        input_context=None,
+        kernel_num=3,
+        min_scale=config.MIN_SCALE,
+        num_readers=1,
+        prefetch=1,
+        resize_length=128,
+        should_augment=False,
+        should_repeat=False,
+        should_shuffle=False,
+    )
+    dataset = RawDataset(params)
+    samples = (
+        tf.data.TFRecordDataset(str(tmp_path / "shard.tfrecord"))
+        .batch(params.batch_size)
+        .map(dataset._parse_batch)
+        .flat_map(tf.data.Dataset.from_tensor_slices)
+        .map(dataset._decode_example)
+    )
+    for boxes_num, sample in zip(boxes_nums, samples):
+        assert sample[config.BBOXES].shape == [boxes_num, config.BBOX_SIZE]
+        assert sample[config.IMAGE].shape == [64, 96, 3]
+
+
+def test_draw_labels_matches_opencv_on_rectangles():
+    import cv2
+
+    from psenet.data import preprocess
+    from psenet.data.rasterize import draw_labels
+
+    height, width, kernel_num, min_scale = 64, 96, 4, 0.4
+    bboxes = np.array(
+        [
+            [0.1, 0.2, 0.6, 0.2, 0.6, 0.5, 0.1, 0.5],
+            # Counter-clockwise.
+            [0.7, 0.9, 0.9, 0.9, 0.9, 0.1, 0.7, 0.1],
+        ]
+    )
+    polygons = np.reshape(bboxes * ([width, height] * 4), [-1, 4, 2])
+    polygons = polygons.astype("int32")
+    text = np.zeros([height, width], dtype="uint8")
+    cv2.drawContours(text, list(polygons), -1, 1, -1)
+    mask = np.ones([height, width], dtype="uint8")
+    cv2.drawContours(mask, [polygons[1]], -1, 0, -1)
+    kernels = np.zeros([kernel_num - 1, height, width], dtype="uint8")
+    for i in range(1, kernel_num):
+        rate = 1.0 - (1.0 - min_scale) / (kernel_num - 1) * i
+        for polygon in polygons:
+            kernel_polygon = preprocess.shrink([polygon], rate)[0]
+            cv2.drawContours(
+                kernels[i - 1], [kernel_polygon.astype("int32")], -1, 1, -1
+            )
+
+    drawn = draw_labels(bboxes, "10", height, width, kernel_num, min_scale)
+    for expected, actual in zip([kernels, text, mask], drawn):
+        assert np.array_equal(actual.numpy(), expected)
+
+
+def test_shrink_scales_moves_edges_inwards():
+    from psenet.data import preprocess
+
+    rectangle = [[10, 10], [110, 10], [110, 50], [10, 50]]
+    line = [[10, 10], [110, 10], [110, 12], [10, 12]]
+    rates = [1.0, 0.7, 0.4]
+    shrinked_bboxes = preprocess.shrink_scales(
+        np.array([rectangle, line]), rates
+    )
+    for rate, (shrinked_rectangle, _) in zip(rates, shrinked_bboxes):
+        # area * (1 - rate^2) / perimeter, rounded.
+        offset = int(4000 * (1 - rate**2) / 280.001 + 0.5)
+        assert len(shrinked_rectangle) == 4
+        assert np.array_equal(
+            np.min(shrinked_rectangle, axis=0), [10 + offset, 10 + offset]
+        )
+        assert np.array_equal(
+            np.max(shrinked_rectangle, axis=0), [110 - offset, 50 - offset]
+        )
+    # The line would vanish, so it stays whole.
+    assert np.array_equal(shrinked_bboxes[-1][1], line)
+    shrinked = preprocess.shrink(np.array([rectangle, line]), 0.4)
+    assert shrinked.shape == (2, 4, 2)
+
+
+def test_label_cache_stops_when_full_and_trims_when_reopened(tmp_path):
+    import os
+
+    from psenet.data.cache import LabelCache
+
+    maps = np.random.RandomState(0).randint(0, 2, [3, 4, 5, 6]) * 255
+    maps = maps.astype("uint8")
+    # Every entry takes 15 bytes.
+    cache = LabelCache(str(tmp_path), max_bytes=30)
+    cached_maps, is_cached = cache.load("first", [4, 5, 6])
+    assert not is_cached
+    for key, key_maps in zip(["first", "second", "third"], maps):
+        stored_maps = cache.store(key, key_maps)
+        assert np.array_equal(stored_maps, key_maps)
+    # The cache is full, so the third entry is not stored.
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "first.bits",
+        "second.bits",
+    ]
+    cached_maps, is_cached = cache.load("first", [4, 5, 6])
+    assert is_cached
+    assert np.array_equal(cached_maps, maps[0] > 0)
+    assert not cache.load("third", [4, 5, 6])[1]
+
+    # Reopened, it keeps the most recently written entries.
+    os.utime(tmp_path / "first.bits", (1, 1))
+    os.utime(tmp_path / "second.bits", (0, 0))
+    reopened = LabelCache(str(tmp_path), max_bytes=15)
+    assert [path.name for path in tmp_path.iterdir()] == ["first.bits"]
+    assert reopened.load("first", [4, 5, 6])[1]
+
+
+def test_raw_labels_are_cached_once_per_sample(tmp_path):
+    import argparse
+
+    import cv2
+
+    from psenet import config
+    from psenet.data import rasterize
+    from psenet.data.raw import RawDataset
+    from psenet.utils.build_raw_data import build_raw_example
+
+    rng = np.random.RandomState(0)
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    with tf.io.TFRecordWriter(str(data_dir / "shard.tfrecord")) as writer:
+        for _ in range(3):
+            image = rng.randint(0, 256, [64, 96, 3]).astype("uint8")
+            bboxes = [0.1, 0.1, 0.6, 0.1, 0.6, 0.5, 0.1, 0.5]
+            # The records share a file name, but not an id.
+            example = build_raw_example(
+                cv2.imencode(".png", image)[1].tobytes(),
+                ["text"],
+                "",
+                64,
+                96,
+                bboxes,
+            )
+            writer.write(example.SerializeToString())
+
+    params = argparse.Namespace(
+        backbone_name=config.BACKBONE_NAME,
+        batch_size=2,
+        dataset_dir=str(data_dir),
+        input_context=None,
+        kernel_num=3,
+        label_cache_dir=str(tmp_path / "cache"),
+        min_scale=config.MIN_SCALE,
+        num_readers=1,
+        prefetch=1,
+        resize_length=128,
+        should_augment=True,
+        should_repeat=False,
+        should_shuffle=False,
+    )
+    dataset = RawDataset(params)
+    samples = (
+        tf.data.TFRecordDataset(str(data_dir / "shard.tfrecord"))
+        .batch(params.batch_size)
+        .map(dataset._parse_batch)
+        .flat_map(tf.data.Dataset.from_tensor_slices)
+        .map(dataset._decode_example)
+    )
+    for epoch in range(2):
+        for sample in samples:
+            dataset._preprocess_example(sample)
+        assert len(list((tmp_path / "cache").iterdir())) == 3
+
+    for sample in samples:
+        key = dataset._label_key(sample[config.IMAGE_ID], 64, 96)
+        cached_maps, is_cached = dataset.label_cache.load(key, [4, 64, 96])
+        gt_kernels, gt_text, mask = rasterize.draw_labels(
+            sample[config.BBOXES], sample[config.TAGS], 64, 96, 3, 0.4
+        )
+        assert is_cached
+        assert np.array_equal(cached_maps[:2], gt_kernels > 0)
+        assert np.array_equal(cached_maps[2], gt_text > 0)
+        assert np.array_equal(cached_maps[3], mask > 0)
+
+
+def test_random_rotate_turns_all_images_together():
+    import cv2
+
+    from psenet.data import preprocess
+
+    tf.random.set_seed(0)
+    text = np.zeros([61, 90], dtype="uint8")
+    text[20:40, 10:70] = 1
+    image = np.stack([text * 255] * 3, axis=-1)
+    rotated_image, rotated_text = preprocess.random_rotate(
+        [tf.constant(image), tf.constant(text)], prob=1.0
+    )
+    assert rotated_image.shape == image.shape
+    assert rotated_text.shape == text.shape
+    assert not np.array_equal(rotated_text.numpy(), text)
+    for channel in range(3):
+        assert np.array_equal(
+            rotated_image.numpy()[..., channel], rotated_text.numpy() * 255
+        )
+
+    rotation = cv2.getRotationMatrix2D((45, 30.5), 7, 1)
+    expected = cv2.warpAffine(
+        text, rotation, (90, 61), flags=cv2.INTER_NEAREST
+    )
+    actual = preprocess.rotate(tf.constant(text[..., np.newaxis]), 7.0)
+    # Pixel centers on a rounding boundary may go either way.
+    assert np.mean(actual.numpy()[..., 0] != expected) < 0.01
+
+
+def test_bucketed_batches_hold_one_shape():
+    from psenet import config
+    from psenet.data import batching
+
+    sides = [(64, 32), (32, 64), (64, 32), (32, 64), (64, 32), (96, 96)]
+    samples = tf.data.Dataset.from_generator(
+        lambda: (
+            ({config.IMAGE: np.zeros([height, width, 3], "float32")}, 0)
+            for height, width in sides
+        ),
+        output_signature=(
+            {config.IMAGE: tf.TensorSpec([None, None, 3], tf.float32)},
+            tf.TensorSpec([], tf.int32),
+        ),
+    )
+    padded_shapes = ({config.IMAGE: [None, None, 3]}, [])
+    padded = batching.batch(
+        samples, 2, padded_shapes, batching.image_shape, bucket=False
+    )
+    assert [inputs[config.IMAGE].shape[:3] for inputs, _ in padded] == [
+        [2, 64, 64],
+        [2, 64, 64],
+        [2, 96, 96],
+    ]
+    bucketed = batching.batch(
+        samples, 2, padded_shapes, batching.image_shape, bucket=True
+    )
+    assert sorted(
+        inputs[config.IMAGE].shape[:3].as_list() for inputs, _ in bucketed
+    ) == [[1, 64, 32], [1, 96, 96], [2, 32, 64], [2, 64, 32]]
+
+
+def test_pad_or_crop_makes_static_squares():
+    from psenet.data import preprocess
+
+    image = tf.ones([20, 40, 3])
+    mask = tf.ones([20, 40])
+    padded_image, padded_mask = preprocess.pad_or_crop([image, mask], size=32)
+    assert padded_image.shape == [32, 32, 3]
+    assert padded_mask.shape == [32, 32]
+    assert np.array_equal(padded_mask.numpy()[:20], np.ones([20, 32]))
+    assert not np.any(padded_mask.numpy()[20:])
+    assert not np.any(padded_image.numpy()[20:])
+
+
+@pytest.mark.parametrize("extension", [".jpg", ".png"])
+def test_read_image_size_from_the_header(extension):
+    import cv2
+
+    from psenet.utils.readers import read_image_size
+
+    image = np.zeros([37, 91, 3], dtype="uint8")
+    image_data = cv2.imencode(extension, image)[1].tobytes()
+    assert read_image_size(image_data) == (37, 91)
+    with pytest.raises(ValueError):
+        read_image_size(image_data[:8])
+    # Cut in the middle of the JPEG frame or the PNG header.
+    header = image_data.find(b"\xff\xc0") + 6 if extension == ".jpg" else 20
+    with pytest.raises(ValueError):
+        read_image_size(image_data[:header])
+
+
+def test_processed_fixed_crop_makes_static_batches(tmp_path):
+    import argparse
+
+    from psenet import config
+    from psenet.data.processed import ProcessedDataset
+    from psenet.utils.build_processed_data import encode_processed_example
+
+    rng = np.random.RandomState(0)
+    with tf.io.TFRecordWriter(str(tmp_path / "shard.tfrecord")) as writer:
+        for height, width in [(96, 64), (32, 48), (64, 64)]:
+            image = rng.randint(0, 256, [height, width, 3]).astype("uint8")
+            mask = np.ones([height, width], "uint8")
+            label = rng.randint(0, 2, [height, width, 3]).astype("uint8")
+            example = encode_processed_example(image, mask, label)
+            writer.write(example.SerializeToString())
+
+    params = argparse.Namespace(
+        backbone_name=config.BACKBONE_NAME,
+        batch_size=3,
+        dataset_dir=str(tmp_path),
+        fixed_crop=True,
+        input_context=None,
+        kernel_num=3,
+        num_readers=1,
+        prefetch=1,
+        resize_length=96,
+        should_repeat=False,
+        should_shuffle=False,
+    )
+    dataset = ProcessedDataset(params, version=2).build()
+    inputs_spec, labels_spec = dataset.element_spec
+    assert inputs_spec[config.IMAGE].shape == [3, 48, 48, 3]
+    assert labels_spec.shape == [3, 48, 48, 4]
+    ((inputs, labels),) = list(dataset)
+    # The mask, in the first channel, is zero over the padding.
+    assert np.all(labels.numpy()[1, :32, :48, 0] == 1)
+    assert not np.any(labels.numpy()[1, 32:, :, 0])
+
+
+def test_raw_fixed_crop_masks_the_padding_for_training_only(tmp_path):
+    import argparse
+
+    import cv2
+
+    from psenet import config
+    from psenet.data.raw import RawDataset
+    from psenet.utils.build_raw_data import build_raw_example
+
+    image = np.zeros([32, 48, 3], dtype="uint8")
+    example = build_raw_example(
+        cv2.imencode(".png", image)[1].tobytes(),
+        ["text"],
+        "image.png",
+        32,
+        48,
+        [0.1, 0.1, 0.6, 0.1, 0.6, 0.5, 0.1, 0.5],
+    )
+    with tf.io.TFRecordWriter(str(tmp_path / "shard.tfrecord")) as writer:
+        writer.write(example.SerializeToString())
+
+    params = argparse.Namespace(
+        backbone_name=config.BACKBONE_NAME,
+        batch_size=1,
+        dataset_dir=str(tmp_path),
+        fixed_crop=True,
+        input_context=None,
+        is_training=True,
+        kernel_num=3,
+        min_scale=config.MIN_SCALE,
+        num_readers=1,
+        prefetch=1,
+        resize_length=128,
+        should_augment=False,
+        should_repeat=False,
+        should_shuffle=False,
+    )
+    # The image is scaled to 32 by 64 pixels and padded to 64 by 64.
+    ((inputs, labels),) = list(RawDataset(params).build())
+    assert labels.shape == [1, 64, 64, 4]
+    assert np.all(labels.numpy()[0, :32, :, 0] == 1)
+    assert not np.any(labels.numpy()[0, 32:, :, 0])
+    assert np.array_equal(inputs[config.MASK], labels[..., 0])
+
+    params.is_training = False
+    ((inputs, labels),) = list(RawDataset(params).build())
+    assert inputs[config.IMAGE].shape == [1, 32, 64, 3]
+    assert labels.shape == [1, 32, 64, 4]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+
+def test_ohem_batch_matches_ohem_single():
+    from psenet.losses import ohem_batch
+    from psenet.losses import ohem_single
+
+    rng = np.random.RandomState(0)
+    labels = (rng.uniform(size=[5, 24, 32]) < 0.1).astype("float32")
+    # No texts, only texts, and texts all masked out.
+    labels[1] = 0
+    labels[2] = 1
+    masks = (rng.uniform(size=[5, 24, 32]) < 0.9).astype("float32")
+    masks[3][labels[3] > 0.5] = 0
+    predictions = rng.normal(size=[5, 24, 32]).astype("float32")
+
+    expected = [
+        ohem_single(labels[i], predictions[i], masks[i]).numpy()
+        for i in range(len(labels))
+    ]
+    actual = ohem_batch(labels, predictions, masks).numpy()
+    assert np.array_equal(actual, np.stack(expected))
+
+
+def test_kth_largest_matches_sorting():
+    from psenet.losses import kth_largest
+
+    rng = np.random.RandomState(0)
+    scores = rng.normal(size=[4, 100]).astype("float32")
+    scores[1, :50] = -scores[1, 50:]
+    scores[2] = 0
+    k = np.array([1, 60, 37, 100])
+    expected = [np.sort(row)[::-1][i - 1] for row, i in zip(scores, k)]
+    assert np.array_equal(kth_largest(scores, k).numpy(), expected)
+
+
+def test_dice_loss_of_channels_matches_every_channel():
+    from psenet.losses import dice_loss
+
+    rng = np.random.RandomState(0)
+    labels = (rng.uniform(size=[3, 8, 10, 4]) < 0.3).astype("float32")
+    predictions = rng.normal(size=[3, 8, 10, 4]).astype("float32")
+    masks = (rng.uniform(size=[3, 8, 10, 4]) < 0.8).astype("float32")
+
+    losses = dice_loss(labels, predictions, masks).numpy()
+    assert losses.shape == (4,)
+    for channel in range(4):
+        np.testing.assert_allclose(
+            losses[channel],
+            dice_loss(
+                labels[..., channel],
+                predictions[..., channel],
+                masks[..., channel],
+            ).numpy(),
+            rtol=1e-6,
+        )
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+
+def test_metrics_accumulate_pixel_counts():
+    from psenet import config
+    from psenet.metrics import ConfusionMatrices
+    from psenet.metrics import keras_psenet_metrics
+
+    rng = np.random.RandomState(0)
+    y_true = (rng.uniform(size=[4, 8, 8, 4]) < 0.6).astype("float32")
+    y_pred = rng.normal(size=[4, 8, 8, 3]).astype("float32")
+
+    whole = ConfusionMatrices()
+    whole.update_state(y_true, y_pred)
+    counts = whole.counts.numpy()
+    texts = y_true[..., 0] * y_true[..., 1]
+    assert counts[0].sum() == texts.size
+    assert counts[0, 1].sum() == texts.sum()
+
+    metrics = keras_psenet_metrics()
+    assert len(metrics) == 14
+    for batch in [slice(0, 1), slice(1, 4)]:
+        for metric in metrics:
+            metric.update_state(y_true[batch], y_pred[batch])
+    expected = whole.result()
+    for metric in metrics:
+        np.testing.assert_allclose(
+            metric.result().numpy(), expected[metric.name], rtol=1e-6
+        )
+
+    for metric in metrics:
+        metric.reset_state()
+    assert not np.any(metrics[0].matrices.counts.numpy())
+    assert metrics[0].name == "{}/overall_accuracy".format(
+        config.KERNEL_METRICS
+    )
@@ -0,0 +1,105 @@
+import argparse
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+
+def test_optimizer_scales_the_float16_loss_only():
+    from psenet.optimizers import build_optimizer
+
+    params = argparse.Namespace(
+        learning_rate=1e-3, decay_steps=10, decay_rate=0.1
+    )
+    for mixed_precision, is_scaled in [
+        (None, False),
+        ("bfloat16", False),
+        ("float16", True),
+    ]:
+        params.mixed_precision = mixed_precision
+        optimizer = build_optimizer(params)
+        assert is_scaled == isinstance(
+            optimizer, tf.keras.mixed_precision.LossScaleOptimizer
+        )
+
+
+def test_bfloat16_training_converges():
+    from psenet import config
+    from psenet.losses import psenet_loss
+    from psenet.model import build_model
+    from psenet.optimizers import build_optimizer
+
+    rng = np.random.RandomState(0)
+    images = rng.normal(size=[4, 64, 64, 3]).astype("float32")
+    # The mask, the texts and their kernels.
+    labels = np.zeros([4, 64, 64, 3], dtype="float32")
+    labels[..., 0] = 1
+    for image, label in zip(images, labels):
+        top, left = rng.randint(0, 32, 2)
+        image[top : top + 24, left : left + 24] += 2
+        label[top : top + 24, left : left + 24, 1] = 1
+        label[top + 4 : top + 20, left + 4 : left + 20, 2] = 1
+
+    params = argparse.Namespace(
+        backbone_name="mobilenetv2",
+        decay_rate=0.1,
+        decay_steps=1000,
+        encoder_weights=None,
+        fixed_crop=True,
+        kernel_num=2,
+        learning_rate=1e-2,
+        mixed_precision="bfloat16",
+        resize_length=128,
+    )
+    tf.keras.mixed_precision.set_global_policy("mixed_bfloat16")
+    try:
+        model = build_model(params)
+        model.compile(loss=psenet_loss, optimizer=build_optimizer(params))
+        history = model.fit(
+            {config.IMAGE: images}, labels, epochs=20, verbose=0
+        )
+    finally:
+        tf.keras.mixed_precision.set_global_policy("float32")
+
+    assert model.layers[1].compute_dtype == "bfloat16"
+    assert model.outputs[0].dtype == "float32"
+    losses = history.history["loss"]
+    assert np.all(np.isfinite(losses))
+    assert losses[-1] < losses[0] / 4
+
+
+def test_xla_timing_runs_in_the_strategy_and_keeps_the_model():
+    from psenet import config
+    from psenet.losses import psenet_loss
+    from psenet.train import log_xla_speedup
+
+    rng = np.random.RandomState(0)
+    images = rng.normal(size=[2, 32, 32, 3]).astype("float32")
+    labels = (rng.uniform(size=[2, 32, 32, 3]) < 0.5).astype("float32")
+    data = tf.data.Dataset.from_tensor_slices(
+        ({config.IMAGE: images}, labels)
+    ).batch(2)
+    strategy = tf.distribute.MirroredStrategy(["/cpu:0"])
+    with strategy.scope():
+        inputs = tf.keras.Input(shape=[32, 32, 3], name=config.IMAGE)
+        kernels = tf.keras.layers.BatchNormalization()(
+            tf.keras.layers.Conv2D(2, 3, padding="same")(inputs)
+        )
+        model = tf.keras.Model(
+            inputs={config.IMAGE: inputs}, outputs={config.KERNELS: kernels}
+        )
+        model.compile(
+            loss=psenet_loss,
+            optimizer=tf.keras.optimizers.SGD(0.1),
+            jit_compile=True,
+        )
+        weights = model.get_weights()
+        log_xla_speedup(model, data, steps=1)
+        assert all(
+            np.array_equal(value, weight)
+            for value, weight in zip(model.get_weights(), weights)
+        )
+        assert model.jit_compile
+        history = model.fit(data, epochs=1, verbose=0)
+    assert np.isfinite(history.history["loss"][0])
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from psenet import config
+
+tf = pytest.importorskip("tensorflow")
+
+
+def build_thresholding_model(kernel_num=3):
+    # Every kernel is the first image channel, so bright pixels are text.
+    images = tf.keras.Input(shape=[None, None, 3], name=config.IMAGE)
+    kernels = tf.keras.layers.Lambda(
+        lambda images: tf.tile(images[..., :1], [1, 1, 1, kernel_num])
+    )(images)
+    return tf.keras.Model(
+        inputs={config.IMAGE: images}, outputs={config.KERNELS: kernels}
+    )
+
+
+def test_predictor_batches_images_of_any_size():
+    from psenet.predict import Predictor
+
+    images = []
+    for height, width in [(100, 200), (90, 210), (400, 300), (33, 33)]:
+        image = np.zeros([height, width, 3], dtype="uint8")
+        image[height // 4 : height // 2, width // 4 : width // 2] = 255
+        images.append(image)
+
+    model = build_thresholding_model()
+    batched = Predictor(model=model, batch_size=4, min_area=1)
+    single = Predictor(model=model, batch_size=1, min_area=1, bucket_step=32)
+    for image, prediction, expected in zip(
+        images, batched.predict(images), single.predict(images)
+    ):
+        labels = prediction[config.LABELS]
+        assert labels.shape == image.shape[:2]
+        assert np.array_equal(labels, expected[config.LABELS])
+        assert np.unique(labels).tolist() == [0, 1]
+        assert prediction[config.TEXT].shape == image.shape[:2]
+
+
+def test_exported_model_runs_pse_in_graph(tmp_path):
+    from psenet.pse import graph
+    from psenet.serve import add_postprocessing
+    from psenet.serve import export
+
+    image = np.zeros([1, 32, 48, 3], dtype="float32")
+    image[0, 4:12, 4:20] = 1
+    image[0, 20:28, 30:44] = 1
+    model = add_postprocessing(build_thresholding_model(), min_area=1)
+    export(model, str(tmp_path / "saved_model"))
+
+    reloaded = tf.saved_model.load(str(tmp_path / "saved_model"))
+    outputs = reloaded.serve({config.IMAGE: tf.constant(image)})
+    labels = outputs[config.LABELS].numpy()
+    expected = graph.pse_batch(
+        graph.kernels_from_logits(tf.tile(image[..., :1], [1, 1, 1, 3])), 1
+    )
+    assert np.array_equal(labels, expected)
+    assert np.unique(labels).tolist() == [0, 1, 2]
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from psenet import pse
+from psenet.pse import fallback
+
+
+def random_kernels(rng, kernel_num, height, width):
+    scores = rng.rand(height, width)
+    thresholds = np.linspace(0.3, 0.8, kernel_num)
+    return np.stack([scores > t for t in thresholds]).astype("uint8")
+
+
+def test_pse_grows_kernels_first_come():
+    kernels = np.zeros([2, 1, 7], dtype="uint8")
+    kernels[0] = 1
+    kernels[1, 0, [1, 5]] = 1
+    labels = pse.pse(kernels, 0)
+    assert labels.dtype == np.int32
+    assert labels.tolist() == [[1, 1, 1, 1, 2, 2, 2]]
+
+
+def test_pse_drops_small_seeds_and_reuses_out():
+    kernels = np.zeros([2, 4, 4], dtype="uint8")
+    kernels[0] = 1
+    kernels[1, 0, 0] = 1
+    kernels[1, 2:, 2:] = 1
+    out = np.full([4, 4], -1, dtype="int32")
+    labels = pse.pse_uint8(kernels.astype(bool), 2, out=out)
+    assert labels is out
+    assert set(np.unique(labels)) == {2}
+
+
+def test_pse_batch_matches_single_images():
+    rng = np.random.RandomState(0)
+    batch = np.stack([random_kernels(rng, 3, 17, 23) for _ in range(4)])
+    expected = np.stack([pse.pse_uint8(kernels, 1) for kernels in batch])
+    assert np.array_equal(pse.pse_batch(batch, 1, num_threads=2), expected)
+
+
+@pytest.mark.skipif(not pse.NATIVE, reason="the extension is not built")
+def test_native_pse_matches_fallback():
+    rng = np.random.RandomState(0)
+    for height, width in [(31, 29), (1, 29), (31, 1)]:
+        for _ in range(50):
+            kernels = random_kernels(rng, rng.randint(1, 8), height, width)
+            assert np.array_equal(
+                pse.pse_uint8(kernels, 3), fallback.pse(kernels, 3)
+            )
+
+
+def test_pse_matches_the_opencv_baseline():
+    pytest.importorskip("cv2")
+    from psenet.bench.expansion import baseline_pse
+
+    rng = np.random.RandomState(1)
+    for height, width in [(31, 29), (2, 29), (31, 1)]:
+        for _ in range(30):
+            kernel_num = rng.randint(1, 8)
+            nested = random_kernels(rng, kernel_num, height, width)
+            # Kernels that do not nest make the seeds race for pixels.
+            loose = (rng.rand(kernel_num, height, width) < 0.5).astype("uint8")
+            for kernels in [nested, loose]:
+                for min_area in [0, 1, 3, 6]:
+                    expected = baseline_pse(kernels, min_area)
+                    assert np.array_equal(
+                        pse.pse_uint8(kernels, min_area), expected
+                    )
+                    assert np.array_equal(
+                        fallback.pse(kernels, min_area), expected
+                    )
+
+
+def same_outline(polygon, other):
+    """Whether two closed outlines have the same points in cyclic order,
+    from any start and in either direction."""
+    polygon = np.asarray(polygon, dtype="float32")
+    other = np.asarray(other, dtype="float32")
+    if polygon.shape != other.shape:
+        return False
+    for outline in [other, other[::-1]]:
+        for shift in range(len(outline)):
+            if np.allclose(
+                polygon, np.roll(outline, shift, axis=0), atol=1e-3
+            ):
+                return True
+    return False
+
+
+@pytest.mark.skipif(not pse.NATIVE, reason="the extension is not built")
+def test_native_extract_instances_matches_fallback():
+    import cv2
+
+    labels = np.zeros([60, 60], dtype="int32")
+    cv2.fillPoly(
+        labels, [np.array([[30, 5], [50, 25], [30, 45], [10, 25]])], 1
+    )
+    labels[48:58, 2:30] = 2
+    labels[40:58, 2:8] = 2
+    # Too small.
+    labels[50:52, 40:42] = 3
+    # Too unlikely.
+    labels[2:10, 45:58] = 4
+    scores = np.random.RandomState(0).uniform(0.5, 1, [60, 60])
+    scores[labels == 4] = 0.1
+    for mode in ["rect", "contour"]:
+        instances = pse.extract_instances(labels, scores, 5, 0.3, mode)
+        expected = fallback.extract_instances(labels, scores, 5, 0.3, mode)
+        assert instances["labels"].tolist() == [1, 2]
+        assert np.array_equal(instances["labels"], expected["labels"])
+        assert np.array_equal(instances["areas"], expected["areas"])
+        assert np.allclose(instances["scores"], expected["scores"])
+        assert np.array_equal(instances["bboxes"], expected["bboxes"])
+        assert len(instances["polygons"]) == len(expected["polygons"])
+        for polygon, expected_polygon in zip(
+            instances["polygons"], expected["polygons"]
+        ):
+            assert same_outline(polygon, expected_polygon)
+
+
+def test_merge_quadrangle_n9():
+    nms = pytest.importorskip("psenet.pse.nms")
+    quad = np.array([0, 0, 0, 1, 1, 1, 1, 0, 1], dtype="float32")
+    merged = nms.merge_quadrangle_n9(np.array([quad, quad + 0.1, quad + 2]))
+    assert merged.shape == (2, 9)
+    assert np.allclose(merged[0], quad + 2)
+
+
+def test_graph_connected_components_match_scipy():
+    tf = pytest.importorskip("tensorflow")
+    from scipy import ndimage
+
+    from psenet.pse import graph
+
+    rng = np.random.RandomState(0)
+    for height, width in [(31, 29), (1, 29), (31, 1)]:
+        mask = rng.rand(height, width) > 0.4
+        labels = graph.connected_components(tf.constant(mask))
+        assert np.array_equal(labels.numpy(), ndimage.label(mask)[0])
+
+
+def test_graph_pse_grows_kernels_first_come():
+    tf = pytest.importorskip("tensorflow")
+    from psenet.pse import graph
+
+    kernels = np.zeros([3, 4, 7], dtype="uint8")
+    kernels[0] = 1
+    kernels[1, 1:3, 1:6] = 1
+    kernels[2, 1:3, [1, 5]] = 1
+    kernels[2, 3, 0] = 1
+    labels = graph.pse(tf.constant(kernels), 2).numpy()
+    assert np.array_equal(labels, pse.pse_uint8(kernels, 2))
+    assert labels.tolist()[1] == [1, 1, 1, 1, 2, 2, 2]